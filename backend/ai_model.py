@@ -1,11 +1,24 @@
 # backend/ai_model.py（修正版・完全版）
 
+import asyncio
 import json
 import os
 import re
+import unicodedata
 from typing import Any
 import logging
-from inference_manager import get_inference_manager
+from config import get_model_fingerprint, get_model_path
+from inference_manager import ModelNotReadyError, get_inference_manager
+from json_grammar import schema_to_gbnf
+from lexicon import lexicon
+import metrics
+from model_registry import ModelBudgetError, UnknownModelError
+from prompt_builder import PromptTemplate, TemplatePrompt
+from result_cache import make_cache_key, result_cache
+from scheduler import QueueFullError
+from schemas import OutputData
+from semantic_cache import semantic_cache
+from singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +26,106 @@ logger = logging.getLogger(__name__)
 # 設定（環境変数で上書き可）
 # =========================
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+# 出力をJSON文法で制約する（0で無効化）
+GRAMMAR_CONSTRAINED = os.getenv("GRAMMAR_CONSTRAINED", "1") == "1"
+# 起動時のウォームアップ推論（0で無効化）
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_TEXT = os.getenv("WARMUP_TEXT", "今日はいい天気ですね。")
+# 判定方式: llm（常にLLM） / fast（辞書のみ） / hybrid（辞書で確信できない場合のみLLM）
+ADVICE_MODE = os.getenv("ADVICE_MODE", "llm")
+# hybrid モードで辞書の判定を採用する確からしさの下限（一致がない入力は lexicon.CLEAN_CONFIDENCE）
+LEXICON_CONFIDENCE_THRESHOLD = float(os.getenv("LEXICON_CONFIDENCE_THRESHOLD", "0.85"))
+# 全コンテキストが再読み込み中の間、辞書に一致した入力は辞書判定で応答する
+# （1で有効。一致しない入力と無効時は、再読み込みが終わるまで古いインスタンスで推論する）
+DEGRADED_LEXICON_FALLBACK = os.getenv("DEGRADED_LEXICON_FALLBACK", "0") == "1"
+
+# =========================
+# プロンプトテンプレート
+# =========================
+# システムプロンプトを変更したら必ず上げる（KVキャッシュ等のキーに使用）
+PROMPT_VERSION = "2"
+
+SYSTEM_PROMPT = """あなたは「マイナスワード検出アシスタント」です。
+
+# マイナスワードの定義
+相手の自尊心ややる気を下げる可能性のあるグレーな表現を検出してください。
+
+## 検出対象(5カテゴリ)
+1. 否定の決めつけ: 「どうせ無理」「私なんて」
+2. 比較による圧力: 「みんなはできるのに」「普通は〜」
+3. 皮肉・嫌味: 「へー、すごいね」「さすがですね」
+4. 強制・圧力: 「〜すべき」「〜しなければ」
+5. 過去の否定: 「前もダメだった」「いつも失敗」
+
+※ 露骨な罵倒語（バカ、死ね等）も検出対象に含めます。
+
+## 抽出ルール
+- フレーズ単位で抽出(意味のある塊)
+- 同じ意味の言い換えは1つにまとめる
+- 重複は除く
+- 最大10個まで
+
+# 出力形式
+{
+  "minus_words": ["抽出された表現1", "抽出された表現2"],
+  "advice": "120文字以内のマイナスワードに対しての言動の改善アドバイス"
+}
+
+# アドバイスの作成ルール
+- まず相手の辛い気持ちに共感する
+- 責めたり診断したりしない
+- 「〜しましょう」より「〜してみませんか？」という提案形
+- 具体的な行動提案を含める
+- 罵倒語が含まれる場合は、優しく諭すトーンで
+
+# 重要
+- JSON以外は出力しない
+- マイナスワードなし → minus_words は []
+- 必ず日本語で応答
+
+# 例
+
+## 例1: 複数パターン
+入力: "みんなはできるのに、私だけできない。前回も失敗した。"
+出力:
+{
+  "minus_words": ["みんなはできるのに、私だけできない", "前回も失敗した"],
+  "advice": "周りと比べて焦る気持ち、よく分かります。前回の経験は次に活きますよ。まずは今日できた小さなことを1つ振り返ってみませんか？あなたのペースで大丈夫です。"
+}
+
+## 例2: マイナスワードなし
+入力: "今日はいい天気ですね。"
+出力:
+{
+  "minus_words": [],
+  "advice": "前向きな気持ちが伝わってきます。その調子で自分のペースを大切にしてくださいね。"
+}
+"""
+
+# Gemma2用のプロンプト形式（ユーザー入力より前の固定部分）
+# 全リクエストで共通のため、KV状態をキャッシュして再利用する
+PROMPT_PREFIX = f"""<start_of_turn>system
+{SYSTEM_PROMPT}<end_of_turn>
+<start_of_turn>user
+"""
+
+# マイナスワード検出用のテンプレート
+# 固定部分はモデルごとに一度だけトークン化され、リクエストごとには入力文だけをトークン化する
+ADVICE_PROMPT_TEMPLATE = PromptTemplate(
+    name="advice",
+    prefix=PROMPT_PREFIX,
+    before_input="""次の文章を解析し、マイナスワードを抽出してJSON形式で返してください。
+
+入力文:
+""",
+    after_input="""
+
+JSON形式で返してください。<end_of_turn>
+<start_of_turn>model
+""",
+    version=PROMPT_VERSION,
+)
+
 
 # =========================
 # 正規化関数
@@ -113,175 +226,642 @@ async def generate_ai_response(prompt: str, temperature: float = 0.7, max_tokens
 # =========================
 # マイナスワード検出＋アドバイス生成
 # =========================
-async def generate_advice(inputed_text: str) -> dict[str, Any]:
+# フォールバック時のアドバイス文
+PARSE_ERROR_ADVICE = "申し訳ありません、うまく解析できませんでした。別の表現でもう一度試してみてください。"
+TIMEOUT_ADVICE = "申し訳ありません、処理に時間がかかりすぎました。少し時間を置いてもう一度お試しください。"
+SYSTEM_ERROR_ADVICE = "申し訳ありません、一時的なエラーが発生しました。少し時間を置いてもう一度お試しください。"
+BUSY_ADVICE = "申し訳ありません、ただいま混み合っています。少し時間を置いてもう一度お試しください。"
+
+# adviceの最大文字数（プロンプトでは120文字を指示、余裕を持たせる）
+MAX_ADVICE_LEN = 130
+
+# マイナスワード検出の推論パラメータ
+ADVICE_GENERATION_PARAMS = {
+    "max_tokens": 300,  # バランス型: 日本語120文字+JSON構造+余裕
+    "temperature": 0.7,
+    "top_p": 0.9,
+}
+
+
+def build_output_schema() -> dict[str, Any]:
     """
-    llama.cpp を使ってマイナスワード検出とアドバイスを生成
+    OutputData のスキーマに生成時の上限を加えたJSON Schemaを作成
+
+    Returns:
+        dict: minus_words は最大10件・各50文字、advice は120文字までのスキーマ
+    """
+    schema = OutputData.model_json_schema()
+    properties = schema["properties"]
+    properties["minus_words"]["maxItems"] = 10
+    properties["minus_words"]["items"].update(minLength=1, maxLength=50)
+    properties["advice"].update(minLength=1, maxLength=120)
+    return schema
+
+
+# 出力文法（GBNF）: JSONが閉じた時点で生成が終了し、解析失敗が起きない
+ADVICE_OUTPUT_GRAMMAR = schema_to_gbnf(build_output_schema()) if GRAMMAR_CONSTRAINED else None
+
+
+def build_advice_prompt(inputed_text: str) -> TemplatePrompt:
+    """
+    マイナスワード検出用のプロンプトを組み立て
+
+    トークン化と長さの制限は推論ワーカーが行う（n_ctx と max_tokens から
+    入力文に使えるトークン数を求め、超える分は文単位で切り詰める）。
 
     Args:
         inputed_text: ユーザーの入力文章
 
     Returns:
-        dict: {"minus_words": ["ダメ", "無理"], "advice": "大丈夫です！"}
+        TemplatePrompt: Gemma2形式のテンプレートと入力文（render() で文字列化）
     """
-    
-    logger.info(f"マイナスワード検出開始: {inputed_text[:50]}...")
-
     # ===== セキュリティ対策: プロンプトインジェクション防止 =====
+    # （入力文は特殊トークンとして解釈せずにトークン化されるが、文字列化した場合にも備える）
     safe_input_text = inputed_text.replace("<start_of_turn>", "").replace("<end_of_turn>", "")
-    # 極端に長い入力の制限
-    if len(safe_input_text) > 500:
-        safe_input_text = safe_input_text[:500]
-        logger.warning(f"⚠️ 入力文が500文字を超えたためトリミングしました")
+    return TemplatePrompt(ADVICE_PROMPT_TEMPLATE, safe_input_text)
 
-    system_prompt = """あなたは「マイナスワード検出アシスタント」です。
 
-# マイナスワードの定義
-相手の自尊心ややる気を下げる可能性のあるグレーな表現を検出してください。
+def build_warmup_request() -> dict[str, Any] | None:
+    """
+    起動時のウォームアップ推論のパラメータを作成
 
-## 検出対象(5カテゴリ)
-1. 否定の決めつけ: 「どうせ無理」「私なんて」
-2. 比較による圧力: 「みんなはできるのに」「普通は〜」
-3. 皮肉・嫌味: 「へー、すごいね」「さすがですね」
-4. 強制・圧力: 「〜すべき」「〜しなければ」
-5. 過去の否定: 「前もダメだった」「いつも失敗」
+    実際のプロンプトテンプレート・文法・推論パラメータを使うため、
+    固定プレフィックスのKV状態の作成やページキャッシュの読み込みが済む。
 
-※ 露骨な罵倒語（バカ、死ね等）も検出対象に含めます。
+    Returns:
+        dict | None: InferenceManager.load() に渡すパラメータ（無効時は None）
+    """
+    if not WARMUP_ENABLED:
+        return None
 
-## 抽出ルール
-- フレーズ単位で抽出(意味のある塊)
-- 同じ意味の言い換えは1つにまとめる
-- 重複は除く
-- 最大10個まで
+    return {
+        "prompt": build_advice_prompt(WARMUP_TEXT),
+        "grammar": ADVICE_OUTPUT_GRAMMAR,
+        **ADVICE_GENERATION_PARAMS,
+    }
 
-# 出力形式
-{
-  "minus_words": ["抽出された表現1", "抽出された表現2"],
-  "advice": "120文字以内のマイナスワードに対しての言動の改善アドバイス"
-}
 
-# アドバイスの作成ルール
-- まず相手の辛い気持ちに共感する
-- 責めたり診断したりしない
-- 「〜しましょう」より「〜してみませんか？」という提案形
-- 具体的な行動提案を含める
-- 罵倒語が含まれる場合は、優しく諭すトーンで
+class AdviceParseError(ValueError):
+    """モデルの生成結果からJSONを解析できなかった"""
 
-# 重要
-- JSON以外は出力しない
-- マイナスワードなし → minus_words は []
-- 必ず日本語で応答
 
-# 例
+def parse_advice_result(result: str) -> dict[str, Any]:
+    """
+    モデルの生成結果からJSONを抽出・検証・正規化
 
-## 例1: 複数パターン
-入力: "みんなはできるのに、私だけできない。前回も失敗した。"
-出力:
-{
-  "minus_words": ["みんなはできるのに、私だけできない", "前回も失敗した"],
-  "advice": "周りと比べて焦る気持ち、よく分かります。前回の経験は次に活きますよ。まずは今日できた小さなことを1つ振り返ってみませんか？あなたのペースで大丈夫です。"
-}
+    Args:
+        result: モデルが生成したテキスト
 
-## 例2: マイナスワードなし
-入力: "今日はいい天気ですね。"
-出力:
-{
-  "minus_words": [],
-  "advice": "前向きな気持ちが伝わってきます。その調子で自分のペースを大切にしてくださいね。"
-}
-"""
+    Returns:
+        dict: {"minus_words": [...], "advice": "..."}
 
-    user_prompt = f"""次の文章を解析し、マイナスワードを抽出してJSON形式で返してください。
+    Raises:
+        AdviceParseError: 空の応答・JSONとして解析できない場合
+    """
+    if not result:
+        logger.warning("⚠️ 空の応答が返されました")
+        metrics.ADVICE_PARSE.inc(result="empty")
+        raise AdviceParseError("空の応答が返されました")
 
-入力文:
-{safe_input_text}
+    logger.debug(f"生成結果（raw）: {result[:200]}...")
 
-JSON形式で返してください。"""
+    # ===== JSON抽出ロジック(強化版) =====
+    # 1. { } で囲まれた部分を抽出
+    json_start = result.find('{')
+    json_end = result.rfind('}') + 1
 
-    # Gemma2用のプロンプト形式
-    prompt = f"""<start_of_turn>system
-{system_prompt}<end_of_turn>
-<start_of_turn>user
-{user_prompt}<end_of_turn>
-<start_of_turn>model
-"""
+    if json_start != -1 and json_end > json_start:
+        json_str = result[json_start:json_end]
+    else:
+        # フォールバック: Markdownクリーニング
+        json_str = re.sub(r'```json\n?', '', result)
+        json_str = re.sub(r'```\n?', '', json_str)
+        json_str = json_str.strip()
+
+    logger.debug(f"抽出されたJSON文字列: {json_str[:200]}...")
 
+    # ===== JSON検証とパース =====
     try:
-        # ===== 推論マネージャーで生成実行 =====
-        inference_manager = get_inference_manager()
-        
-        result = await inference_manager.generate(
-            prompt=prompt,
-            max_tokens=300,  # バランス型: 日本語120文字+JSON構造+余裕
-            temperature=0.7,
-            top_p=0.9,
-            timeout=int(REQUEST_TIMEOUT)
-        )
+        parsed = json.loads(json_str)
+
+        # advice の型と長さを検証
+        if not isinstance(parsed.get("advice"), str):
+            logger.warning("⚠️ adviceが文字列ではありません。デフォルト値を設定します。")
+            parsed["advice"] = PARSE_ERROR_ADVICE
+
+        # 文字数制限チェック(余裕を持たせる)
+        if len(parsed["advice"]) > MAX_ADVICE_LEN:
+            logger.warning(f"⚠️ adviceが長すぎます（{len(parsed['advice'])}文字）。トリミングします。")
+            parsed["advice"] = parsed["advice"][:MAX_ADVICE_LEN - 3] + "..."
+
+        # minus_words を正規化（★重要）
+        parsed["minus_words"] = normalize_minus_words(parsed.get("minus_words"))
+
+        logger.info(f"✅ マイナスワード検出完了: {len(parsed['minus_words'])}個")
+        metrics.ADVICE_PARSE.inc(result="ok")
+        return parsed
+
+    except (json.JSONDecodeError, ValueError, AttributeError) as e:
+        logger.error(f"❌ JSON parse error: {e}, Raw result: {result}")
+        metrics.ADVICE_PARSE.inc(result="error")
+        raise AdviceParseError(str(e)) from e
+
+
+# 同一入力の同時リクエスト（ダブルタップ・リトライ）を1回の推論にまとめる
+_advice_flight = SingleFlight("generate_advice")
+
+
+def normalize_input_text(text: str) -> str:
+    """
+    入力文の同一性判定用の正規化（NFKC + 空白の統一）
+
+    Args:
+        text: ユーザーの入力文章
+
+    Returns:
+        str: 正規化された文章
+    """
+    normalized = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+def resolve_with_lexicon(inputed_text: str, record: bool = True) -> dict[str, Any] | None:
+    """
+    ADVICE_MODE に応じて辞書で判定（LLMを使わずに応答できる場合のみ結果を返す）
+
+    Args:
+        inputed_text: ユーザーの入力文章
+        record: 統計に記録するか（事前確認のみの場合は False）
+
+    Returns:
+        dict | None: {"minus_words": [...], "advice": "..."}（LLMに委ねる場合は None）
+    """
+    if ADVICE_MODE == "llm":
+        return None
 
-        if not result:
-            logger.warning("⚠️ 空の応答が返されました")
-            return {
-                "minus_words": [],
-                "advice": "申し訳ありません、うまく解析できませんでした。別の表現でもう一度試してみてください。"
-            }
-
-        logger.debug(f"生成結果（raw）: {result[:200]}...")
-
-        # ===== JSON抽出ロジック(強化版) =====
-        # 1. { } で囲まれた部分を抽出
-        json_start = result.find('{')
-        json_end = result.rfind('}') + 1
-
-        if json_start != -1 and json_end > json_start:
-            json_str = result[json_start:json_end]
-        else:
-            # フォールバック: Markdownクリーニング
-            json_str = re.sub(r'```json\n?', '', result)
-            json_str = re.sub(r'```\n?', '', json_str)
-            json_str = json_str.strip()
-
-        logger.debug(f"抽出されたJSON文字列: {json_str[:200]}...")
-
-        # ===== JSON検証とパース =====
-        try:
-            parsed = json.loads(json_str)
-
-            # advice の型と長さを検証
-            if not isinstance(parsed.get("advice"), str):
-                logger.warning("⚠️ adviceが文字列ではありません。デフォルト値を設定します。")
-                parsed["advice"] = "申し訳ありません、うまく解析できませんでした。別の表現でもう一度試してみてください。"
-
-            # 文字数制限チェック(余裕を持たせる)
-            if len(parsed["advice"]) > 130:
-                logger.warning(f"⚠️ adviceが長すぎます（{len(parsed['advice'])}文字）。トリミングします。")
-                parsed["advice"] = parsed["advice"][:127] + "..."
-
-            # minus_words を正規化（★重要）
-            parsed["minus_words"] = normalize_minus_words(parsed.get("minus_words"))
-
-            logger.info(f"✅ マイナスワード検出完了: {len(parsed['minus_words'])}個")
-            return parsed
-
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"❌ JSON parse error: {e}, Raw result: {result}")
-            # JSONパース失敗時のフォールバック
-            return {
-                "minus_words": [],
-                "advice": "申し訳ありません、うまく解析できませんでした。別の表現でもう一度試してみてください。"
-            }
+    verdict = lexicon.analyze(inputed_text)
+    resolved = ADVICE_MODE == "fast" or verdict.confidence >= LEXICON_CONFIDENCE_THRESHOLD
+    if record:
+        lexicon.record(verdict, resolved)
+
+    if not resolved:
+        logger.debug(f"辞書判定の確信度が低いためLLMで解析: {verdict.confidence:.2f}")
+        return None
+
+    logger.info(f"📖 辞書判定: {len(verdict.minus_words)}個 (確信度 {verdict.confidence:.2f})")
+    return verdict.to_result()
+
+
+def resolve_degraded(inputed_text: str, model_id: str | None = None) -> dict[str, Any] | None:
+    """
+    正常な推論コンテキストがない（全て再読み込み中）場合に辞書判定の結果を返す
+
+    辞書に一致しない入力は「問題なし」と判定できないため、LLM に委ねる
+    （再読み込みが終わるまで古いインスタンスが推論を続ける）。
+
+    Args:
+        inputed_text: ユーザーの入力文章
+        model_id: 使用するモデルのID（None の場合は既定モデル）
+
+    Returns:
+        dict | None: {"minus_words": [...], "advice": "..."}（LLMで推論できる場合は None）
+    """
+    if not DEGRADED_LEXICON_FALLBACK:
+        return None
+
+    try:
+        status = get_inference_manager(model_id=model_id).get_status()
+    except Exception:
+        return None  # モデル指定の誤りなどは通常の経路でエラーにする
+
+    if status["state"] != "ready" or status.get("healthy_contexts", 1) > 0:
+        return None
+
+    verdict = lexicon.analyze(inputed_text)
+    if verdict.is_clean:
+        return None
+
+    logger.warning("🩹 推論コンテキストを再読み込み中のため辞書判定で応答します")
+    metrics.ADVICE_DEGRADED_FALLBACK.inc()
+    return verdict.to_result()
+
+
+def semantic_namespace(model_fingerprint: str | None) -> str | None:
+    """
+    類似入力キャッシュの名前空間（モデルかプロンプトが変われば別の結果として扱う）
+
+    Args:
+        model_fingerprint: モデルファイルの識別ハッシュ（不明な場合は None）
+
+    Returns:
+        str | None: 名前空間（モデルが不明な場合は None）
+    """
+    if not model_fingerprint:
+        return None
+    return f"{model_fingerprint}:{PROMPT_VERSION}"
+
+
+def start_semantic_cache() -> None:
+    """類似入力キャッシュの読み込みを開始（初回は既定モデルの名前空間で履歴から作る）"""
+    if semantic_cache is None:
+        return
+    try:
+        namespace = semantic_namespace(get_model_fingerprint(get_model_path()))
+    except FileNotFoundError:
+        namespace = None
+    semantic_cache.start(backfill_namespace=namespace)
+
+
+async def analyze_text(
+    inputed_text: str,
+    temperature: float | None = None,
+    user_id: int | None = None,
+    model_id: str | None = None
+) -> dict[str, Any]:
+    """
+    マイナスワード検出を実行（辞書判定・キャッシュ・同時リクエスト集約あり）
+
+    - ADVICE_MODE が fast / hybrid で辞書が判定できれば推論しない
+    - 推論コンテキストが全て再読み込み中なら辞書判定で返す（キャッシュしない）
+    - 結果キャッシュにあれば推論せずに返す
+    - 既定のパラメータでは、言い換えなど類似した過去の入力の結果も流用する
+    - 同じ入力の推論が実行中であれば、その結果を共有する
+    - temperature > 0 が明示された場合は多様な出力を求めているため、
+      キャッシュも集約も使わずに毎回推論する
+
+    Args:
+        inputed_text: ユーザーの入力文章
+        temperature: 温度パラメータ（None の場合は既定値）
+        user_id: 公平スケジューリング用のユーザーID
+        model_id: 使用するモデルのID（None の場合は既定モデル）
+
+    Returns:
+        dict: {"minus_words": [...], "advice": "..."}
+
+    Raises:
+        AdviceParseError: 生成結果を解析できなかった場合
+        QueueFullError: 推論キューが満杯の場合
+        TimeoutError: 推論がタイムアウトした場合
+        Exception: その他のエラー
+    """
+    lexicon_result = resolve_with_lexicon(inputed_text) or resolve_degraded(inputed_text, model_id)
+    if lexicon_result is not None:
+        return lexicon_result
+
+    params = dict(ADVICE_GENERATION_PARAMS)
+    if temperature is not None:
+        params["temperature"] = temperature
+
+    if temperature is not None and temperature > 0:
+        if result_cache is not None:
+            result_cache.record_bypass()
+        return await _run_advice_inference(inputed_text, params, user_id, model_id)
+
+    inference_manager = get_inference_manager(model_id=model_id)
+    cache_key = make_cache_key(
+        normalize_input_text(inputed_text),
+        inference_manager.model_fingerprint,
+        PROMPT_VERSION,
+        params,
+    )
+
+    if result_cache is not None:
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"⚡ 結果キャッシュヒット: {inputed_text[:50]}...")
+            return {"minus_words": list(cached["minus_words"]), "advice": cached["advice"]}
+
+    # 類似入力キャッシュ（パラメータ指定のあるリクエストは完全一致のみ）
+    namespace = semantic_namespace(inference_manager.model_fingerprint)
+    use_semantic = semantic_cache is not None and temperature is None and namespace is not None
+    semantic_vector = None
+    if use_semantic:
+        cached, semantic_vector = await semantic_cache.get(inputed_text, namespace)
+        if cached is not None:
+            return cached
+
+    async def run_and_store():
+        result = await _run_advice_inference(inputed_text, params, user_id, model_id)
+        if result_cache is not None:
+            await result_cache.put(cache_key, result)
+        if use_semantic:
+            await semantic_cache.put(inputed_text, namespace, result, semantic_vector)
+        return result
+
+    result = await _advice_flight.do(cache_key, run_and_store)
+    # 共有結果を呼び出し側ごとに独立させる
+    return {"minus_words": list(result["minus_words"]), "advice": result["advice"]}
+
+
+async def _run_advice_inference(
+    inputed_text: str,
+    params: dict[str, Any],
+    user_id: int | None = None,
+    model_id: str | None = None
+) -> dict[str, Any]:
+    """推論を実行してJSONを解析"""
+    logger.info(f"マイナスワード検出開始: {inputed_text[:50]}...")
+
+    prompt = build_advice_prompt(inputed_text)
+
+    # ===== 推論マネージャーで生成実行 =====
+    inference_manager = get_inference_manager(model_id=model_id)
+
+    result = await inference_manager.generate(
+        prompt=prompt,
+        timeout=int(REQUEST_TIMEOUT),
+        user_id=user_id,
+        grammar=ADVICE_OUTPUT_GRAMMAR,
+        **params
+    )
+
+    return parse_advice_result(result)
+
+
+async def analyze_batch(
+    texts: list[str],
+    temperature: float | None = None,
+    user_id: int | None = None,
+    model_id: str | None = None
+) -> list[dict[str, Any] | Exception]:
+    """
+    複数の入力文をまとめて解析
+
+    全件が同じ固定プレフィックスのKV状態を共有し、コンテキストプール上で
+    並行に推論する。同時実行数はプール数までに抑え、メモリ使用量を一定に保つ。
+    重複した入力はキャッシュ・集約により1回だけ推論される。
+
+    Args:
+        texts: 入力文のリスト
+        temperature: 温度パラメータ（None の場合は既定値）
+        user_id: 公平スケジューリング用のユーザーID
+        model_id: 使用するモデルのID（None の場合は既定モデル）
+
+    Returns:
+        list: 入力と同じ順序の結果（成功時は dict、失敗時は例外オブジェクト）
+
+    Raises:
+        UnknownModelError: モデルが見つからない場合
+        ModelBudgetError: メモリ予算内にモデルを読み込めない場合
+    """
+    inference_manager = get_inference_manager(model_id=model_id)
+    semaphore = asyncio.Semaphore(max(1, inference_manager.pool_size))
+
+    async def analyze_one(text: str):
+        async with semaphore:
+            try:
+                return await analyze_text(text, temperature=temperature, user_id=user_id, model_id=model_id)
+            except Exception as e:
+                logger.warning(f"⚠️ バッチ項目の解析失敗: {e}")
+                return e
+
+    logger.info(f"📦 バッチ解析開始: {len(texts)}件")
+    results = await asyncio.gather(*(analyze_one(text) for text in texts))
+    logger.info(f"✅ バッチ解析完了: 成功={sum(not isinstance(r, Exception) for r in results)}/{len(texts)}")
+    return list(results)
+
+
+async def generate_advice(
+    inputed_text: str,
+    temperature: float | None = None,
+    user_id: int | None = None,
+    model_id: str | None = None
+) -> dict[str, Any]:
+    """
+    llama.cpp を使ってマイナスワード検出とアドバイスを生成
+
+    Args:
+        inputed_text: ユーザーの入力文章
+        temperature: 温度パラメータ（> 0 を指定するとキャッシュを使わず再生成）
+        user_id: 公平スケジューリング用のユーザーID
+        model_id: 使用するモデルのID（None の場合は既定モデル）
+
+    Returns:
+        dict: {"minus_words": ["ダメ", "無理"], "advice": "大丈夫です！"}
+              （失敗時はフォールバックのアドバイス文）
+
+    Raises:
+        QueueFullError: 推論キューが満杯の場合（429 で返すため呼び出し側へ伝播）
+        ModelNotReadyError: モデルを準備中の場合（503 で返すため呼び出し側へ伝播）
+        UnknownModelError: モデルが見つからない場合（404 で返すため呼び出し側へ伝播）
+        ModelBudgetError: メモリ予算内にモデルを読み込めない場合（503 で返すため呼び出し側へ伝播）
+    """
+    try:
+        return await analyze_text(inputed_text, temperature=temperature, user_id=user_id, model_id=model_id)
+
+    except (QueueFullError, ModelNotReadyError, UnknownModelError, ModelBudgetError):
+        raise
+
+    except AdviceParseError:
+        # JSONパース失敗時のフォールバック
+        return {"minus_words": [], "advice": PARSE_ERROR_ADVICE}
 
     except TimeoutError:
         logger.error("⏱️ マイナスワード検出タイムアウト")
-        return {
-            "minus_words": [],
-            "advice": "申し訳ありません、処理に時間がかかりすぎました。少し時間を置いてもう一度お試しください。"
-        }
+        return {"minus_words": [], "advice": TIMEOUT_ADVICE}
 
     except Exception as e:
         logger.error(f"❌ generate_advice error: {e}")
         import traceback
         traceback.print_exc()
         # システムエラー時
-        return {
-            "minus_words": [],
-            "advice": "申し訳ありません、一時的なエラーが発生しました。少し時間を置いてもう一度お試しください。"
-        }
+        return {"minus_words": [], "advice": SYSTEM_ERROR_ADVICE}
+
+
+# =========================
+# ストリーミング版
+# =========================
+class MinusWordsStreamParser:
+    """
+    生成途中のJSONを1文字ずつ解析するインクリメンタルパーサー
+
+    - minus_words 配列の要素は文字列が閉じた時点で通知
+    - advice の値は生成された文字をそのまま差分として通知
+    - 最初の { より前のテキスト（```json 等）は無視
+    """
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.done = False
+        self._stack: list[str] = []      # 'obj' / 'arr'
+        self._keys: list[str | None] = []  # 各階層の現在のキー
+        self._expect_key = False
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._unicode_buf: str | None = None
+        self._buf: list[str] = []
+
+    def _path(self) -> tuple:
+        """現在の文字列値の位置（(キー, 'arr') 等）"""
+        return tuple(
+            key if kind == 'obj' else 'arr'
+            for kind, key in zip(self._stack, self._keys)
+        )
+
+    def _on_char(self, ch: str, events: list) -> None:
+        """文字列中の1文字（デコード済み）を処理"""
+        self._buf.append(ch)
+        if not self._string_is_key and self._path() == ('advice',):
+            events.append(("advice", ch))
+
+    def _on_string_end(self, events: list) -> None:
+        """文字列の終端を処理"""
+        value = "".join(self._buf)
+        self._buf = []
+        if self._string_is_key:
+            self._keys[-1] = value
+            return
+        if self._path() == ('minus_words', 'arr'):
+            events.append(("minus_word", value))
+
+    def feed(self, text: str) -> list[tuple[str, str]]:
+        """
+        生成テキストの断片を入力
+
+        Args:
+            text: 新たに生成されたテキスト
+
+        Returns:
+            list[tuple[str, str]]: ("minus_word", 単語) / ("advice", 差分) のイベント列
+        """
+        events: list[tuple[str, str]] = []
+
+        for ch in text:
+            if self.done:
+                break
+
+            if self._in_string:
+                if self._unicode_buf is not None:
+                    self._unicode_buf += ch
+                    if len(self._unicode_buf) == 4:
+                        try:
+                            code = int(self._unicode_buf, 16)
+                        except ValueError:
+                            code = ord('?')
+                        self._unicode_buf = None
+                        self._on_char(chr(code), events)
+                elif self._escape:
+                    self._escape = False
+                    if ch == 'u':
+                        self._unicode_buf = ""
+                    else:
+                        self._on_char(self._ESCAPES.get(ch, ch), events)
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string_end(events)
+                else:
+                    self._on_char(ch, events)
+                continue
+
+            if not self._stack and ch != '{':
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_is_key = bool(self._stack) and self._stack[-1] == 'obj' and self._expect_key
+                self._buf = []
+            elif ch == '{':
+                self._stack.append('obj')
+                self._keys.append(None)
+                self._expect_key = True
+            elif ch == '[':
+                self._stack.append('arr')
+                self._keys.append(None)
+            elif ch in '}]':
+                self._stack.pop()
+                self._keys.pop()
+                self._expect_key = False
+                if not self._stack:
+                    self.done = True
+            elif ch == ':':
+                self._expect_key = False
+            elif ch == ',':
+                self._expect_key = self._stack[-1] == 'obj'
+
+        # 連続する advice の差分は1イベントにまとめる
+        merged: list[tuple[str, str]] = []
+        for kind, value in events:
+            if kind == "advice" and merged and merged[-1][0] == "advice":
+                merged[-1] = ("advice", merged[-1][1] + value)
+            else:
+                merged.append((kind, value))
+        return merged
+
+
+async def generate_advice_stream(inputed_text: str, user_id: int | None = None, model_id: str | None = None):
+    """
+    マイナスワード検出をストリーミングで実行
+
+    minus_words は1件ずつ、advice は生成され次第差分で返し、
+    最後に generate_advice と同じ正規化を通した結果を返す。
+
+    Args:
+        inputed_text: ユーザーの入力文章
+        user_id: 公平スケジューリング用のユーザーID
+        model_id: 使用するモデルのID（None の場合は既定モデル）
+
+    Yields:
+        dict: {"type": "minus_word", "word": ...}
+              {"type": "advice", "delta": ...}
+              {"type": "result", "minus_words": [...], "advice": ...}（最後に1回）
+    """
+    logger.info(f"マイナスワード検出開始（ストリーミング）: {inputed_text[:50]}...")
+
+    lexicon_result = resolve_with_lexicon(inputed_text) or resolve_degraded(inputed_text, model_id)
+    if lexicon_result is not None:
+        # 辞書で判定できた場合は推論せず、同じイベント形式で一度に返す
+        for word in lexicon_result["minus_words"]:
+            yield {"type": "minus_word", "word": word}
+        yield {"type": "advice", "delta": lexicon_result["advice"]}
+        yield {"type": "result", **lexicon_result}
+        return
+
+    prompt = build_advice_prompt(inputed_text)
+    parser = MinusWordsStreamParser()
+    chunks: list[str] = []
+    streamed_words: list[str] = []
+
+    try:
+        inference_manager = get_inference_manager(model_id=model_id)
+
+        async for chunk in inference_manager.generate_stream(
+            prompt=prompt,
+            timeout=int(REQUEST_TIMEOUT),
+            user_id=user_id,
+            grammar=ADVICE_OUTPUT_GRAMMAR,
+            **ADVICE_GENERATION_PARAMS
+        ):
+            chunks.append(chunk)
+            for kind, value in parser.feed(chunk):
+                if kind == "advice":
+                    yield {"type": "advice", "delta": value}
+                    continue
+
+                # 逐次正規化して新しく確定した単語だけを送る
+                n_sent = len(normalize_minus_words(streamed_words))
+                streamed_words.append(value)
+                for word in normalize_minus_words(streamed_words)[n_sent:]:
+                    yield {"type": "minus_word", "word": word}
+
+        result = parse_advice_result("".join(chunks).strip())
+
+    except AdviceParseError:
+        result = {"minus_words": [], "advice": PARSE_ERROR_ADVICE}
+
+    except (QueueFullError, ModelNotReadyError, ModelBudgetError) as e:
+        logger.warning(f"🚦 推論を受け付けられませんでした: {e}")
+        result = {"minus_words": [], "advice": BUSY_ADVICE}
+
+    except TimeoutError:
+        logger.error("⏱️ マイナスワード検出タイムアウト")
+        result = {"minus_words": [], "advice": TIMEOUT_ADVICE}
+
+    except Exception as e:
+        logger.error(f"❌ generate_advice_stream error: {e}")
+        result = {"minus_words": [], "advice": SYSTEM_ERROR_ADVICE}
+
+    yield {"type": "result", "minus_words": result["minus_words"], "advice": result["advice"]}
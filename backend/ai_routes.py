@@ -1,17 +1,88 @@
 # backend/ai_routes.py（修正版）
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import logging
 
-from ai_model import generate_advice
-from schemas import InputData, OutputData
+from ai_model import AdviceParseError, analyze_batch, generate_advice, generate_advice_stream, resolve_with_lexicon
+from inference_manager import MODEL_LOADING_RETRY_AFTER, ModelNotReadyError, get_inference_manager
+from model_registry import ModelBudgetError, UnknownModelError
+from scheduler import QueueFullError
+from schemas import MAX_USER_INPUT_CHARS, BatchInputData, BatchItemResult, BatchOutputData, InputData, OutputData
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# クライアント切断を確認する間隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# クライアント切断時のステータスコード（nginx の慣例に合わせる）
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """処理中にクライアントが切断した"""
+
+
+async def run_until_disconnected(request: Request, coro):
+    """
+    クライアントが切断したら処理をキャンセルしながらコルーチンを実行
+
+    キャンセルは推論マネージャーまで伝わり、実行中の生成も打ち切られる。
+
+    Raises:
+        ClientDisconnected: 処理完了前にクライアントが切断した場合
+    """
+    task = asyncio.ensure_future(coro)
+    disconnected = False
+
+    async def watch_disconnect():
+        nonlocal disconnected
+        while not task.done():
+            if await request.is_disconnected():
+                disconnected = True
+                task.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if disconnected:
+            raise ClientDisconnected() from None
+        raise
+    finally:
+        watcher.cancel()
+
+
+def model_not_ready(retry_after: int) -> HTTPException:
+    """モデル準備中の 503 レスポンス（Retry-After 付き）"""
+    return HTTPException(
+        status_code=503,
+        detail="AIモデルを準備中です。しばらくしてから再試行してください",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+def unknown_model(e: UnknownModelError) -> HTTPException:
+    """存在しないモデル指定の 404 レスポンス"""
+    return HTTPException(status_code=404, detail=e.args[0] if e.args else "モデルが見つかりません")
+
+
+def too_many_requests(retry_after: int) -> HTTPException:
+    """推論キュー満杯時の 429 レスポンス（Retry-After 付き）"""
+    return HTTPException(
+        status_code=429,
+        detail="混み合っています。しばらくしてから再試行してください",
+        headers={"Retry-After": str(retry_after)}
+    )
+
 @router.post("/generate", response_model=OutputData)
-async def generate_text(payload: InputData):
+async def generate_text(payload: InputData, request: Request):
     """マイナスワード検出エンドポイント"""
     input_text = (payload.text or "").strip()
     
@@ -23,7 +94,15 @@ async def generate_text(payload: InputData):
 
     try:
         # マイナスワード検出（asyncに変更）
-        result = await generate_advice(input_text)
+        result = await run_until_disconnected(
+            request,
+            generate_advice(
+                input_text,
+                temperature=payload.temperature,
+                user_id=payload.user_id,
+                model_id=payload.model
+            )
+        )
 
         logger.info(f"✅ マイナスワード検出完了: {len(result['minus_words'])}個")
 
@@ -32,10 +111,135 @@ async def generate_text(payload: InputData):
             advice=result["advice"]
         )
     
+    except QueueFullError as e:
+        raise too_many_requests(e.retry_after) from e
+
+    except ModelNotReadyError as e:
+        raise model_not_ready(e.retry_after) from e
+
+    except UnknownModelError as e:
+        raise unknown_model(e) from e
+
+    except ModelBudgetError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+    except ClientDisconnected:
+        logger.info("🔌 クライアントが切断したため推論を中止しました")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
     except Exception as e:
         logger.error(f"❌ マイナスワード検出エラー: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"AI生成に失敗: {str(e)}"
         ) from e
-    
\ No newline at end of file
+    
+
+
+@router.post("/generate/stream")
+async def generate_text_stream(payload: InputData):
+    """
+    マイナスワード検出エンドポイント（ストリーミング版）
+
+    NDJSON形式で1行ずつイベントを返す:
+    - {"type": "minus_word", "word": "..."}: 検出されたマイナスワード（確定次第）
+    - {"type": "advice", "delta": "..."}: アドバイス文の差分
+    - {"type": "result", "minus_words": [...], "advice": "..."}: 正規化済みの最終結果
+    """
+    input_text = (payload.text or "").strip()
+
+    if not input_text:
+        logger.warning("⚠️ 空の入力が送信されました")
+        raise HTTPException(status_code=400, detail="入力が空です")
+
+    logger.info(f"マイナスワード検出リクエスト（ストリーミング）: {input_text[:50]}...")
+
+    # レスポンス開始後はステータスを変えられないため、受け付けられない場合は先に断る
+    # （辞書で判定できる入力は推論しないため確認不要）
+    if resolve_with_lexicon(input_text, record=False) is None:
+        try:
+            inference_manager = get_inference_manager(model_id=payload.model)
+        except UnknownModelError as e:
+            raise unknown_model(e) from e
+        except ModelBudgetError as e:
+            raise HTTPException(status_code=503, detail=str(e)) from e
+        if not inference_manager.is_ready:
+            raise model_not_ready(MODEL_LOADING_RETRY_AFTER)
+        if inference_manager.scheduler.is_full():
+            raise too_many_requests(inference_manager.scheduler.estimate_retry_after())
+
+    async def event_stream():
+        async for event in generate_advice_stream(input_text, user_id=payload.user_id, model_id=payload.model):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+
+@router.post("/generate/batch", response_model=BatchOutputData)
+async def generate_text_batch(payload: BatchInputData, request: Request):
+    """
+    マイナスワード検出エンドポイント（バッチ版）
+
+    複数の入力文をまとめて解析する。一部の項目が失敗しても全体は 200 で返し、
+    失敗した項目は ok=false とエラー内容で報告する。
+    """
+    texts = [(text or "").strip() for text in payload.texts]
+    results: list[BatchItemResult | None] = [None] * len(texts)
+
+    # 入力チェックは項目単位で行う
+    targets = []
+    for index, text in enumerate(texts):
+        if not text:
+            results[index] = BatchItemResult(index=index, ok=False, error="入力が空です")
+        elif len(text) > MAX_USER_INPUT_CHARS:
+            results[index] = BatchItemResult(index=index, ok=False, error=f"入力が{MAX_USER_INPUT_CHARS}文字を超えています")
+        else:
+            targets.append(index)
+
+    logger.info(f"マイナスワード検出リクエスト（バッチ）: {len(targets)}/{len(texts)}件")
+
+    try:
+        outcomes = await run_until_disconnected(
+            request,
+            analyze_batch(
+                [texts[i] for i in targets],
+                temperature=payload.temperature,
+                user_id=payload.user_id,
+                model_id=payload.model
+            )
+        )
+    except UnknownModelError as e:
+        raise unknown_model(e) from e
+    except ModelBudgetError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+    except ClientDisconnected:
+        logger.info("🔌 クライアントが切断したためバッチ解析を中止しました")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
+    for index, outcome in zip(targets, outcomes):
+        if isinstance(outcome, Exception):
+            if isinstance(outcome, AdviceParseError):
+                error = "生成結果を解析できませんでした"
+            elif isinstance(outcome, QueueFullError):
+                error = "混み合っているため処理できませんでした"
+            elif isinstance(outcome, ModelNotReadyError):
+                error = "AIモデルを準備中です"
+            elif isinstance(outcome, TimeoutError):
+                error = "処理がタイムアウトしました"
+            else:
+                error = f"AI生成に失敗: {outcome}"
+            results[index] = BatchItemResult(index=index, ok=False, error=error)
+        else:
+            results[index] = BatchItemResult(
+                index=index,
+                ok=True,
+                result=OutputData(minus_words=outcome["minus_words"], advice=outcome["advice"])
+            )
+
+    succeeded = sum(1 for item in results if item.ok)
+    return BatchOutputData(results=results, succeeded=succeeded, failed=len(results) - succeeded)
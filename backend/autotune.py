@@ -0,0 +1,318 @@
+# backend/autotune.py（新規）
+#
+# 使い方:
+#   python autotune.py              # プロファイルがなければ計測して保存
+#   python autotune.py --force      # 既存プロファイルを無視して再計測
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import psutil
+from llama_cpp import Llama
+
+from config import APP_DATA_DIR, INFERENCE_N_CTX, MODEL_PATH, get_model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 起動時にプロファイルがなければ自動調整する（0で無効。初回起動が数分長くなる）
+AUTOTUNE_ON_STARTUP = os.getenv("AUTOTUNE_ON_STARTUP", "0") == "1"
+# デコード速度の計測に生成するトークン数（アドバイス1件分の目安）
+AUTOTUNE_DECODE_TOKENS = int(os.getenv("AUTOTUNE_DECODE_TOKENS", "64"))
+# 各設定の計測回数（最良値を採用）
+AUTOTUNE_REPEATS = int(os.getenv("AUTOTUNE_REPEATS", "2"))
+
+# プロファイルの形式バージョン（保存内容を変えたら上げる）
+PROFILE_FORMAT_VERSION = 1
+
+# 計測時のコンテキストサイズ（InferenceManager と合わせる）
+AUTOTUNE_N_CTX = INFERENCE_N_CTX
+
+
+def get_cpu_model() -> str:
+    """
+    CPUのモデル名を取得
+
+    Returns:
+        str: CPU名（取得できない場合は platform の情報）
+    """
+    try:
+        import cpuinfo
+        brand = cpuinfo.get_cpu_info().get("brand_raw")
+        if brand:
+            return brand
+    except Exception as e:
+        logger.warning(f"⚠️ cpuinfo でのCPU情報取得失敗: {e}")
+    return platform.processor() or platform.machine() or "unknown"
+
+
+def get_profile_path(model_path: str, cpu_model: str | None = None) -> Path:
+    """
+    CPUモデルとモデルハッシュに対応するプロファイルのパス
+
+    Args:
+        model_path: モデルファイルのパス
+        cpu_model: CPU名（省略時は取得）
+
+    Returns:
+        Path: APP_DATA_DIR/autotune/ 配下のJSONファイル
+    """
+    cpu_model = cpu_model or get_cpu_model()
+    cpu_slug = re.sub(r"[^0-9A-Za-z]+", "-", cpu_model).strip("-")[:48]
+    cpu_hash = hashlib.sha256(cpu_model.encode("utf-8")).hexdigest()[:8]
+    return APP_DATA_DIR / "autotune" / f"{cpu_slug}_{cpu_hash}_{get_model_fingerprint(model_path)}.json"
+
+
+def load_profile(model_path: str) -> dict | None:
+    """
+    保存済みのプロファイルを読み込む
+
+    Args:
+        model_path: モデルファイルのパス
+
+    Returns:
+        dict | None: Llama に渡す設定（n_threads など）。なければ None
+    """
+    path = get_profile_path(model_path)
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = json.load(f)
+        if profile.get("format") != PROFILE_FORMAT_VERSION:
+            logger.warning(f"⚠️ チューニングプロファイルの形式が古いため無視します: {path.name}")
+            return None
+        logger.info(f"🎛️ チューニングプロファイルを読み込みました: {profile['params']}")
+        return profile["params"]
+    except Exception as e:
+        logger.warning(f"⚠️ チューニングプロファイルの読み込み失敗: {e}")
+        return None
+
+
+def save_profile(model_path: str, params: dict, results: list[dict]) -> Path:
+    """プロファイルを保存（一時ファイル経由で置き換え）"""
+    cpu_model = get_cpu_model()
+    path = get_profile_path(model_path, cpu_model)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "format": PROFILE_FORMAT_VERSION,
+                "cpu_model": cpu_model,
+                "model_fingerprint": get_model_fingerprint(model_path),
+                "created_at": time.time(),
+                "params": params,
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def build_search_space() -> dict[str, list]:
+    """
+    CPUコア数から探索候補を作成
+
+    Returns:
+        dict: 設定名 -> 候補値のリスト（先頭が初期値）
+    """
+    physical = psutil.cpu_count(logical=False) or 2
+    logical = psutil.cpu_count(logical=True) or physical
+
+    threads = sorted({max(1, physical // 2), max(1, int(physical * 0.8)), physical, logical})
+    return {
+        "n_threads": threads,
+        "n_threads_batch": threads,
+        "n_batch": [512, 256, 128],
+        "n_ubatch": [512, 256, 128],
+        "memory": ["mmap", "mmap+mlock", "no_mmap"],
+    }
+
+
+def _memory_options(memory: str) -> dict:
+    return {
+        "mmap": {"use_mmap": True, "use_mlock": False},
+        "mmap+mlock": {"use_mmap": True, "use_mlock": True},
+        "no_mmap": {"use_mmap": False, "use_mlock": False},
+    }[memory]
+
+
+def benchmark(model_path: str, prompt: str, config: dict,
+              decode_tokens: int = AUTOTUNE_DECODE_TOKENS, repeats: int = AUTOTUNE_REPEATS) -> dict:
+    """
+    1つの設定でプロンプト評価速度とデコード速度を計測
+
+    Args:
+        model_path: モデルファイルのパス
+        prompt: 実際のプロンプトテンプレートで組み立てたプロンプト
+        config: n_threads / n_threads_batch / n_batch / n_ubatch / memory
+        decode_tokens: 生成するトークン数
+        repeats: 計測回数（最良値を採用）
+
+    Returns:
+        dict: 読み込み時間・prompt tok/s・decode tok/s・1リクエストの推定時間
+    """
+    started_at = time.perf_counter()
+    llm = Llama(
+        model_path=model_path,
+        n_ctx=AUTOTUNE_N_CTX,
+        n_threads=config["n_threads"],
+        n_threads_batch=config["n_threads_batch"],
+        n_batch=config["n_batch"],
+        n_ubatch=min(config["n_ubatch"], config["n_batch"]),
+        verbose=False,
+        **_memory_options(config["memory"]),
+    )
+    load_seconds = time.perf_counter() - started_at
+
+    try:
+        tokens = llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+        best_prompt, best_decode = 0.0, 0.0
+
+        for _ in range(repeats):
+            llm.reset()
+            started_at = time.perf_counter()
+            llm.eval(tokens)
+            prompt_tps = len(tokens) / (time.perf_counter() - started_at)
+
+            # 貪欲法で1トークンずつ生成（サンプリングの差を除いた純粋なデコード速度）
+            started_at = time.perf_counter()
+            for _ in range(decode_tokens):
+                next_token = int(np.argmax(llm.scores[llm.n_tokens - 1]))
+                llm.eval([next_token])
+            decode_tps = decode_tokens / (time.perf_counter() - started_at)
+
+            best_prompt = max(best_prompt, prompt_tps)
+            best_decode = max(best_decode, decode_tps)
+    finally:
+        del llm
+
+    return {
+        "load_seconds": load_seconds,
+        "prompt_tokens": len(tokens),
+        "prompt_tokens_per_second": best_prompt,
+        "decode_tokens_per_second": best_decode,
+        # 実際のリクエスト1件（プロンプト評価 + アドバイス生成）の推定時間
+        "estimated_seconds": len(tokens) / best_prompt + decode_tokens / best_decode,
+    }
+
+
+def autotune(model_path: str, prompt: str | None = None,
+             decode_tokens: int = AUTOTUNE_DECODE_TOKENS, repeats: int = AUTOTUNE_REPEATS,
+             on_progress=None) -> dict:
+    """
+    設定を1つずつ動かして最速の組み合わせを探索し、プロファイルとして保存
+
+    全組み合わせの計測は数百回のモデル読み込みになるため、
+    設定ごとに他を固定して最良値を選ぶ座標降下法で探索する。
+
+    Args:
+        model_path: モデルファイルのパス
+        prompt: 計測に使うプロンプト（省略時は実際のテンプレート + ウォームアップ文）
+        decode_tokens: デコード速度の計測に生成するトークン数
+        repeats: 各設定の計測回数
+        on_progress: 進捗（0.0〜1.0）を受け取るコールバック
+
+    Returns:
+        dict: 最良の設定（Llama に渡す形式）
+    """
+    if prompt is None:
+        # 循環インポートを避けるため遅延インポート
+        from ai_model import WARMUP_TEXT, build_advice_prompt
+        prompt = build_advice_prompt(WARMUP_TEXT).render()
+
+    space = build_search_space()
+    current = {name: values[0] for name, values in space.items()}
+    current["n_threads"] = current["n_threads_batch"] = space["n_threads"][len(space["n_threads"]) // 2]
+
+    results: list[dict] = []
+    measured: dict[str, dict] = {}
+    total = sum(len(values) for values in space.values())
+    done = 0
+
+    logger.info(f"🎛️ 自動チューニング開始: CPU={get_cpu_model()}, 候補={space}")
+
+    for name, values in space.items():
+        best_value, best_seconds = current[name], float("inf")
+
+        for value in values:
+            done += 1
+            if on_progress is not None:
+                on_progress(done / total)
+
+            config = dict(current, **{name: value})
+            if config["n_ubatch"] > config["n_batch"]:
+                continue  # n_ubatch は n_batch 以下でなければならない
+
+            key = json.dumps(config, sort_keys=True)
+            if key not in measured:
+                try:
+                    measured[key] = benchmark(model_path, prompt, config, decode_tokens, repeats)
+                except Exception as e:
+                    # mlock の権限不足など、環境で使えない設定は飛ばす
+                    logger.warning(f"⚠️ 計測失敗 {config}: {e}")
+                    continue
+                results.append({"config": config, **measured[key]})
+                logger.info(
+                    f"📏 {config} → prompt {measured[key]['prompt_tokens_per_second']:.1f} tok/s, "
+                    f"decode {measured[key]['decode_tokens_per_second']:.1f} tok/s"
+                )
+
+            if measured[key]["estimated_seconds"] < best_seconds:
+                best_value, best_seconds = value, measured[key]["estimated_seconds"]
+
+        current[name] = best_value
+
+    params = {
+        "n_threads": current["n_threads"],
+        "n_threads_batch": current["n_threads_batch"],
+        "n_batch": current["n_batch"],
+        "n_ubatch": min(current["n_ubatch"], current["n_batch"]),
+        **_memory_options(current["memory"]),
+    }
+    path = save_profile(model_path, params, results)
+    logger.info(f"✅ 自動チューニング完了: {params} → {path}")
+    return params
+
+
+def main():
+    """コマンドラインから自動チューニングを実行"""
+    from logging_config import setup_logging
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="推論設定の自動チューニング")
+    parser.add_argument("--model", default=MODEL_PATH, help="モデルファイルのパス")
+    parser.add_argument("--force", action="store_true", help="既存のプロファイルがあっても再計測する")
+    parser.add_argument("--decode-tokens", type=int, default=AUTOTUNE_DECODE_TOKENS, help="デコード計測のトークン数")
+    parser.add_argument("--repeats", type=int, default=AUTOTUNE_REPEATS, help="各設定の計測回数")
+    args = parser.parse_args()
+
+    if not args.model:
+        parser.error("モデルパスが設定されていません。--model で指定してください。")
+
+    if not args.force and load_profile(args.model) is not None:
+        print(f"プロファイルは作成済みです: {get_profile_path(args.model)}（再計測は --force）")
+        return
+
+    params = autotune(args.model, decode_tokens=args.decode_tokens, repeats=args.repeats)
+    print(json.dumps(params, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
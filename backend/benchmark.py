@@ -0,0 +1,492 @@
+# backend/benchmark.py（新規）
+#
+# 使い方:
+#   python benchmark.py --stub                       # GGUFなしでハーネスを確認
+#   python benchmark.py --output result.json         # 既定モデルで計測して保存
+#   python benchmark.py --baseline before.json       # 前回の結果と比較（劣化があれば終了コード1）
+#   python benchmark.py --url http://127.0.0.1:8000  # 起動中のサーバーのエンドポイントを計測
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import tempfile
+import time
+from typing import Any
+
+import httpx
+
+from ai_model import (
+    ADVICE_GENERATION_PARAMS,
+    ADVICE_OUTPUT_GRAMMAR,
+    PARSE_ERROR_ADVICE,
+    PROMPT_PREFIX,
+    SYSTEM_ERROR_ADVICE,
+    TIMEOUT_ADVICE,
+    build_advice_prompt,
+    build_warmup_request,
+)
+from config import MODEL_PATH
+from inference_manager import InferenceManager
+from lexicon import lexicon
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# エンドポイント計測の同時接続数
+BENCHMARK_CONCURRENCY = [int(c) for c in os.getenv("BENCHMARK_CONCURRENCY", "1,4,16").split(",")]
+# 同時接続数ごとのリクエスト数（同時接続数より少ない場合は同時接続数×2）
+BENCHMARK_REQUESTS = int(os.getenv("BENCHMARK_REQUESTS", "32"))
+# 前回結果と比較する際に劣化とみなす割合
+BENCHMARK_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "0.10"))
+# スタブの1トークンあたりの処理時間（秒）
+STUB_PROMPT_SECONDS_PER_TOKEN = float(os.getenv("STUB_PROMPT_SECONDS_PER_TOKEN", "0.0002"))
+STUB_DECODE_SECONDS_PER_TOKEN = float(os.getenv("STUB_DECODE_SECONDS_PER_TOKEN", "0.002"))
+
+# 結果JSONの形式バージョン（項目を変えたら上げる）
+RESULT_FORMAT_VERSION = 1
+
+# 固定の入力コーパス（5カテゴリ + 罵倒語 + マイナスワードなし）
+CORPUS = [
+    "今日はいい天気ですね。",
+    "どうせ私なんて何をやっても無理だよ。",
+    "みんなはできるのに、私だけできない。",
+    "へー、すごいね。さすがですね。",
+    "社会人なら残業は当たり前でしょ、もっと頑張るべきだ。",
+    "前もダメだったし、今回もきっと失敗する。",
+    "お前ほんとにバカだな、役立たず。",
+    "週末は友達と映画を観に行く予定です。",
+    "普通はこれくらい一回で覚えるよね。",
+    "いつも失敗ばかりで自分が嫌になる。",
+    "新しいプロジェクトが始まってワクワクしています。",
+    "何度やっても上手くいかない、もう向いてないのかも。",
+    "資料は明日までに絶対に終わらせなければならない。",
+    "お兄ちゃんはできたのに、なんであなたはできないの。",
+    "ご飯がおいしくて元気が出ました。",
+    "よくそんなことが言えるね、いいご身分だこと。",
+    "テストで80点取れたので少し自信がつきました。",
+    "どうせ誰も私の話なんて聞いてくれない。",
+    "あの人は仕事が早いのに、あなたは遅すぎる。",
+    "またミスしたの？前回も失敗したよね。",
+    "ちゃんと毎日勉強しないといけないのは分かってる。",
+    "朝のランニングが習慣になってきました。",
+    "うざいから話しかけないで。",
+    "普通なら言われなくても気づくでしょ。",
+    "今日は早く寝て明日に備えます。",
+    "頑張っているつもりだけど、どうせ結果は出ない。",
+    "同期はもう昇進したのに私はまだ平社員。",
+    "失敗しても大丈夫、次があるから。",
+    "君はいつもそうやって言い訳ばかりだね。",
+    "家族と旅行の計画を立てるのが楽しい。",
+    "先輩を見習って、もっとしっかりしなさい。",
+    "できるわけないって最初から分かってた。",
+]
+
+
+# =========================
+# スタブ（GGUFなしでの検証用）
+# =========================
+class StubState:
+    """StubLlama の保存状態（prefix_cache から pickle される）"""
+
+    def __init__(self, input_ids: list[int], n_tokens: int):
+        self.input_ids = input_ids
+        self.n_tokens = n_tokens
+        self.scores = [0.0] * max(1, n_tokens)
+
+
+class StubLlama:
+    """
+    決定的な出力と処理時間を返す Llama の代替
+
+    - 1文字を1トークンとして扱う
+    - プロンプトは前回のKVキャッシュとの共通部分を除いた分だけ評価時間がかかる
+    - 出力は辞書判定の結果をJSONにしたもの（入力ごとに常に同じ）
+    - time.sleep で処理時間を模すため、複数コンテキストは実際に並行に動く
+    """
+
+    def __init__(self, model_path: str | None = None, n_ctx: int = 2048,
+                 prompt_seconds_per_token: float = STUB_PROMPT_SECONDS_PER_TOKEN,
+                 decode_seconds_per_token: float = STUB_DECODE_SECONDS_PER_TOKEN, **kwargs):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.prompt_seconds_per_token = prompt_seconds_per_token
+        self.decode_seconds_per_token = decode_seconds_per_token
+        self.input_ids: list[int] = []
+
+    @property
+    def n_tokens(self) -> int:
+        return len(self.input_ids)
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> list[int]:
+        tokens = [ord(ch) for ch in text.decode("utf-8", errors="ignore")]
+        return [1] + tokens if add_bos else tokens
+
+    def reset(self):
+        self.input_ids = []
+
+    def eval(self, tokens: list[int]):
+        time.sleep(len(tokens) * self.prompt_seconds_per_token)
+        self.input_ids.extend(tokens)
+
+    def save_state(self) -> StubState:
+        return StubState(list(self.input_ids), self.n_tokens)
+
+    def load_state(self, state: StubState):
+        self.input_ids = list(state.input_ids)
+
+    def detokenize(self, tokens: list[int]) -> bytes:
+        return "".join(chr(token) for token in tokens if token != 1).encode("utf-8")
+
+    @staticmethod
+    def _render(prompt: str) -> str:
+        """プロンプト中の入力文から決定的な応答を作る"""
+        text = prompt.split("入力文:\n", 1)[-1].split("\n\nJSON形式で", 1)[0]
+        return json.dumps(lexicon.analyze(text).to_result(), ensure_ascii=False)
+
+    def _generate(self, prompt: str | list[int], max_tokens: int, stopping_criteria):
+        # llama-cpp-python と同様にトークン列のプロンプトはそのまま使う
+        if isinstance(prompt, list):
+            tokens, prompt = prompt, self.detokenize(prompt).decode("utf-8")
+        else:
+            tokens = self.tokenize(prompt.encode("utf-8"), special=True)
+
+        # 前回の入力との共通部分は評価しない（llama-cpp-python と同じ挙動）
+        common = 0
+        for cached, token in zip(self.input_ids, tokens):
+            if cached != token:
+                break
+            common += 1
+        self.input_ids = self.input_ids[:common]
+        self.eval(tokens[common:])
+
+        for ch in self._render(prompt)[:max_tokens]:
+            if stopping_criteria is not None and any(
+                criteria(self.input_ids, None) for criteria in stopping_criteria
+            ):
+                return
+            time.sleep(self.decode_seconds_per_token)
+            self.input_ids.append(ord(ch))
+            yield ch
+
+    def __call__(self, prompt: str | list[int], max_tokens: int = 16, stream: bool = False,
+                 stopping_criteria=None, **kwargs):
+        pieces = self._generate(prompt, max_tokens, stopping_criteria)
+        if stream:
+            return ({"choices": [{"text": piece}]} for piece in pieces)
+        return {"choices": [{"text": "".join(pieces)}]}
+
+
+def create_stub_model_file() -> str:
+    """スタブ用のダミーモデルファイル（識別ハッシュの計算用）"""
+    path = os.path.join(tempfile.gettempdir(), "mcapp-benchmark-stub.gguf")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(b"GGUF-benchmark-stub")
+    return path
+
+
+# =========================
+# 集計
+# =========================
+def percentile(values: list[float], q: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """平均・p50・p95・p99・最大"""
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "mean": statistics.fmean(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+# =========================
+# InferenceManager の計測
+# =========================
+async def benchmark_manager(manager: InferenceManager, corpus: list[str] = CORPUS) -> dict[str, Any]:
+    """
+    コーパスを1件ずつストリーミング推論し、TTFT・プロンプト評価速度・デコード速度を計測
+
+    Args:
+        manager: 読み込み済みの推論マネージャー
+        corpus: 入力文のリスト
+
+    Returns:
+        dict: 各指標の要約
+    """
+    llm = manager.llm
+    n_prefix = len(llm.tokenize(PROMPT_PREFIX.encode("utf-8"), add_bos=True, special=True))
+
+    ttfts, prompt_tps, decode_tps, totals = [], [], [], []
+    for text in corpus:
+        prompt = build_advice_prompt(text)
+        n_prompt = len(llm.tokenize(prompt.render().encode("utf-8"), add_bos=True, special=True))
+        tokens_before = manager.get_stats()["generated_tokens"]
+
+        started_at = time.perf_counter()
+        first_at = None
+        async for _ in manager.generate_stream(
+            prompt=prompt,
+            grammar=ADVICE_OUTPUT_GRAMMAR,
+            **ADVICE_GENERATION_PARAMS
+        ):
+            if first_at is None:
+                first_at = time.perf_counter()
+        finished_at = time.perf_counter()
+
+        n_generated = manager.get_stats()["generated_tokens"] - tokens_before
+        if first_at is None or n_generated == 0:
+            continue
+
+        ttft = first_at - started_at
+        ttfts.append(ttft)
+        totals.append(finished_at - started_at)
+        # プレフィックスはKV状態を再利用するため、実際に評価するのはユーザー入力部分のみ
+        prompt_tps.append(max(1, n_prompt - n_prefix) / ttft)
+        if n_generated > 1 and finished_at > first_at:
+            decode_tps.append((n_generated - 1) / (finished_at - first_at))
+
+    return {
+        "requests": len(corpus),
+        "completed": len(ttfts),
+        "ttft_seconds": summarize(ttfts),
+        "total_seconds": summarize(totals),
+        "prompt_eval_tokens_per_second": summarize(prompt_tps),
+        "decode_tokens_per_second": summarize(decode_tps),
+    }
+
+
+# =========================
+# エンドポイントの計測
+# =========================
+def classify_response(response: httpx.Response) -> str:
+    """レスポンスを ok / timeout / error / rejected に分類"""
+    if response.status_code in (429, 503):
+        return "rejected"
+    if response.status_code != 200:
+        return "error"
+    advice = response.json().get("advice")
+    if advice == TIMEOUT_ADVICE:
+        return "timeout"
+    if advice in (SYSTEM_ERROR_ADVICE, PARSE_ERROR_ADVICE):
+        return "error"
+    return "ok"
+
+
+async def benchmark_endpoint(client: httpx.AsyncClient, concurrency: int,
+                             n_requests: int, corpus: list[str] = CORPUS) -> dict[str, Any]:
+    """
+    /generate を指定の同時接続数で呼び出し、レイテンシ分布とスループットを計測
+
+    Args:
+        client: 計測対象に接続済みのクライアント
+        concurrency: 同時接続数
+        n_requests: 総リクエスト数
+        corpus: 入力文のリスト（順番に使用）
+
+    Returns:
+        dict: レイテンシの要約・スループット・結果の内訳
+    """
+    n_requests = max(n_requests, concurrency * 2)
+    latencies: list[float] = []
+    outcomes = {"ok": 0, "timeout": 0, "error": 0, "rejected": 0}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < n_requests:
+            index = next_index
+            next_index += 1
+            started_at = time.perf_counter()
+            try:
+                response = await client.post("/generate", json={"text": corpus[index % len(corpus)]})
+                outcome = classify_response(response)
+            except httpx.TimeoutException:
+                outcome = "timeout"
+            except httpx.HTTPError:
+                outcome = "error"
+            outcomes[outcome] += 1
+            if outcome == "ok":
+                latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "latency_seconds": summarize(latencies),
+        "throughput_rps": outcomes["ok"] / elapsed if elapsed > 0 else 0.0,
+        "outcomes": outcomes,
+        "error_rate": (outcomes["error"] + outcomes["timeout"]) / n_requests,
+        "timeout_rate": outcomes["timeout"] / n_requests,
+    }
+
+
+async def run_endpoint_benchmarks(client: httpx.AsyncClient, levels: list[int], n_requests: int) -> dict[str, Any]:
+    """同時接続数ごとに /generate を計測"""
+    results = {}
+    for level in levels:
+        logger.info(f"🏁 /generate 計測: 同時接続数={level}")
+        results[str(level)] = await benchmark_endpoint(client, level, n_requests)
+    return results
+
+
+# =========================
+# 前回結果との比較
+# =========================
+# (指標のパス, 大きいほど良いか)
+REGRESSION_METRICS = [
+    (("manager", "ttft_seconds", "p50"), False),
+    (("manager", "prompt_eval_tokens_per_second", "p50"), True),
+    (("manager", "decode_tokens_per_second", "p50"), True),
+]
+
+
+def _lookup(result: dict, path: tuple) -> float | None:
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline: dict, current: dict, tolerance: float = BENCHMARK_TOLERANCE) -> list[str]:
+    """
+    前回結果と比較して劣化した指標を列挙
+
+    Args:
+        baseline: 前回の結果JSON
+        current: 今回の結果JSON
+        tolerance: 劣化とみなす変化率
+
+    Returns:
+        list[str]: 劣化した指標の説明
+    """
+    metrics = list(REGRESSION_METRICS)
+    for level in current.get("endpoint", {}):
+        metrics.append((("endpoint", level, "latency_seconds", "p95"), False))
+        metrics.append((("endpoint", level, "throughput_rps"), True))
+
+    regressions = []
+    for path, higher_is_better in metrics:
+        before, after = _lookup(baseline, path), _lookup(current, path)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{'.'.join(path)}: {before:.4f} → {after:.4f} ({change:+.1%})")
+    return regressions
+
+
+# =========================
+# 実行
+# =========================
+async def run(args) -> dict[str, Any]:
+    """引数に従って計測し、結果JSONを返す"""
+    result: dict[str, Any] = {
+        "format": RESULT_FORMAT_VERSION,
+        "created_at": time.time(),
+        "platform": platform.platform(),
+        "backend": "remote" if args.url else ("stub" if args.stub else "gguf"),
+        "corpus_size": len(CORPUS),
+    }
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            result["endpoint"] = await run_endpoint_benchmarks(client, args.concurrency, args.requests)
+        return result
+
+    if args.stub:
+        manager = InferenceManager(create_stub_model_file(), pool_size=args.pool_size or 2, llama_factory=StubLlama)
+    else:
+        if not args.model:
+            raise SystemExit("モデルパスが設定されていません。--model で指定するか --stub を使用してください。")
+        manager = InferenceManager(args.model, pool_size=args.pool_size)
+
+    manager.load(warmup=build_warmup_request())
+    result["model_fingerprint"] = manager.model_fingerprint
+    result["pool_size"] = manager.pool_size
+
+    try:
+        logger.info("🏁 InferenceManager 計測")
+        result["manager"] = await benchmark_manager(manager)
+
+        if not args.skip_endpoint:
+            # 計測用のマネージャーをアプリの既定モデルとして登録し、同一プロセスで呼び出す
+            import ai_model
+            from main import app
+            from model_registry import get_model_registry
+
+            get_model_registry().attach("benchmark", manager)
+            # 同じ入力の繰り返しがキャッシュに当たらないよう結果キャッシュを外す
+            ai_model.result_cache = None
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+                result["endpoint"] = await run_endpoint_benchmarks(client, args.concurrency, args.requests)
+    finally:
+        manager.shutdown()
+
+    return result
+
+
+def main():
+    """コマンドラインからベンチマークを実行"""
+    from logging_config import setup_logging
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="推論ベンチマーク（TTFT・tokens/sec・テイルレイテンシ）")
+    parser.add_argument("--model", default=MODEL_PATH, help="モデルファイルのパス")
+    parser.add_argument("--stub", action="store_true", help="GGUFの代わりに決定的なスタブを使う")
+    parser.add_argument("--url", help="起動中のサーバーのURL（指定時はエンドポイントのみ計測）")
+    parser.add_argument("--pool-size", type=int, default=None, help="コンテキスト数（省略時は自動）")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")],
+                        default=BENCHMARK_CONCURRENCY, help="同時接続数（カンマ区切り）")
+    parser.add_argument("--requests", type=int, default=BENCHMARK_REQUESTS, help="同時接続数ごとのリクエスト数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--skip-endpoint", action="store_true", help="エンドポイントの計測を省略")
+    parser.add_argument("--output", help="結果JSONの保存先")
+    parser.add_argument("--baseline", help="比較する前回の結果JSON")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE, help="劣化とみなす変化率")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), result, args.tolerance)
+        if regressions:
+            print("\n⚠️ 劣化した指標:")
+            for line in regressions:
+                print(f"  - {line}")
+            raise SystemExit(1)
+        print("\n✅ 劣化なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 # backend/config.py（新規・完全版）
 
+import hashlib
 import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 # アプリケーション情報
@@ -11,6 +13,8 @@ APP_NAME = "MCApp"
 # APIサーバー設定
 API_HOST = "127.0.0.1"
 API_PORT = 8000
+# APIのワーカープロセス数（2以上の場合、推論は別プロセスの推論デーモンで行う）
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
 
 def get_base_dir():
     """
@@ -48,6 +52,27 @@ def get_app_data_dir():
     
     return app_dir
 
+# 推論コンテキストのトークン数（プロンプトはこの範囲に収まるよう組み立てる）
+INFERENCE_N_CTX = int(os.getenv("INFERENCE_N_CTX", "2048"))
+
+# 既定のモデルファイル名
+DEFAULT_MODEL_NAME = "gemma-2-2b-jpn-it-Q4_K_M.gguf"
+
+def get_model_dirs():
+    """
+    モデルファイルを探すディレクトリ（優先順位順）
+    
+    Returns:
+        list[Path]: ディレクトリのリスト
+    """
+    base_dir = get_base_dir()
+    return [
+        get_app_data_dir() / 'models',  # 優先順位1: %LOCALAPPDATA%\MyOllamaApp\models
+        base_dir / 'models',            # 優先順位2: 実行ファイルと同じ場所の models/
+        base_dir.parent / 'models',     # 優先順位3: 一つ上の models/（開発環境用）
+        Path.cwd() / 'models',          # 優先順位4: カレントディレクトリの models/
+    ]
+
 def get_model_path():
     """
     モデルファイルのパスを取得（優先順位付き）
@@ -58,23 +83,12 @@ def get_model_path():
     Raises:
         FileNotFoundError: モデルファイルが見つからない場合
     """
-    base_dir = get_base_dir()
-    app_data_dir = get_app_data_dir()
-    
     # モデルファイル名
-    model_name = "gemma-2-2b-jpn-it-Q4_K_M.gguf"
-    
-    # 優先順位1: %LOCALAPPDATA%\MyOllamaApp\models
-    localappdata_model = app_data_dir / 'models' / model_name
+    model_name = DEFAULT_MODEL_NAME
     
-    # 優先順位2: 実行ファイルと同じ場所の models/
-    local_model = base_dir / 'models' / model_name
-    
-    # 優先順位3: 一つ上の models/（開発環境用）
-    dev_model = base_dir.parent / 'models' / model_name
-    
-    # 優先順位4: カレントディレクトリの models/
-    current_model = Path.cwd() / 'models' / model_name
+    localappdata_model, local_model, dev_model, current_model = (
+        model_dir / model_name for model_dir in get_model_dirs()
+    )
     
     # 順番に確認
     for model_path in [localappdata_model, local_model, dev_model, current_model]:
@@ -97,6 +111,34 @@ def get_model_path():
     """
     raise FileNotFoundError(error_msg)
 
+@lru_cache(maxsize=None)
+def get_model_fingerprint(model_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    モデルファイルの識別ハッシュを取得
+
+    数GBのファイル全体をハッシュすると起動が遅くなるため、
+    ファイルサイズ・先頭・末尾のチャンクから計算する。
+
+    Args:
+        model_path (str): モデルファイルのパス
+        chunk_size (int): 読み込むチャンクサイズ（バイト）
+
+    Returns:
+        str: 16桁のハッシュ文字列
+    """
+    path = Path(model_path)
+    size = path.stat().st_size
+
+    digest = hashlib.sha256()
+    digest.update(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            digest.update(f.read(chunk_size))
+
+    return digest.hexdigest()[:16]
+
 def get_database_url():
     """
     データベースURLを取得
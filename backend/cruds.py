@@ -1,16 +1,27 @@
 import json
+import logging
 
 from sqlalchemy.orm import Session
 
 from models import Conversation
 from schemas import ConversationCreate
+from wc_aggregates import add_counts, count_words, day_bucket
+
+logger = logging.getLogger(__name__)
 
 
 # =============================
 # 会話履歴関連
 # =============================
 def create_conversation(db: Session, conversation: ConversationCreate):
-    """会話を保存（listをJSON文字列に変換）"""
+    """会話を保存（listをJSON文字列に変換し、ワードクラウドの集計にも加算）"""
+    try:
+        counts = count_words(conversation.ai_response_words)
+    except Exception as e:
+        # 集計は wc_aggregates.py --rebuild で作り直せるため、会話の保存は続ける
+        logger.warning(f"⚠️ ワードクラウド集計用の単語抽出失敗: {e}")
+        counts = None
+
     db_conversation = Conversation(
         user_id=conversation.user_id,
         user_input=conversation.user_input,
@@ -18,6 +29,10 @@ def create_conversation(db: Session, conversation: ConversationCreate):
         ai_response_advice=conversation.ai_response_advice
     )
     db.add(db_conversation)
+    db.flush()
+    if counts:
+        db.refresh(db_conversation)  # created_at（DB側の既定値）で集計する日を決める
+        add_counts(db, conversation.user_id, day_bucket(db_conversation.created_at), counts)
     db.commit()
     db.refresh(db_conversation)
     return db_conversation
@@ -1,19 +1,33 @@
 # backend/database.py（修正版）
 
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import logging
 from config import DATABASE_URL
+import metrics
 
 logger = logging.getLogger(__name__)
 
 logger.info(f"📊 データベース接続: {DATABASE_URL}")
 
+class TimedQueuePool(QueuePool):
+    """接続の取得待ち時間をメトリクスに記録するコネクションプール"""
+    
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.DB_CHECKOUT.observe(time.perf_counter() - started_at)
+
 # SQLite用のエンジン作成
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False},  # SQLite用（マルチスレッド対応）
+    poolclass=TimedQueuePool,  # 接続取得時間を計測
     echo=False  # 本番環境ではFalse推奨
 )
 
@@ -28,9 +42,13 @@ def init_db():
     logger.info("🔄 データベース初期化中...")
     try:
         # models.pyのクラス定義からテーブルを自動作成
-        from models import Conversation  # noqa: F401
+        from models import AdviceCacheEntry, Conversation, WordFrequency  # noqa: F401
         
         Base.metadata.create_all(bind=engine)
+        # create_all は既存テーブルに後から追加したインデックスを作らないため個別に作成
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
         logger.info("✅ データベース初期化完了")
     except Exception as e:
         logger.error(f"❌ データベース初期化エラー: {e}")
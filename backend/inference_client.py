@@ -0,0 +1,494 @@
+# backend/inference_client.py（新規）
+#
+# INFERENCE_MODE=daemon のとき、API ワーカーから推論デーモンを
+# InferenceManager / ModelRegistry と同じ形で使うためのクライアント
+
+import asyncio
+import itertools
+import logging
+import os
+
+from inference_manager import InferenceCancelledError, ModelNotReadyError
+from inference_protocol import (
+    CANCEL,
+    CHUNK,
+    ERROR,
+    HELLO,
+    INFERENCE_DAEMON_HOST,
+    INFERENCE_DAEMON_PORT,
+    INFERENCE_DAEMON_TOKEN,
+    INTERN_MIN_CHARS,
+    REQUEST,
+    RESULT,
+    ProtocolError,
+    encode_frame,
+    read_frame,
+    ref_id,
+)
+from model_registry import ModelBudgetError, UnknownModelError
+from prompt_builder import PromptBudgetError, TemplatePrompt
+from scheduler import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# デーモンの状態を取得する間隔（秒。/health や受付可否の判定に使う）
+INFERENCE_DAEMON_STATUS_INTERVAL = float(os.getenv("INFERENCE_DAEMON_STATUS_INTERVAL", "1"))
+# 接続・認証のタイムアウト（秒）
+INFERENCE_DAEMON_CONNECT_TIMEOUT = float(os.getenv("INFERENCE_DAEMON_CONNECT_TIMEOUT", "3"))
+# デーモン再起動中に返す Retry-After（秒）
+DAEMON_UNAVAILABLE_RETRY_AFTER = 5
+# 推論のタイムアウトはデーモン側で判定し、応答が届かない場合に備えてこの秒数だけ長く待つ
+RPC_TIMEOUT_MARGIN = 5.0
+
+
+class DaemonUnavailableError(ModelNotReadyError):
+    """推論デーモンに接続できない（起動中・再起動中）"""
+
+    def __init__(self, message: str):
+        super().__init__(message, retry_after=DAEMON_UNAVAILABLE_RETRY_AFTER)
+
+
+def decode_error(payload: dict) -> Exception:
+    """ERROR フレームの本文を例外に戻す（API の応答コードの判定に使う型を復元）"""
+    name = payload.get("type")
+    message = payload.get("message", "")
+    retry_after = payload.get("retry_after")
+
+    if name == "QueueFullError":
+        return QueueFullError(message, retry_after or 1)
+    if name in ("ModelNotReadyError", "DaemonUnavailableError"):
+        return ModelNotReadyError(message, retry_after or DAEMON_UNAVAILABLE_RETRY_AFTER)
+    simple = {
+        "UnknownModelError": UnknownModelError,
+        "ModelBudgetError": ModelBudgetError,
+        "PromptBudgetError": PromptBudgetError,
+        "InferenceCancelledError": InferenceCancelledError,
+        "TimeoutError": TimeoutError,
+    }
+    return simple.get(name, RuntimeError)(message)
+
+
+class InferenceClient:
+    """
+    推論デーモンへの接続（API ワーカーごとに1つ）
+
+    - 1つの接続で複数のリクエストを多重化し、リクエストIDで応答を振り分ける
+    - 接続が切れたら次のリクエストで再接続する（デーモンの再起動中は DaemonUnavailableError）
+    - デーモンの状態を定期的に取得してキャッシュし、is_ready などの同期的な参照に使う
+    """
+
+    def __init__(self, host: str = INFERENCE_DAEMON_HOST, port: int = INFERENCE_DAEMON_PORT,
+                 token: str = INFERENCE_DAEMON_TOKEN):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.loop: asyncio.AbstractEventLoop | None = None
+        # 最後に取得したデーモンの状態（未接続なら None）
+        self.status: dict | None = None
+
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: dict[int, asyncio.Queue] = {}
+        self._request_ids = itertools.count(1)
+        # この接続で送信済みの参照渡しの値
+        self._sent_refs: set[str] = set()
+        self._connect_lock: asyncio.Lock | None = None
+        self._status_task: asyncio.Task | None = None
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def start(self) -> None:
+        """状態の定期取得を開始（API ワーカーの起動時に呼ぶ）"""
+        self.loop = asyncio.get_running_loop()
+        self._connect_lock = asyncio.Lock()
+        self._status_task = asyncio.create_task(self._poll_status())
+
+    async def close(self) -> None:
+        if self._status_task is not None:
+            self._status_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _poll_status(self) -> None:
+        was_available = True
+        while True:
+            try:
+                self.status = await self.call("status", timeout=INFERENCE_DAEMON_STATUS_INTERVAL * 5)
+                was_available = True
+            except Exception as e:
+                self.status = None
+                if was_available:
+                    logger.warning(f"⚠️ 推論デーモンの状態を取得できません: {e}")
+                was_available = False
+            await asyncio.sleep(INFERENCE_DAEMON_STATUS_INTERVAL)
+
+    async def _connect(self) -> None:
+        """未接続なら接続して認証"""
+        if self.connected:
+            return
+        async with self._connect_lock:
+            if self.connected:
+                return
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), timeout=INFERENCE_DAEMON_CONNECT_TIMEOUT
+                )
+                writer.write(encode_frame(HELLO, 0, {"token": self.token}))
+                await writer.drain()
+                frame_type, _, payload = await asyncio.wait_for(
+                    read_frame(reader), timeout=INFERENCE_DAEMON_CONNECT_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ProtocolError) as e:
+                raise DaemonUnavailableError(f"推論デーモンに接続できません: {e}") from e
+            if frame_type != RESULT:
+                writer.close()
+                raise DaemonUnavailableError("推論デーモンの認証に失敗しました")
+
+            self._writer = writer
+            self._sent_refs = set()
+            asyncio.create_task(self._read_loop(reader, writer))
+            logger.info(f"🔌 推論デーモンに接続しました (pid={payload.get('pid')})")
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """応答を受信してリクエストごとのキューに振り分ける"""
+        try:
+            while True:
+                frame_type, request_id, payload = await read_frame(reader)
+                queue = self._pending.get(request_id)
+                if queue is not None:
+                    queue.put_nowait((frame_type, payload))
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError, ValueError) as e:
+            logger.warning(f"⚠️ 推論デーモンとの接続が切れました: {e}")
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            # 応答待ちのリクエストにはすべて接続断を通知
+            for queue in self._pending.values():
+                queue.put_nowait((ERROR, {
+                    "type": "DaemonUnavailableError",
+                    "message": "推論デーモンとの接続が切れました",
+                }))
+
+    def intern(self, value, defs: dict):
+        """
+        大きな値を参照渡しにする
+
+        値は defs に集め、送信時にこの接続で未送信のものだけを一緒に送る
+        （送信前に再接続した場合も、新しい接続に改めて定義が送られる）。
+        """
+        if not isinstance(value, dict) and not (isinstance(value, str) and len(value) >= INTERN_MIN_CHARS):
+            return value
+        key = ref_id(value)
+        defs[key] = value
+        return {"$ref": key}
+
+    async def _start(self, op: str, payload: dict, defs: dict | None) -> tuple[int, asyncio.Queue]:
+        """リクエストを送信して応答用のキューを登録"""
+        await self._connect()
+        request_id = next(self._request_ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[request_id] = queue
+
+        # 接続後は送信まで await を挟まないため、参照渡しの定義は必ず参照より先に届く
+        new_defs = {key: value for key, value in (defs or {}).items() if key not in self._sent_refs}
+        self._writer.write(encode_frame(REQUEST, request_id, {"op": op, "defs": new_defs, **payload}))
+        self._sent_refs.update(new_defs)
+        return request_id, queue
+
+    def _finish(self, request_id: int, done: bool) -> None:
+        """応答待ちを解除（完了前にやめた場合はデーモン側の処理も取り消す）"""
+        self._pending.pop(request_id, None)
+        if not done and self.connected:
+            self._writer.write(encode_frame(CANCEL, request_id, {}))
+
+    async def call(self, op: str, payload: dict | None = None, defs: dict | None = None,
+                   timeout: float | None = None) -> dict:
+        """
+        操作を1回実行して結果を受け取る
+
+        Raises:
+            DaemonUnavailableError: デーモンに接続できない場合
+            TimeoutError: timeout 秒以内に応答がない場合
+            Exception: デーモン側の例外（型を復元したもの）
+        """
+        request_id, queue = await self._start(op, payload or {}, defs)
+        done = False
+        try:
+            frame_type, body = await asyncio.wait_for(queue.get(), timeout=timeout)
+            done = True
+            if frame_type == ERROR:
+                raise decode_error(body)
+            return body
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"推論デーモンが{timeout}秒以内に応答しませんでした") from None
+        finally:
+            self._finish(request_id, done)
+
+    async def stream(self, op: str, payload: dict, defs: dict | None = None, timeout: float = 60):
+        """
+        操作を実行して断片を順に受け取る
+
+        Yields:
+            str: CHUNK フレームのテキスト
+        """
+        request_id, queue = await self._start(op, payload, defs)
+        deadline = self.loop.time() + timeout
+        done = False
+        try:
+            while True:
+                try:
+                    frame_type, body = await asyncio.wait_for(
+                        queue.get(), timeout=max(0.0, deadline - self.loop.time())
+                    )
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"推論デーモンが{timeout}秒以内に応答しませんでした") from None
+                if frame_type == CHUNK:
+                    yield body
+                    continue
+                done = True
+                if frame_type == ERROR:
+                    raise decode_error(body)
+                return
+        finally:
+            self._finish(request_id, done)
+
+    def call_sync(self, op: str, payload: dict | None = None, timeout: float = 30) -> dict:
+        """
+        別スレッド（同期エンドポイントのスレッドプールなど）から操作を実行
+
+        Raises:
+            RuntimeError: イベントループのスレッドから呼んだ場合
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("call_sync はイベントループのスレッドからは呼べません")
+        if self.loop is None:
+            raise DaemonUnavailableError("推論デーモンのクライアントが開始されていません")
+        future = asyncio.run_coroutine_threadsafe(self.call(op, payload, timeout=timeout), self.loop)
+        return future.result(timeout + 1)
+
+
+class RemoteScheduler:
+    """デーモン上のスケジューラの状態（受付可否の事前確認用）"""
+
+    def __init__(self, manager: "RemoteInferenceManager"):
+        self.manager = manager
+
+    def is_full(self) -> bool:
+        snapshot = self.manager.snapshot()
+        return bool(snapshot and snapshot["queue_full"])
+
+    def estimate_retry_after(self) -> int:
+        snapshot = self.manager.snapshot()
+        return snapshot["retry_after"] if snapshot else DAEMON_UNAVAILABLE_RETRY_AFTER
+
+    def qsize(self) -> int:
+        snapshot = self.manager.snapshot()
+        return snapshot["stats"]["scheduler"]["queued"] if snapshot else 0
+
+    def get_stats(self) -> dict | None:
+        snapshot = self.manager.snapshot()
+        return snapshot["stats"]["scheduler"] if snapshot else None
+
+
+class RemoteInferenceManager:
+    """推論デーモン上の1モデルを InferenceManager と同じ形で扱う"""
+
+    def __init__(self, client: InferenceClient, model_id: str | None):
+        self.client = client
+        self.model_id = model_id
+        self.scheduler = RemoteScheduler(self)
+
+    def snapshot(self) -> dict | None:
+        """最後に取得したこのモデルの状態（未読み込み・未接続なら None）"""
+        status = self.client.status
+        if status is None:
+            return None
+        return status["managers"].get(self.model_id or status["default_id"])
+
+    @property
+    def model_fingerprint(self) -> str:
+        """
+        モデルファイルの識別ハッシュ（結果キャッシュのキーに使用）
+
+        Raises:
+            DaemonUnavailableError: デーモンの状態をまだ取得できていない場合
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            raise DaemonUnavailableError("推論デーモンのモデル情報を取得できていません")
+        return snapshot["model_fingerprint"]
+
+    @property
+    def pool_size(self) -> int:
+        snapshot = self.snapshot()
+        return snapshot["pool_size"] if snapshot else 1
+
+    @property
+    def state(self) -> str:
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            return snapshot["status"]["state"]
+        return "unloaded" if self.client.status is not None else "unavailable"
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def progress(self) -> float:
+        snapshot = self.snapshot()
+        return snapshot["status"]["progress"] if snapshot else 0.0
+
+    def get_status(self) -> dict:
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            return snapshot["status"]
+        detail = "" if self.client.status is not None else "推論デーモンに接続していません"
+        return {"state": self.state, "progress": 0.0, "detail": detail, "error": None}
+
+    def get_stats(self) -> dict | None:
+        snapshot = self.snapshot()
+        return snapshot["stats"] if snapshot else None
+
+    def _encode(self, prompt, timeout: float, user_id: int | None, kwargs: dict) -> tuple[dict, dict]:
+        """推論リクエストの本文と参照渡しの定義"""
+        defs: dict = {}
+        if isinstance(prompt, TemplatePrompt):
+            template = prompt.template
+            encoded_prompt = {
+                "template": self.client.intern({
+                    "name": template.name,
+                    "prefix": template.prefix,
+                    "before_input": template.before_input,
+                    "after_input": template.after_input,
+                    "version": template.version,
+                }, defs),
+                "user_text": prompt.user_text,
+            }
+        else:
+            encoded_prompt = self.client.intern(prompt, defs)
+        payload = {
+            "model": self.model_id,
+            "prompt": encoded_prompt,
+            "timeout": timeout,
+            "user_id": user_id,
+            "kwargs": {key: self.client.intern(value, defs) for key, value in kwargs.items()},
+        }
+        return payload, defs
+
+    async def generate(self, prompt, timeout: int = 60, user_id: int | None = None, **kwargs) -> str:
+        """InferenceManager.generate と同じ（タイムアウトはデーモン側で判定）"""
+        payload, defs = self._encode(prompt, timeout, user_id, kwargs)
+        result = await self.client.call("generate", payload, defs, timeout=timeout + RPC_TIMEOUT_MARGIN)
+        return result["text"]
+
+    async def generate_stream(self, prompt, timeout: int = 60, user_id: int | None = None, **kwargs):
+        """InferenceManager.generate_stream と同じ（タイムアウトはデーモン側で判定）"""
+        payload, defs = self._encode(prompt, timeout, user_id, kwargs)
+        async for chunk in self.client.stream("stream", payload, defs, timeout=timeout + RPC_TIMEOUT_MARGIN):
+            yield chunk
+
+
+class RemoteModelRegistry:
+    """推論デーモン上の ModelRegistry を同じ形で扱う"""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+        self.warmup = None  # ウォームアップはデーモン側で行う
+        self._managers: dict[str | None, RemoteInferenceManager] = {}
+        self._loading: set[str] = set()
+
+    @property
+    def default_id(self) -> str | None:
+        return self.client.status["default_id"] if self.client.status else None
+
+    def _known_model_ids(self) -> set[str] | None:
+        status = self.client.status
+        return {info["id"] for info in status["models"]} if status else None
+
+    async def _load(self, model_id: str) -> None:
+        try:
+            await self.client.call("load", {"model": model_id}, timeout=30)
+        except Exception as e:
+            logger.warning(f"⚠️ モデルの読み込み要求に失敗: {model_id}: {e}")
+        finally:
+            self._loading.discard(model_id)
+
+    def get_manager(self, model_id: str | None = None) -> RemoteInferenceManager:
+        """
+        モデルの推論マネージャーを取得（未読み込みならデーモンに読み込みを要求）
+
+        イベントループ上から呼ばれた場合は読み込み要求を待たずに返す。
+        スレッドプールから呼ばれた場合は要求の結果（予算超過など）を待つ。
+
+        Raises:
+            UnknownModelError: デーモンが把握していないモデルの場合
+            ModelBudgetError: メモリ予算内に読み込めない場合（スレッドから呼んだ場合のみ）
+        """
+        known = self._known_model_ids()
+        if model_id is not None and known is not None and model_id not in known:
+            raise UnknownModelError(f"モデルが見つかりません: {model_id}")
+
+        manager = self._managers.get(model_id)
+        if manager is None:
+            manager = self._managers[model_id] = RemoteInferenceManager(self.client, model_id)
+
+        if model_id is not None and manager.snapshot() is None and model_id not in self._loading:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                self.client.call_sync("load", {"model": model_id})
+            else:
+                self._loading.add(model_id)
+                asyncio.ensure_future(self._load(model_id))
+        return manager
+
+    def refresh(self) -> None:
+        """モデル一覧の再探索はデーモン側で list_models() と同時に行う"""
+
+    def list_models(self) -> list[dict]:
+        """検出済みモデルの一覧（スレッドプールから呼ぶ）"""
+        return self.client.call_sync("models")["models"]
+
+    def get_stats(self) -> dict | None:
+        return self.client.status["registry"] if self.client.status else None
+
+    def shutdown(self) -> None:
+        """デーモンはスーパーバイザーが停止する"""
+
+
+# グローバルインスタンス
+inference_client: InferenceClient | None = None
+remote_registry: RemoteModelRegistry | None = None
+
+
+def get_inference_client() -> InferenceClient:
+    """InferenceClientのシングルトン取得"""
+    global inference_client
+    if inference_client is None:
+        # 単一ワーカーでは DaemonSupervisor.export_env() がインポート後に設定するため、
+        # モジュール読み込み時の値ではなく現在の環境変数を読む
+        inference_client = InferenceClient(
+            host=os.getenv("INFERENCE_DAEMON_HOST", INFERENCE_DAEMON_HOST),
+            port=int(os.getenv("INFERENCE_DAEMON_PORT", str(INFERENCE_DAEMON_PORT))),
+            token=os.getenv("INFERENCE_DAEMON_TOKEN", INFERENCE_DAEMON_TOKEN),
+        )
+    return inference_client
+
+
+def get_remote_registry() -> RemoteModelRegistry:
+    """RemoteModelRegistryのシングルトン取得"""
+    global remote_registry
+    if remote_registry is None:
+        remote_registry = RemoteModelRegistry(get_inference_client())
+    return remote_registry
@@ -0,0 +1,365 @@
+# backend/inference_daemon.py（新規）
+#
+# 推論エンジンを API とは別のプロセスで動かす
+#
+#   - 推論デーモン: モデルを1つだけ読み込み、ローカルTCPで複数の API ワーカーから
+#     推論を受け付ける（通信形式は inference_protocol.py）
+#   - DaemonSupervisor: API の親プロセスでデーモンを起動し、異常終了したら
+#     待ち時間を倍にしながら再起動する
+#
+# 通常は main.py が INFERENCE_MODE=daemon のときにスーパーバイザー経由で起動する。
+#   python main.py --inference-daemon --port 50123
+
+import argparse
+import asyncio
+import hmac
+import logging
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from threading import Event, Thread
+
+import psutil
+
+from inference_protocol import (
+    CANCEL,
+    CHUNK,
+    ERROR,
+    HELLO,
+    INFERENCE_DAEMON_HOST,
+    INFERENCE_DAEMON_PORT,
+    REQUEST,
+    RESULT,
+    ProtocolError,
+    encode_error,
+    encode_frame,
+    read_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 再起動までの待ち時間（初期値・上限, 秒。連続して落ちるたびに倍にする）
+DAEMON_RESTART_BACKOFF = float(os.getenv("DAEMON_RESTART_BACKOFF", "1"))
+DAEMON_RESTART_BACKOFF_MAX = float(os.getenv("DAEMON_RESTART_BACKOFF_MAX", "60"))
+# この秒数以上動き続けたら正常に起動できたとみなし、待ち時間を初期値に戻す
+DAEMON_STABLE_SECONDS = float(os.getenv("DAEMON_STABLE_SECONDS", "60"))
+# 認証フレームを待つ秒数
+HELLO_TIMEOUT = 5.0
+# 親プロセスの生存確認の間隔（秒）
+PARENT_POLL_INTERVAL = 2.0
+
+
+# =========================
+# デーモン本体
+# =========================
+def collect_status() -> dict:
+    """
+    デーモンの状態（API ワーカーが定期的に取得してキャッシュする）
+
+    Returns:
+        dict: 既定モデル・モデル一覧・読み込み済みモデルごとの状態と統計
+    """
+    from model_registry import get_model_registry
+
+    registry = get_model_registry()
+    managers = {}
+    for model_id, manager in registry.loaded_managers():
+        managers[model_id] = {
+            "model_fingerprint": manager.model_fingerprint,
+            "pool_size": manager.pool_size,
+            "status": manager.get_status(),
+            "stats": manager.get_stats(),
+            "queue_full": manager.scheduler.is_full(),
+            "retry_after": manager.scheduler.estimate_retry_after(),
+        }
+    return {
+        "pid": os.getpid(),
+        "default_id": registry.default_id,
+        "models": registry.list_models(),
+        "registry": registry.get_stats(),
+        "managers": managers,
+    }
+
+
+class DaemonConnection:
+    """
+    API ワーカー1つとの接続
+
+    1つの接続で複数のリクエストを同時に扱い、リクエストIDで応答を対応付ける。
+    接続が切れたら実行中の推論はすべてキャンセルする。
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, token: str):
+        self.reader = reader
+        self.writer = writer
+        self.token = token
+        # 参照渡しされた値（ハッシュ -> 値）。接続ごとに保持する
+        self.defs: dict[str, object] = {}
+        self.tasks: dict[int, asyncio.Task] = {}
+        self._write_lock = asyncio.Lock()
+
+    async def send(self, frame_type: int, request_id: int, payload) -> None:
+        data = encode_frame(frame_type, request_id, payload)
+        async with self._write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def serve(self) -> None:
+        """接続の受信ループ"""
+        try:
+            frame_type, _, payload = await asyncio.wait_for(read_frame(self.reader), timeout=HELLO_TIMEOUT)
+            token = payload.get("token", "") if isinstance(payload, dict) else ""
+            if frame_type != HELLO or not hmac.compare_digest(str(token), self.token):
+                logger.warning("⚠️ 推論デーモンへの接続の認証に失敗しました")
+                return
+            await self.send(RESULT, 0, {"pid": os.getpid()})
+
+            while True:
+                frame_type, request_id, payload = await read_frame(self.reader)
+                if frame_type == REQUEST:
+                    self.defs.update(payload.get("defs") or {})
+                    task = asyncio.create_task(self.handle(request_id, payload))
+                    self.tasks[request_id] = task
+                    task.add_done_callback(lambda _, request_id=request_id: self.tasks.pop(request_id, None))
+                elif frame_type == CANCEL:
+                    task = self.tasks.get(request_id)
+                    if task is not None:
+                        task.cancel()
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # API ワーカーの終了
+        except (ProtocolError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"⚠️ 推論デーモンの接続を閉じます: {e}")
+        finally:
+            for task in list(self.tasks.values()):
+                task.cancel()
+            self.writer.close()
+
+    def resolve(self, value):
+        """{"$ref": ハッシュ} を参照先の値に戻す"""
+        if isinstance(value, dict) and "$ref" in value:
+            return self.defs[value["$ref"]]
+        return value
+
+    def decode_prompt(self, prompt):
+        """文字列またはテンプレート指定のプロンプトを復元"""
+        prompt = self.resolve(prompt)
+        if isinstance(prompt, dict):
+            from prompt_builder import PromptTemplate, TemplatePrompt
+            return TemplatePrompt(PromptTemplate(**self.resolve(prompt["template"])), prompt["user_text"])
+        return prompt
+
+    async def handle(self, request_id: int, payload: dict) -> None:
+        """リクエスト1件を処理して応答を送る"""
+        from inference_manager import get_inference_manager
+        from model_registry import get_model_registry
+        import metrics
+
+        op = payload.get("op")
+        try:
+            if op in ("generate", "stream"):
+                manager = get_inference_manager(model_id=payload.get("model"))
+                params = dict(
+                    prompt=self.decode_prompt(payload["prompt"]),
+                    timeout=payload.get("timeout", 60),
+                    user_id=payload.get("user_id"),
+                    **{key: self.resolve(value) for key, value in (payload.get("kwargs") or {}).items()},
+                )
+                if op == "generate":
+                    result = {"text": await manager.generate(**params)}
+                else:
+                    async for chunk in manager.generate_stream(**params):
+                        await self.send(CHUNK, request_id, chunk)
+                    result = {}
+            elif op == "status":
+                result = collect_status()
+            elif op == "load":
+                await asyncio.to_thread(get_model_registry().get_manager, payload.get("model"))
+                result = {}
+            elif op == "models":
+                registry = get_model_registry()
+                await asyncio.to_thread(registry.refresh)
+                result = {"models": registry.list_models()}
+            elif op == "metrics":
+                result = {"text": metrics.registry.render(include_empty=False)}
+            else:
+                raise ValueError(f"不明な操作です: {op}")
+
+            await self.send(RESULT, request_id, result)
+
+        except asyncio.CancelledError:
+            raise  # 呼び出し側が待機をやめている（応答は不要）
+        except Exception as e:
+            try:
+                await self.send(ERROR, request_id, encode_error(e))
+            except (ConnectionError, RuntimeError):
+                pass
+
+
+async def _watch_parent(parent_pid: int | None) -> None:
+    """親プロセス（スーパーバイザー）が終了するまで待つ"""
+    while True:
+        await asyncio.sleep(PARENT_POLL_INTERVAL)
+        if parent_pid is not None and not psutil.pid_exists(parent_pid):
+            logger.warning("⚠️ 親プロセスが終了したため推論デーモンを停止します")
+            return
+
+
+async def serve(host: str, port: int, token: str, parent_pid: int | None = None) -> None:
+    """
+    推論デーモンを起動し、親プロセスが終了するまで受け付ける
+
+    Args:
+        host: 待ち受けアドレス
+        port: 待ち受けポート
+        token: 接続の認証トークン
+        parent_pid: 親プロセスのPID（終了したらデーモンも止める）
+    """
+    from ai_model import build_warmup_request
+    from inference_manager import get_inference_manager
+
+    # 既定モデルの読み込みを先に開始（完了前の推論には準備中を返す）
+    try:
+        get_inference_manager(warmup=build_warmup_request())
+    except Exception as e:
+        logger.error(f"❌ 推論エンジン初期化失敗: {e}")
+
+    server = await asyncio.start_server(
+        lambda reader, writer: DaemonConnection(reader, writer, token).serve(), host, port
+    )
+    logger.info(f"🛰️ 推論デーモン起動: {host}:{port} (pid={os.getpid()})")
+
+    try:
+        async with server:
+            await _watch_parent(parent_pid)
+    finally:
+        from model_registry import model_registry
+        if model_registry is not None:
+            model_registry.shutdown()
+
+
+def main(argv: list[str] | None = None):
+    """推論デーモンのエントリーポイント（認証トークンは環境変数で受け取る）"""
+    from logging_config import setup_logging
+    setup_logging(log_name="inference_daemon.log")
+
+    parser = argparse.ArgumentParser(description="推論デーモン")
+    parser.add_argument("--host", default=INFERENCE_DAEMON_HOST, help="待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=INFERENCE_DAEMON_PORT, help="待ち受けポート")
+    parser.add_argument("--parent-pid", type=int, default=None, help="終了を監視する親プロセスのPID")
+    args = parser.parse_args(argv)
+
+    token = os.getenv("INFERENCE_DAEMON_TOKEN", "")
+    if not token or not args.port:
+        parser.error("INFERENCE_DAEMON_TOKEN と --port が必要です")
+
+    asyncio.run(serve(args.host, args.port, token, args.parent_pid))
+
+
+# =========================
+# スーパーバイザー
+# =========================
+def find_free_port(host: str) -> int:
+    """空いているポートを1つ選ぶ"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class DaemonSupervisor:
+    """
+    推論デーモンを子プロセスとして起動・監視する
+
+    - API ワーカーより先に start() し、export_env() で接続先を環境変数に設定する
+      （uvicorn のワーカーは環境変数を引き継ぐ）
+    - デーモンが異常終了したら再起動する。すぐに落ち続ける場合は待ち時間を
+      倍にしていき、DAEMON_STABLE_SECONDS 以上動いたら初期値に戻す
+    - 再起動しても同じポート・トークンを使うため、API ワーカーは再接続するだけでよい
+    """
+
+    def __init__(self, host: str = INFERENCE_DAEMON_HOST, port: int = INFERENCE_DAEMON_PORT):
+        self.host = host
+        self.port = port or find_free_port(host)
+        self.token = secrets.token_hex(16)
+        self.process: subprocess.Popen | None = None
+        self.restarts = 0
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def export_env(self) -> None:
+        """API ワーカーがデーモンに接続するための設定を環境変数に設定"""
+        os.environ.update(
+            INFERENCE_MODE="daemon",
+            INFERENCE_DAEMON_HOST=self.host,
+            INFERENCE_DAEMON_PORT=str(self.port),
+            INFERENCE_DAEMON_TOKEN=self.token,
+        )
+
+    def _command(self) -> list[str]:
+        args = [
+            "--inference-daemon",
+            "--host", self.host,
+            "--port", str(self.port),
+            "--parent-pid", str(os.getpid()),
+        ]
+        if getattr(sys, "frozen", False):
+            # PyInstaller でexe化されている場合は同じexeを引数付きで起動
+            return [sys.executable] + args
+        return [sys.executable, str(Path(__file__).with_name("main.py"))] + args
+
+    def _spawn(self) -> subprocess.Popen:
+        # デーモン自身はプロセス内で推論する
+        env = dict(os.environ, INFERENCE_MODE="inprocess", INFERENCE_DAEMON_TOKEN=self.token)
+        return subprocess.Popen(self._command(), env=env)
+
+    def _run(self) -> None:
+        backoff = DAEMON_RESTART_BACKOFF
+        while not self._stop.is_set():
+            started_at = time.monotonic()
+            try:
+                self.process = self._spawn()
+                logger.info(f"🛰️ 推論デーモンを起動しました (pid={self.process.pid}, port={self.port})")
+                returncode = self.process.wait()
+            except Exception as e:
+                logger.error(f"❌ 推論デーモンの起動に失敗しました: {e}")
+                returncode = None
+
+            if self._stop.is_set():
+                return
+
+            if time.monotonic() - started_at >= DAEMON_STABLE_SECONDS:
+                backoff = DAEMON_RESTART_BACKOFF
+            self.restarts += 1
+            logger.error(
+                f"💥 推論デーモンが終了しました (終了コード={returncode})。"
+                f"{backoff:.0f}秒後に再起動します（{self.restarts}回目）"
+            )
+            if self._stop.wait(backoff):
+                return
+            backoff = min(backoff * 2, DAEMON_RESTART_BACKOFF_MAX)
+
+    def start(self) -> None:
+        """監視スレッドを起動（デーモンの起動完了は待たない）"""
+        self._thread = Thread(target=self._run, name="inference-daemon-supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """デーモンを停止（再起動もしない）"""
+        self._stop.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            logger.info("🛑 推論デーモンを停止中...")
+            process.terminate()
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
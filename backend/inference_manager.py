@@ -1,16 +1,43 @@
 # backend/inference_manager.py（新規・完全版）
 
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
+from threading import Event, Lock, Thread
+import queue
+import os
+import time
 import traceback
 import logging
 import psutil
-from llama_cpp import Llama
-from config import MODEL_PATH
+from pathlib import Path
+from llama_cpp import Llama, LlamaGrammar, StoppingCriteriaList
+from autotune import AUTOTUNE_ON_STARTUP, autotune, load_profile
+from config import INFERENCE_N_CTX, get_model_fingerprint
+from inference_protocol import INFERENCE_MODE
+import metrics
+from prefix_cache import PrefixStateCache
+from prompt_builder import PromptBudgetError, PromptBuilder, TemplatePrompt
+from scheduler import InferenceJob, InferenceScheduler, SchedulerClosedError
+from speculative import SPECULATIVE_MODE, SpeculativeStats, create_draft_model
 
 logger = logging.getLogger(__name__)
 
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# コンテキストプール数（0 = CPUコア数・空きメモリから自動決定）
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "0"))
+# 1コンテキストあたりの最小スレッド数（自動決定時に使用）
+MIN_THREADS_PER_CONTEXT = int(os.getenv("MIN_THREADS_PER_CONTEXT", "4"))
+# 1コンテキストあたりのメモリ見積もり（KVキャッシュ + 計算バッファ, MB）
+CONTEXT_MEMORY_MB = int(os.getenv("CONTEXT_MEMORY_MB", "512"))
+# 自動決定時の上限
+MAX_POOL_SIZE = 8
+# モデル準備中に返す Retry-After（秒）
+MODEL_LOADING_RETRY_AFTER = 5
+# コンテキスト再読み込みが失敗したときの再試行間隔（初期値・上限, 秒。失敗ごとに倍にする）
+RELOAD_BACKOFF_SECONDS = float(os.getenv("RELOAD_BACKOFF_SECONDS", "2"))
+RELOAD_BACKOFF_MAX_SECONDS = float(os.getenv("RELOAD_BACKOFF_MAX_SECONDS", "300"))
+
 def get_optimal_threads():
     """
     最適なスレッド数を計算
@@ -55,45 +82,342 @@ def get_optimal_batch_size():
         logger.warning(f"⚠️ メモリ情報取得失敗: {e}. デフォルト値(256)を使用")
         return 256
 
+def get_optimal_pool_size(model_path: str):
+    """
+    CPUコア数と空きメモリからコンテキストプール数を決定
+    
+    重みは mmap で共有されるため、モデル本体は1回分だけ見積もり、
+    コンテキストごとに KVキャッシュ + 計算バッファ分を加算する。
+    
+    Args:
+        model_path (str): モデルファイルのパス
+    
+    Returns:
+        int: コンテキスト数
+    """
+    if INFERENCE_POOL_SIZE > 0:
+        return INFERENCE_POOL_SIZE
+    
+    try:
+        physical_cores = psutil.cpu_count(logical=False) or 2
+        by_cpu = max(1, physical_cores // MIN_THREADS_PER_CONTEXT)
+        
+        model_bytes = os.path.getsize(model_path)
+        available_bytes = psutil.virtual_memory().available - model_bytes
+        by_memory = max(1, int(available_bytes // (CONTEXT_MEMORY_MB * 1024**2)))
+        
+        pool_size = max(1, min(by_cpu, by_memory, MAX_POOL_SIZE))
+        logger.info(f"🧮 コンテキストプール: CPU上限={by_cpu}, メモリ上限={by_memory} → {pool_size}")
+        return pool_size
+    except Exception as e:
+        logger.warning(f"⚠️ プールサイズ決定失敗: {e}. デフォルト値(1)を使用")
+        return 1
+
+class InferenceCancelledError(Exception):
+    """推論がキャンセルされた（タイムアウト・クライアント切断など）"""
+
+class ModelNotReadyError(Exception):
+    """モデルの読み込み・ウォームアップが完了していない"""
+    
+    def __init__(self, message: str, retry_after: int = MODEL_LOADING_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CancelToken:
+    """
+    推論1件分のキャンセル通知
+    
+    llama.cpp の停止条件（トークン生成ごとに呼ばれる）から参照され、
+    キャンセルされると次のトークンで生成を打ち切る。
+    """
+    
+    def __init__(self):
+        self._event = Event()
+        self.reason = None
+        self.generated_tokens = 0
+        self.first_token_at = None  # 最初のトークン生成時刻（デコード速度の計測用）
+    
+    def cancel(self, reason: str = "cancelled"):
+        """キャンセルを通知"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def stopping_criteria(self, input_ids, logits) -> bool:
+        """llama.cpp の停止条件として登録する関数"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.generated_tokens += 1
+        return self._event.is_set()
+
+class ContextSlot:
+    """推論コンテキスト1つ分（Llamaインスタンスと専用のKVキャッシュ）"""
+    
+    def __init__(self, index: int):
+        self.index = index
+        self.llm = None
+        self.error_count = 0
+        # GBNF文字列 -> LlamaGrammar（文法は生成中に状態を持つためコンテキストごとに保持）
+        self.grammars: dict[str, LlamaGrammar] = {}
+        # 推論中は保持する（再読み込み時の差し替えは推論の合間に行う）
+        self.lock = Lock()
+        # ok / reloading（再読み込み中）/ broken（再読み込み失敗、再試行待ち）
+        self.health = "ok"
+        # アイドルキューに戻して推論に使うか（再読み込み中は外す場合がある）
+        self.in_rotation = True
+        self.reload_failures = 0
+        self.last_error: str | None = None
+    
+    def get_grammar(self, gbnf: str):
+        """GBNF文字列からコンパイル済みの文法を取得"""
+        grammar = self.grammars.get(gbnf)
+        if grammar is None:
+            grammar = LlamaGrammar.from_string(gbnf, verbose=False)
+            self.grammars[gbnf] = grammar
+        return grammar
+
 class InferenceManager:
     """推論エンジンの管理・隔離・再初期化"""
     
-    def __init__(self, model_path: str, max_workers: int = 1):
+    def __init__(self, model_path: str, pool_size: int | None = None, llama_factory=Llama):
         """
         InferenceManagerを初期化
         
         Args:
             model_path (str): モデルファイルのパス
-            max_workers (int): ワーカー数（デフォルト: 1）
+            pool_size (int | None): コンテキスト数（None の場合は自動決定）
+            llama_factory (callable): Llamaインスタンスの生成関数（ベンチマークのスタブ差し替え用）
         """
+        if not model_path:
+            raise ValueError("モデルパスが設定されていません")
+        
         self.model_path = model_path
-        self.llm = None
-        self.lock = Lock()
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.error_count = 0
+        self.llama_factory = llama_factory
+        self.model_fingerprint = get_model_fingerprint(model_path)
+        self.model_id = Path(model_path).stem  # メトリクスのラベル
+        self.pool_size = pool_size or get_optimal_pool_size(model_path)
+        self.slots = [ContextSlot(i) for i in range(self.pool_size)]
+        self._idle_slots: queue.Queue = queue.Queue()
+        # 上限付き・ユーザー間で公平な待機キュー（コンテキスト数と同数のワーカーが取り出す）
+        self.scheduler = InferenceScheduler(workers=self.pool_size)
+        self._workers: list[Thread] = []
         self.max_errors = 3  # 3回連続エラーで再初期化
+        self._closing = Event()  # 再読み込みスレッドの停止通知
+        self.n_ctx = INFERENCE_N_CTX
+        self.prefix_cache = None
+        # テンプレートの固定部分のトークン列を保持し、入力文だけをトークン化する
+        self.prompt_builder = PromptBuilder(self.n_ctx)
+        # 自動チューニングのプロファイル（なければ従来の推定値を使用）
+        self.tuning: dict | None = None
+        
+        # 待機時間と推論時間を分けて計測
+        self.stats_lock = Lock()
+        self.stats = {
+            "requests": 0,
+            "queue_wait_seconds": 0.0,
+            "inference_seconds": 0.0,
+            "cancelled_requests": 0,
+            "wasted_tokens": 0,
+            "generated_tokens": 0,
+            "decode_seconds": 0.0,
+        }
+        # 投機的デコードの採用率（全コンテキストの先読みモデルで共有）
+        self.speculative_stats = SpeculativeStats()
+        
+        # 読み込み状態: created / loading / warming / ready / failed / draining
+        self.state = "created"
+        self.progress = 0.0
+        self.state_detail = ""
+        self.load_error = None
+        self.failed_at: float | None = None  # 読み込みに失敗した時刻（time.monotonic）
+        self._loader: Thread | None = None
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+    
+    def _set_state(self, state: str, progress: float, detail: str):
+        """読み込み状態を更新"""
+        self.state = state
+        self.progress = progress
+        self.state_detail = detail
+    
+    def get_status(self):
+        """
+        読み込み状態を取得（/health 用）
+        
+        Returns:
+            dict: state / progress（0.0〜1.0）/ detail / error
+        """
+        return {
+            "state": self.state,
+            "progress": round(self.progress, 3),
+            "detail": self.state_detail,
+            "error": self.load_error,
+            "health": self.health,
+            "healthy_contexts": self.healthy_contexts,
+            "contexts": [
+                {"index": slot.index, "health": slot.health, "reload_failures": slot.reload_failures,
+                 "last_error": slot.last_error}
+                for slot in self.slots if slot.health != "ok"
+            ],
+        }
+    
+    @property
+    def healthy_contexts(self) -> int:
+        """正常に推論できるコンテキスト数"""
+        return sum(1 for slot in self.slots if slot.health == "ok")
+    
+    @property
+    def health(self) -> str:
+        """ok / degraded（再読み込み中・再読み込み失敗のコンテキストがある）"""
+        return "ok" if self.healthy_contexts == self.pool_size else "degraded"
+    
+    def load(self, warmup: dict | None = None):
+        """
+        モデル読み込み → ウォームアップ → 受付開始 を同期的に実行
+        
+        Args:
+            warmup (dict | None): ウォームアップ推論のパラメータ（prompt と推論パラメータ）
+        
+        Raises:
+            Exception: 読み込み失敗時（state は failed になる）
+        """
+        try:
+            self._set_state("loading", 0.0, "モデルを読み込み中")
+            self.tuning = load_profile(self.model_path)
+            if self.tuning is None and AUTOTUNE_ON_STARTUP:
+                self._set_state("loading", 0.0, "ハードウェアに合わせて設定を調整中")
+                self.tuning = autotune(self.model_path, on_progress=self._on_autotune_progress)
+            self._initialize()
+            
+            if warmup:
+                self._set_state("warming", self.progress, "ウォームアップ中")
+                self._warmup(warmup)
+            
+            self._start_workers()
+            self._set_state("ready", 1.0, "準備完了")
+            logger.info("✅ 推論エンジン準備完了")
+        
+        except Exception as e:
+            self.load_error = str(e)
+            self.failed_at = time.monotonic()
+            self._set_state("failed", self.progress, "モデルの読み込みに失敗しました")
+            raise
+    
+    def start_background(self, warmup: dict | None = None):
+        """
+        モデル読み込みをバックグラウンドで開始（完了を待たずに戻る）
+        
+        Args:
+            warmup (dict | None): ウォームアップ推論のパラメータ
+        """
+        if self._loader is not None:
+            return
+        
+        def run():
+            try:
+                self.load(warmup)
+            except Exception:
+                pass  # load() 内でログ出力・状態更新済み
+        
+        self._loader = Thread(target=run, name="model-loader", daemon=True)
+        self._loader.start()
+    
+    def _on_autotune_progress(self, progress: float):
+        """自動チューニングの進捗を表示用に反映（読み込み全体の前半として扱う）"""
+        self.progress = 0.0
+        self.state_detail = f"ハードウェアに合わせて設定を調整中 ({progress:.0%})"
+    
+    def _warmup(self, warmup: dict):
+        """
+        実際のプロンプトテンプレートで各コンテキストを1回ずつ推論
+        
+        固定プレフィックスのKV状態もここで作成されるため、
+        最初のユーザーリクエストがコールドキャッシュの代償を払わずに済む。
+        """
+        params = dict(warmup)
+        prompt = params.pop("prompt")
+        
+        for i in range(self.pool_size):
+            started_at = time.perf_counter()
+            try:
+                # アイドルキューは FIFO のため、順に全コンテキストが使われる
+                self._inference_worker(prompt, params)
+                logger.info(f"🔥 ウォームアップ {i + 1}/{self.pool_size}: {time.perf_counter() - started_at:.2f}秒")
+            except Exception as e:
+                # ウォームアップ失敗は致命的ではない（実リクエスト時に再評価される）
+                logger.warning(f"⚠️ ウォームアップ失敗: {e}")
+            self.progress = 0.8 + 0.2 * (i + 1) / self.pool_size
+    
+    @property
+    def llm(self):
+        """先頭コンテキストのLlamaインスタンス（読み込み確認用）"""
+        return self.slots[0].llm if self.slots else None
+    
+    @property
+    def error_count(self):
+        """全コンテキストの連続エラー数の最大値"""
+        return max((slot.error_count for slot in self.slots), default=0)
+    
+    def _create_llm(self, n_threads: int):
+        """Llamaインスタンスを生成（重みは mmap で他コンテキストと共有）"""
+        # 先読みモデルは状態を持つためコンテキストごとに作成
+        draft_model = create_draft_model(self.speculative_stats, n_ctx=self.n_ctx, n_threads=n_threads)
+        
+        if self.tuning is not None:
+            # 自動チューニングの計測結果（スレッド数はプール数で分割）
+            tuned = {
+                "n_threads_batch": max(1, self.tuning["n_threads_batch"] // self.pool_size),
+                "n_batch": self.tuning["n_batch"],
+                "n_ubatch": self.tuning["n_ubatch"],
+                "use_mmap": self.tuning["use_mmap"],
+                "use_mlock": self.tuning["use_mlock"],
+            }
+        else:
+            tuned = {
+                "n_batch": get_optimal_batch_size(), # バッチサイズ（自動最適化）
+                "use_mmap": True,                    # 重みをプロセス内で共有
+                "use_mlock": True,                   # メモリロック（スワップ防止）
+            }
         
-        self._initialize()
+        return self.llama_factory(
+            model_path=self.model_path,
+            n_ctx=self.n_ctx,                # コンテキストサイズ
+            n_threads=n_threads,             # スレッド数（プール数で分割）
+            draft_model=draft_model,         # 投機的デコード（SPECULATIVE_MODE=off なら None）
+            verbose=False,                   # 詳細ログを抑制
+            **tuned
+        )
+    
+    def _threads_per_context(self):
+        """スレッド予算をコンテキスト数で分割"""
+        total = self.tuning["n_threads"] if self.tuning is not None else get_optimal_threads()
+        return max(1, total // self.pool_size)
     
     def _initialize(self):
-        """モデルを初期化"""
+        """全コンテキストを初期化"""
         try:
             logger.info("🔄 モデルを読み込み中...")
             logger.info(f"📂 モデルパス: {self.model_path}")
             
-            if not self.model_path:
-                raise ValueError("モデルパスが設定されていません")
+            n_threads = self._threads_per_context()
+            logger.info(f"🧵 コンテキスト数={self.pool_size}, スレッド/コンテキスト={n_threads}")
             
-            self.llm = Llama(
-                model_path=self.model_path,
-                n_ctx=2048,                      # コンテキストサイズ
-                n_threads=get_optimal_threads(), # スレッド数（自動最適化）
-                n_batch=get_optimal_batch_size(), # バッチサイズ（自動最適化）
-                use_mlock=True,                  # メモリロック（スワップ防止）
-                verbose=False                     # 詳細ログを抑制
-            )
+            for slot in self.slots:
+                self.state_detail = f"コンテキスト {slot.index + 1}/{self.pool_size} を読み込み中"
+                slot.llm = self._create_llm(n_threads)
+                slot.error_count = 0
+                self._idle_slots.put(slot)
+                self.progress = 0.8 * (slot.index + 1) / self.pool_size
+            
+            if self.prefix_cache is None:
+                self.prefix_cache = PrefixStateCache(self.model_path, n_ctx=self.n_ctx)
             
-            self.error_count = 0
             logger.info("✅ モデル読み込み完了")
             
         except Exception as e:
@@ -101,149 +425,499 @@ class InferenceManager:
             logger.error(traceback.format_exc())
             raise
     
-    def _reinitialize(self):
-        """モデルを再初期化"""
-        logger.warning("⚠️ モデルを再初期化します...")
+    def _schedule_reload(self, slot: ContextSlot):
+        """
+        コンテキストの再読み込みをバックグラウンドで開始（ブルー/グリーン方式）
         
-        try:
-            # 古いインスタンスを破棄
-            if self.llm is not None:
-                del self.llm
-                self.llm = None
+        新しい Llama インスタンスを別スレッドで作成し、完成してから差し替える。
+        他に正常なコンテキストがあれば再読み込み中はこのコンテキストを使わず、
+        なければ古いインスタンスのまま推論を続ける（その間は /health が degraded）。
+        作成中は一時的に1コンテキスト分のメモリを余分に使う。
+        """
+        others_healthy = any(other.health == "ok" for other in self.slots if other is not slot)
+        slot.health = "reloading"
+        slot.in_rotation = not others_healthy
+        logger.warning(
+            f"🔄 コンテキスト#{slot.index} をバックグラウンドで再読み込みします "
+            f"({'古いインスタンスで推論を継続' if slot.in_rotation else '他のコンテキストで推論を継続'})"
+        )
+        Thread(target=self._reload_slot, args=(slot,), name=f"reload-context-{slot.index}", daemon=True).start()
+    
+    def _reload_slot(self, slot: ContextSlot):
+        """再読み込みスレッド本体: 成功するまで指数バックオフで再試行し、成功したら差し替える"""
+        while not self._closing.is_set():
+            started_at = time.perf_counter()
+            try:
+                llm = self._create_llm(self._threads_per_context())
+            except Exception as e:
+                slot.reload_failures += 1
+                slot.health = "broken"
+                slot.last_error = str(e)
+                metrics.INFERENCE_REINITIALIZATIONS.inc(model=self.model_id, result="failed")
+                delay = min(RELOAD_BACKOFF_SECONDS * 2 ** (slot.reload_failures - 1), RELOAD_BACKOFF_MAX_SECONDS)
+                logger.error(
+                    f"❌ コンテキスト#{slot.index} の再読み込み失敗 ({slot.reload_failures}回目): {e}。"
+                    f"{delay:.0f}秒後に再試行します"
+                )
+                if self._closing.wait(delay):
+                    return
+                slot.health = "reloading"
+                continue
             
-            # 再初期化
-            self._initialize()
-            logger.info("✅ 再初期化成功")
+            # 推論の合間に差し替える（推論中ならその完了を待つ）
+            with slot.lock:
+                old_llm, slot.llm = slot.llm, llm
+                slot.grammars.clear()
+                slot.error_count = 0
+                slot.reload_failures = 0
+                slot.last_error = None
+                slot.health = "ok"
+                if not slot.in_rotation:
+                    slot.in_rotation = True
+                    self._idle_slots.put(slot)
+            del old_llm
             
-        except Exception as e:
-            logger.error(f"❌ 再初期化失敗: {e}")
-            raise
+            metrics.INFERENCE_REINITIALIZATIONS.inc(model=self.model_id, result="ok")
+            logger.info(f"✅ コンテキスト#{slot.index} を差し替えました ({time.perf_counter() - started_at:.1f}秒)")
+            return
     
-    def _inference_worker(self, prompt: str, **kwargs):
+    def _start_workers(self):
+        """スケジューラからジョブを取り出すワーカースレッドを起動"""
+        for i in range(self.pool_size):
+            worker = Thread(target=self._worker_loop, name=f"inference-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+    
+    def _worker_loop(self):
+        """ワーカースレッド本体: ジョブを取り出して推論し、結果を Future に設定"""
+        while True:
+            job = self.scheduler.next_job()
+            if job is None:
+                return  # スケジューラ停止
+            
+            if not job.future.set_running_or_notify_cancel():
+                continue  # 呼び出し側が既に待機をやめている
+            
+            try:
+                result = self._inference_worker(
+                    job.prompt,
+                    job.kwargs,
+                    job.on_text,
+                    job.submitted_at,
+                    job.cancel_token
+                )
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+    
+    def _submit(self, prompt: str | TemplatePrompt, kwargs: dict, timeout: float, user_id: int | None,
+                on_text=None, cancel_token: CancelToken | None = None):
+        """
+        スケジューラへジョブを投入
+        
+        Returns:
+            asyncio.Future: 推論結果
+        
+        Raises:
+            QueueFullError: 待機キューが満杯の場合
+            ModelNotReadyError: 退避・切り替えのため受付を停止した場合（再試行すれば新しいマネージャーで処理される）
+        """
+        job = InferenceJob(
+            prompt=prompt,
+            kwargs=kwargs,
+            deadline=time.monotonic() + timeout,
+            user_id=user_id,
+            on_text=on_text,
+            cancel_token=cancel_token
+        )
+        try:
+            future = self.scheduler.submit(job)
+        except SchedulerClosedError as e:
+            # 取得した直後に退避された場合（_ensure_ready の確認後にスケジューラが停止した）
+            raise ModelNotReadyError(f"モデルを切り替え中です ({self.state})") from e
+        return asyncio.wrap_future(future)
+    
+    def _record_timing(self, queue_wait: float, inference: float, cancel_token: CancelToken | None = None,
+                       started_at: float | None = None, n_context_tokens: int | None = None):
+        """待機時間・推論時間・デコード速度を集計"""
+        self.scheduler.record_service_time(inference)
+        
+        metrics.INFERENCE_QUEUE_WAIT.observe(queue_wait, model=self.model_id)
+        if cancel_token is not None and cancel_token.first_token_at is not None:
+            if started_at is not None:
+                metrics.INFERENCE_PROMPT_EVAL.observe(cancel_token.first_token_at - started_at, model=self.model_id)
+            metrics.INFERENCE_DECODE.observe(time.perf_counter() - cancel_token.first_token_at, model=self.model_id)
+            metrics.INFERENCE_GENERATED_TOKENS.observe(cancel_token.generated_tokens, model=self.model_id)
+            if n_context_tokens is not None:
+                metrics.INFERENCE_PROMPT_TOKENS.observe(
+                    max(0, n_context_tokens - cancel_token.generated_tokens), model=self.model_id
+                )
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["queue_wait_seconds"] += queue_wait
+            self.stats["inference_seconds"] += inference
+            
+            # 最初のトークン以降をデコード時間とする（プロンプト評価を除く）
+            if cancel_token is not None and cancel_token.first_token_at is not None:
+                self.stats["generated_tokens"] += cancel_token.generated_tokens
+                self.stats["decode_seconds"] += time.perf_counter() - cancel_token.first_token_at
+        
+        if cancel_token is not None and SPECULATIVE_MODE != "off":
+            self.speculative_stats.record_generated(cancel_token.generated_tokens)
+    
+    def _record_cancel(self, cancel_token: CancelToken):
+        """キャンセルされた推論と、それまでに生成された無駄なトークン数を集計"""
+        with self.stats_lock:
+            self.stats["cancelled_requests"] += 1
+            self.stats["wasted_tokens"] += cancel_token.generated_tokens
+        metrics.INFERENCE_CANCELLED.inc(model=self.model_id, reason=cancel_token.reason)
+        logger.warning(
+            f"🛑 推論をキャンセルしました ({cancel_token.reason}): "
+            f"破棄トークン={cancel_token.generated_tokens}"
+        )
+    
+    def get_stats(self):
+        """
+        推論統計を取得
+        
+        Returns:
+            dict: リクエスト数・平均待機時間・平均推論時間・デコード速度など
+        """
+        with self.stats_lock:
+            stats = dict(self.stats)
+        
+        n = stats["requests"] or 1
+        stats["avg_queue_wait_seconds"] = stats["queue_wait_seconds"] / n
+        stats["avg_inference_seconds"] = stats["inference_seconds"] / n
+        stats["decode_tokens_per_second"] = (
+            stats["generated_tokens"] / stats["decode_seconds"] if stats["decode_seconds"] > 0 else 0.0
+        )
+        stats["prompt"] = self.prompt_builder.get_stats()
+        stats["speculative_mode"] = SPECULATIVE_MODE
+        if SPECULATIVE_MODE != "off":
+            stats["speculative"] = self.speculative_stats.get_stats()
+        stats["pool_size"] = self.pool_size
+        stats["idle_contexts"] = self._idle_slots.qsize()
+        stats["scheduler"] = self.scheduler.get_stats()
+        return stats
+    
+    def _inference_worker(
+        self,
+        prompt: str | TemplatePrompt,
+        kwargs: dict,
+        on_text=None,
+        submitted_at: float | None = None,
+        cancel_token: CancelToken | None = None
+    ):
         """
         推論を実行（別スレッド）
         
+        空いているコンテキストを1つ取得して推論し、終了後にプールへ返却する。
+        
         Args:
-            prompt (str): プロンプト
-            **kwargs: 推論パラメータ
+            prompt (str | TemplatePrompt): プロンプト（TemplatePrompt はトークン予算内のトークン列に組み立てる）
+            kwargs (dict): 推論パラメータ
+                prefix (str): 固定プレフィックス（指定時はKV状態を復元して再利用。TemplatePrompt では不要）
+                prefix_version (str): プレフィックスのバージョン
+                grammar (str): 出力を制約するGBNF文法
+            on_text (callable | None): 指定時はストリーミング生成し、断片ごとに呼び出す
+            submitted_at (float | None): 投入時刻（time.perf_counter、待機時間の計測用）
+            cancel_token (CancelToken | None): キャンセル通知（1トークン以内に生成を打ち切る）
         
         Returns:
             str: 生成されたテキスト
         
         Raises:
             RuntimeError: モデルが初期化されていない場合
+            InferenceCancelledError: キャンセルされた場合
+            PromptBudgetError: プロンプトの固定部分だけでコンテキストに収まらない場合
             Exception: 推論エラー
         """
+        cancel_token = cancel_token or CancelToken()
+        
+        # 空いているコンテキストを取得（全て使用中なら返却を待つ）
+        with metrics.INFERENCE_SLOT_WAIT.time(model=self.model_id):
+            slot = self._idle_slots.get()
+        started_at = time.perf_counter()
+        queue_wait = started_at - submitted_at if submitted_at is not None else 0.0
+        # 再読み込みスレッドが差し替え中なら完了を待つ
+        slot.lock.acquire()
+        
         try:
-            with self.lock:  # 同時実行を防ぐ
-                if self.llm is None:
-                    raise RuntimeError("モデルが初期化されていません")
-                
-                logger.debug(f"🤖 推論開始: {prompt[:50]}...")
-                
-                output = self.llm(
-                    prompt=prompt,
-                    max_tokens=kwargs.get('max_tokens', 512),
-                    temperature=kwargs.get('temperature', 0.7),
-                    top_p=kwargs.get('top_p', 0.9),
-                    stop=["</s>", "\n\n"],
-                    echo=False
-                )
-                
-                # 成功したらエラーカウントをリセット
-                self.error_count = 0
-                
+            # 待機中にキャンセルされていれば推論しない
+            if cancel_token.cancelled:
+                self._record_cancel(cancel_token)
+                raise InferenceCancelledError(f"推論開始前にキャンセルされました ({cancel_token.reason})")
+            
+            if slot.llm is None:
+                raise RuntimeError("モデルが初期化されていません")
+            
+            logger.debug(f"🤖 推論開始 (コンテキスト#{slot.index}): {str(prompt)[:50]}...")
+            
+            max_tokens = kwargs.get('max_tokens', 512)
+            prefix = kwargs.get('prefix')
+            prefix_version = kwargs.get('prefix_version', '0')
+            if isinstance(prompt, TemplatePrompt):
+                # 固定部分はトークン化済みのものを使い、入力文だけをトークン化して予算内に収める
+                prefix, prefix_version = prompt.template.prefix, prompt.template.version
+                prompt = self.prompt_builder.build(prompt, max_tokens, slot.llm.tokenize)
+            
+            # 固定プレフィックスのKV状態を復元（プロンプト評価を省略）
+            # トークン列のプロンプトは先頭がプレフィックスのトークン列と一致する
+            if prefix and (isinstance(prompt, list) or prompt.startswith(prefix)):
+                n_reused = self.prefix_cache.restore(slot.llm, prefix, prefix_version)
+                logger.debug(f"♻️ プレフィックス再利用: {n_reused}トークン")
+            
+            # 文法制約時は閉じ括弧で生成が終わるため、空行での停止は不要
+            # （整形されたJSONを途中で切ってしまうのを防ぐ）
+            gbnf = kwargs.get('grammar')
+            grammar = slot.get_grammar(gbnf) if gbnf else None
+            stop = ["</s>"] if grammar is not None else ["</s>", "\n\n"]
+            
+            output = slot.llm(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=kwargs.get('temperature', 0.7),
+                top_p=kwargs.get('top_p', 0.9),
+                stop=stop,
+                grammar=grammar,
+                stopping_criteria=StoppingCriteriaList([cancel_token.stopping_criteria]),
+                echo=False,
+                stream=on_text is not None
+            )
+            
+            if on_text is not None:
+                # ストリーミング: 断片ごとにコールバック
+                pieces = []
+                for chunk in output:
+                    text = chunk["choices"][0]["text"]
+                    if text and not cancel_token.cancelled:
+                        pieces.append(text)
+                        on_text(text)
+                result = "".join(pieces).strip()
+            else:
                 result = output["choices"][0]["text"].strip()
-                logger.debug(f"✅ 推論完了: {len(result)}文字")
-                
-                return result
+            
+            if cancel_token.cancelled:
+                self._record_cancel(cancel_token)
+                raise InferenceCancelledError(f"推論がキャンセルされました ({cancel_token.reason})")
+            
+            # 成功したらエラーカウントをリセット
+            slot.error_count = 0
+            
+            inference_time = time.perf_counter() - started_at
+            # 生成後のコンテキスト長 = プロンプト（再利用分を含む）+ 生成トークン
+            self._record_timing(queue_wait, inference_time, cancel_token, started_at, slot.llm.n_tokens)
+            logger.debug(
+                f"✅ 推論完了: {len(result)}文字 "
+                f"(待機 {queue_wait:.2f}秒 / 推論 {inference_time:.2f}秒)"
+            )
+            
+            return result
+        
+        except (InferenceCancelledError, PromptBudgetError):
+            # キャンセル・設定不足はモデルの異常ではないためエラーとして数えない
+            raise
         
         except Exception as e:
-            self.error_count += 1
-            logger.error(f"⚠️ 推論エラー ({self.error_count}/{self.max_errors}): {e}")
+            slot.error_count += 1
+            metrics.INFERENCE_ERRORS.inc(model=self.model_id)
+            logger.error(f"⚠️ 推論エラー ({slot.error_count}/{self.max_errors}): {e}")
             
-            # 連続エラーが閾値を超えたら再初期化
-            if self.error_count >= self.max_errors:
+            # 連続エラーが閾値を超えたら再初期化（待機中のリクエストは止めない）
+            if slot.error_count >= self.max_errors and slot.health == "ok":
                 logger.warning("🔄 エラー回数が閾値を超えました。再初期化します。")
-                try:
-                    self._reinitialize()
-                except Exception as reinit_error:
-                    logger.error(f"❌ 再初期化も失敗しました: {reinit_error}")
+                self._schedule_reload(slot)
             
             raise
+        
+        finally:
+            slot.lock.release()
+            if slot.in_rotation:
+                self._idle_slots.put(slot)
+    
+    def _ensure_ready(self):
+        """受付可能な状態か確認"""
+        if self.state == "failed":
+            raise RuntimeError(f"モデルの読み込みに失敗しています: {self.load_error}")
+        if not self.is_ready:
+            raise ModelNotReadyError(f"モデルを準備中です ({self.state}: {self.progress:.0%})")
     
-    async def generate(self, prompt: str, timeout: int = 60, **kwargs):
+    async def generate(self, prompt: str | TemplatePrompt, timeout: int = 60, user_id: int | None = None, **kwargs):
         """
         非同期で推論を実行（タイムアウト付き）
         
         Args:
-            prompt (str): プロンプト
-            timeout (int): タイムアウト秒数
-            **kwargs: 推論パラメータ
+            prompt (str | TemplatePrompt): プロンプト
+            timeout (int): タイムアウト秒数（締め切りとしてスケジューラにも渡す）
+            user_id (int | None): 公平スケジューリング用のユーザーID
+            **kwargs: 推論パラメータ（prefix / prefix_version / grammar を含む）
         
         Returns:
             str: 生成されたテキスト
         
         Raises:
+            ModelNotReadyError: モデルの準備が完了していない場合
+            QueueFullError: 待機キューが満杯の場合
             TimeoutError: タイムアウトした場合
             Exception: その他のエラー
         """
-        loop = asyncio.get_event_loop()
+        self._ensure_ready()
+        cancel_token = CancelToken()
         
         try:
-            # 別スレッドで推論を実行
+            # ワーカースレッドで推論を実行
             result = await asyncio.wait_for(
-                loop.run_in_executor(
-                    self.executor,
-                    self._inference_worker,
-                    prompt,
-                    kwargs
-                ),
+                self._submit(prompt, kwargs, timeout, user_id, cancel_token=cancel_token),
                 timeout=timeout
             )
             return result
         
         except asyncio.TimeoutError:
+            # 待機をやめるだけでなく、ワーカー側の生成も打ち切る
+            cancel_token.cancel("timeout")
+            metrics.INFERENCE_TIMEOUTS.inc(model=self.model_id)
             logger.error(f"⏱️ タイムアウト ({timeout}秒)")
             raise TimeoutError(f"推論が{timeout}秒でタイムアウトしました")
         
+        except asyncio.CancelledError:
+            # クライアント切断など呼び出し側のキャンセル
+            cancel_token.cancel("caller cancelled")
+            raise
+        
         except Exception as e:
             logger.error(f"❌ 推論失敗: {e}")
             raise
     
+    async def generate_stream(self, prompt: str | TemplatePrompt, timeout: int = 60, user_id: int | None = None, **kwargs):
+        """
+        非同期でストリーミング推論を実行（タイムアウト付き）
+        
+        Args:
+            prompt (str | TemplatePrompt): プロンプト
+            timeout (int): 全体のタイムアウト秒数
+            user_id (int | None): 公平スケジューリング用のユーザーID
+            **kwargs: 推論パラメータ（prefix / prefix_version / grammar を含む）
+        
+        Yields:
+            str: 生成されたテキストの断片
+        
+        Raises:
+            ModelNotReadyError: モデルの準備が完了していない場合
+            QueueFullError: 待機キューが満杯の場合
+            TimeoutError: タイムアウトした場合
+            Exception: その他のエラー
+        """
+        self._ensure_ready()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        end_of_stream = object()
+        cancel_token = CancelToken()
+        
+        def on_text(text: str):
+            loop.call_soon_threadsafe(queue.put_nowait, text)
+        
+        future = self._submit(prompt, kwargs, timeout, user_id, on_text=on_text, cancel_token=cancel_token)
+        # 完了（成功・失敗とも）したら終端を通知
+        future.add_done_callback(lambda _: queue.put_nowait(end_of_stream))
+        
+        deadline = loop.time() + timeout
+        
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    cancel_token.cancel("timeout")
+                    metrics.INFERENCE_TIMEOUTS.inc(model=self.model_id)
+                    logger.error(f"⏱️ タイムアウト ({timeout}秒)")
+                    raise TimeoutError(f"推論が{timeout}秒でタイムアウトしました")
+                
+                if item is end_of_stream:
+                    break
+                yield item
+            
+            # ワーカーの例外を伝播
+            future.result()
+        
+        finally:
+            # 途中で終了した場合（クライアント切断など）は生成を打ち切る
+            if not future.done():
+                cancel_token.cancel("stream closed")
+    
+    def drain_and_shutdown(self):
+        """
+        新規の受付を止め、処理中・待機中のリクエストを終えてからシャットダウン
+        
+        モデルの切り替え・退避時に、実行中のリクエストを失わないために使う。
+        """
+        logger.info(f"🚰 処理中のリクエストの完了を待っています: {os.path.basename(self.model_path)}")
+        self._set_state("draining", self.progress, "切り替えのため停止中")
+        
+        self.scheduler.close(drain=True)
+        for worker in self._workers:
+            worker.join()
+        
+        self.shutdown()
+    
     def shutdown(self):
         """シャットダウン"""
         logger.info("🛑 推論エンジンをシャットダウン中...")
+        self._closing.set()
         
-        self.executor.shutdown(wait=True)
+        self.scheduler.close()
+        for worker in self._workers:
+            worker.join()
         
-        if self.llm is not None:
-            del self.llm
-            self.llm = None
+        for slot in self.slots:
+            if slot.llm is not None:
+                del slot.llm
+                slot.llm = None
         
         logger.info("✅ 推論エンジンシャットダウン完了")
 
-# グローバルインスタンス
+# グローバルインスタンス（既定モデルの推論マネージャー）
 inference_manager = None
 
-def get_inference_manager():
+def get_inference_manager(warmup: dict | None = None, model_id: str | None = None):
     """
-    InferenceManagerのシングルトン取得
+    推論マネージャーを取得
+    
+    初回呼び出し時にモデルの読み込みをバックグラウンドで開始する。
+    読み込み完了前でもインスタンスは返るため、状態は is_ready / get_status() で確認する。
+    
+    Args:
+        warmup (dict | None): 初回のみ有効なウォームアップ推論のパラメータ（全モデル共通）
+        model_id (str | None): モデルID（None の場合は既定モデル）
     
     Returns:
         InferenceManager: 推論マネージャーインスタンス
     
     Raises:
-        Exception: 初期化失敗時
+        UnknownModelError: モデルが見つからない場合
+        ModelBudgetError: メモリ予算内に読み込めない場合
     """
     global inference_manager
+    if INFERENCE_MODE == "daemon":
+        # 推論は別プロセスのデーモンで行う（ウォームアップもデーモン側で実行）
+        from inference_client import get_remote_registry
+        manager = get_remote_registry().get_manager(model_id)
+        if model_id is None:
+            inference_manager = manager
+        return manager
+    
+    # 循環インポートを避けるため遅延インポート
+    from model_registry import get_model_registry
+    
+    registry = get_model_registry()
+    if warmup is not None and registry.warmup is None:
+        registry.warmup = warmup
+    
+    if model_id is not None and model_id != registry.default_id:
+        return registry.get_manager(model_id)
     
     if inference_manager is None:
         logger.info("🔧 推論マネージャーを初期化中...")
-        
-        if MODEL_PATH is None:
-            raise ValueError("モデルパスが設定されていません。config.pyを確認してください。")
-        
-        inference_manager = InferenceManager(model_path=MODEL_PATH)
-    
+    inference_manager = registry.get_manager()
     return inference_manager
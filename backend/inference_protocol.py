@@ -0,0 +1,103 @@
+# backend/inference_protocol.py（新規）
+#
+# 推論デーモンと API ワーカー間の通信形式
+#
+#   フレーム = ヘッダー(9バイト) + 本文
+#   ヘッダー = 本文の長さ(uint32) + 種別(uint8) + リクエストID(uint32)（ビッグエンディアン）
+#
+#   本文は CHUNK がUTF-8テキストそのまま、それ以外はUTF-8のJSON。
+#   文法（GBNF）やテンプレートなど毎回同じ大きな値は、接続ごとに1回だけ
+#   "defs" で送り、以降は {"$ref": ハッシュ} で参照する。
+
+import asyncio
+import hashlib
+import json
+import os
+import struct
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 推論の実行場所（inprocess: APIプロセス内 / daemon: 別プロセスの推論デーモン）
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "inprocess")
+# デーモンの待ち受けアドレス（ローカルのみ。ポート 0 = 起動時に空きポートを選ぶ）
+INFERENCE_DAEMON_HOST = os.getenv("INFERENCE_DAEMON_HOST", "127.0.0.1")
+INFERENCE_DAEMON_PORT = int(os.getenv("INFERENCE_DAEMON_PORT", "0"))
+# 接続時の認証トークン（スーパーバイザーが起動ごとに生成して子プロセスに渡す）
+INFERENCE_DAEMON_TOKEN = os.getenv("INFERENCE_DAEMON_TOKEN", "")
+
+HEADER = struct.Struct("!IBI")
+
+# フレーム種別
+HELLO = 1      # 接続直後の認証（クライアント → デーモン）
+REQUEST = 2    # 操作の要求
+CHUNK = 3      # ストリーミングの断片
+RESULT = 4     # 操作の結果（ストリーミングでは終端）
+ERROR = 5      # 操作の失敗
+CANCEL = 6     # 実行中の操作の取り消し
+
+# 本文の上限（壊れたフレームで巨大なメモリを確保しない）
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+# これより長い文字列は参照渡しにする
+INTERN_MIN_CHARS = 256
+
+
+class ProtocolError(Exception):
+    """不正なフレームを受信した"""
+
+
+def encode_frame(frame_type: int, request_id: int, payload) -> bytes:
+    """
+    フレームをバイト列に変換
+
+    Args:
+        frame_type: フレーム種別
+        request_id: リクエストID（HELLO は 0）
+        payload: CHUNK は str、それ以外は JSON に変換できる値
+
+    Returns:
+        bytes: ヘッダー + 本文
+    """
+    if frame_type == CHUNK:
+        body = payload.encode("utf-8")
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return HEADER.pack(len(body), frame_type, request_id) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, int, object]:
+    """
+    フレームを1つ受信
+
+    Returns:
+        tuple: (種別, リクエストID, 本文)
+
+    Raises:
+        asyncio.IncompleteReadError: 接続が閉じられた場合
+        ProtocolError: 本文が上限を超える場合
+    """
+    length, frame_type, request_id = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ProtocolError(f"フレームが大きすぎます: {length}バイト")
+    body = await reader.readexactly(length)
+    if frame_type == CHUNK:
+        return frame_type, request_id, body.decode("utf-8")
+    return frame_type, request_id, json.loads(body.decode("utf-8"))
+
+
+def ref_id(value) -> str:
+    """参照渡しする値（JSONに変換できる値）の識別子"""
+    canonical = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+# =========================
+# 例外の受け渡し
+# =========================
+def encode_error(e: BaseException) -> dict:
+    """例外を ERROR フレームの本文に変換"""
+    payload = {"type": type(e).__name__, "message": str(e.args[0]) if e.args else str(e)}
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is not None:
+        payload["retry_after"] = retry_after
+    return payload
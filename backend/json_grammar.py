@@ -0,0 +1,80 @@
+# backend/json_grammar.py（新規）
+
+import json
+from typing import Any
+
+# JSON文字列中の1文字（制御文字・" ・ \ 以外、またはエスケープシーケンス）
+_CHAR_RULE = r'''[^"\\\x7F\x00-\x1F] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F]{4})'''
+
+
+def _repetition(item: str, min_items: int, max_items: int | None) -> str:
+    """
+    GBNFの繰り返し表現を生成
+
+    回数は先頭に 0 を付けて書く（llama-cpp-python 0.2.90 の文法パーサは「{0,9}」のように
+    回数が1桁、または 9 で始まると解析に失敗するため。「{00,09}」は同じ意味で解析できる）
+    """
+    if max_items is None:
+        return f"{item}{{0{min_items},}}"
+    return f"{item}{{0{min_items},0{max_items}}}"
+
+
+class _GrammarBuilder:
+    """JSON Schema（object / array / string のサブセット）からGBNFを組み立てる"""
+
+    def __init__(self):
+        self.rules: dict[str, str] = {
+            "ws": '" "?',
+            "char": _CHAR_RULE,
+        }
+
+    def _add(self, name: str, body: str) -> str:
+        self.rules[name] = body
+        return name
+
+    def visit(self, schema: dict[str, Any], name: str) -> str:
+        schema_type = schema.get("type")
+
+        if schema_type == "string":
+            body = r'"\"" ' + _repetition("char", schema.get("minLength", 0), schema.get("maxLength")) + r' "\""'
+            return self._add(name, body)
+
+        if schema_type == "array":
+            item = self.visit(schema["items"], f"{name}-item")
+            min_items = schema.get("minItems", 0)
+            max_items = schema.get("maxItems")
+            rest_max = None if max_items is None else max(0, max_items - 1)
+            rest = _repetition(f'(ws "," ws {item})', max(0, min_items - 1), rest_max)
+            non_empty = f'"[" ws {item} {rest} ws "]"'
+            body = non_empty if min_items > 0 else f'"[" ws "]" | {non_empty}'
+            return self._add(name, body)
+
+        if schema_type == "object":
+            # 出力順を固定し、全プロパティを必須にする（余計なキーを生成させない）
+            parts = []
+            for key, prop_schema in schema["properties"].items():
+                value = self.visit(prop_schema, f"{name}-{key}".replace("_", "-"))
+                parts.append(f'{json.dumps(json.dumps(key))} ws ":" ws {value}')
+            body = '"{" ws ' + ' ws "," ws '.join(parts) + ' ws "}"'
+            return self._add(name, body)
+
+        raise ValueError(f"未対応のスキーマ型です: {schema_type}")
+
+
+def schema_to_gbnf(schema: dict[str, Any]) -> str:
+    """
+    JSON Schema から llama.cpp の GBNF 文法を生成
+
+    ルート要素の閉じ括弧の後には何も許さないため、
+    オブジェクトが閉じた時点で生成が終了する。
+
+    Args:
+        schema: object / array / string のみで構成されたJSON Schema
+
+    Returns:
+        str: GBNF文法
+    """
+    builder = _GrammarBuilder()
+    root = builder.visit(schema, "value")
+    rules = {"root": root, **builder.rules}
+    return "\n".join(f"{name} ::= {body}" for name, body in rules.items()) + "\n"
@@ -0,0 +1,295 @@
+# backend/lexicon.py（新規）
+
+import logging
+import re
+import unicodedata
+from collections import deque
+from threading import Lock
+from typing import Any, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# カテゴリ定義
+# =========================
+# システムプロンプトの5カテゴリ + 露骨な罵倒語。
+# patterns の値は「その表現がマイナスワードである確からしさ」（0.0〜1.0）。
+# 0.5 未満の表現は単独では判定せず、hybrid モードではLLMに委ねる目安になる。
+CATEGORIES: dict[str, dict[str, Any]] = {
+    "negation": {
+        "label": "否定の決めつけ",
+        "advice": "自分を責めてしまうほど頑張ってきたのですね。「どうせ」と感じる時こそ、今日できた小さなことを1つ書き出してみませんか？",
+        "patterns": {
+            "どうせ無理": 0.98, "どうせ": 0.9, "私なんて": 0.95, "僕なんて": 0.95, "俺なんて": 0.95,
+            "自分なんて": 0.95, "できるわけない": 0.9, "無理に決まって": 0.95, "向いてない": 0.7,
+            "無理": 0.4,
+        },
+    },
+    "comparison": {
+        "label": "比較による圧力",
+        "advice": "周りと比べて焦る気持ち、よく分かります。比べる相手を昨日の自分にして、少しでも進んだところを探してみませんか？",
+        "patterns": {
+            "みんなはできる": 0.95, "みんなできる": 0.95, "普通は": 0.85, "普通なら": 0.85,
+            "他の人は": 0.8, "なんで私だけ": 0.85, "あの人はできる": 0.9, "見習って": 0.75,
+        },
+    },
+    "sarcasm": {
+        "label": "皮肉・嫌味",
+        "advice": "言葉の裏にもどかしさがあったのかもしれませんね。思っていることを「私は〜と感じた」と率直に伝えてみませんか？",
+        "patterns": {
+            "へー、すごいね": 0.8, "いいご身分": 0.95, "よくそんなこと": 0.8, "お気楽": 0.7,
+            "さすがですね": 0.4, "すごいね": 0.3,
+        },
+    },
+    "coercion": {
+        "label": "強制・圧力",
+        "advice": "きちんとしなければと思うほど苦しくなりますよね。「〜したい」「〜してみる」に言い換えて、できそうなことから始めてみませんか？",
+        "patterns": {
+            "すべき": 0.9, "べきだ": 0.9, "ねばならない": 0.9, "しなければ": 0.85,
+            "しないといけない": 0.8, "しなきゃ": 0.8, "やらなきゃ": 0.75, "当たり前": 0.6,
+        },
+    },
+    "past_negation": {
+        "label": "過去の否定",
+        "advice": "うまくいかなかった経験が重なると不安になりますよね。前回から学べたことを1つだけ振り返って、次の一歩にしてみませんか？",
+        "patterns": {
+            "前もダメ": 0.95, "前回も失敗": 0.95, "いつも失敗": 0.95, "また失敗": 0.85,
+            "何度やっても": 0.85, "いつもそう": 0.8, "失敗": 0.35, "ダメ": 0.4,
+        },
+    },
+    "insult": {
+        "label": "罵倒語",
+        "advice": "強い言葉が出てしまうほど気持ちが高ぶっていたのですね。一度深呼吸して、本当に伝えたかった気持ちを言葉にしてみませんか？",
+        "patterns": {
+            "死ね": 0.99, "消えろ": 0.95, "バカ": 0.95, "アホ": 0.9, "クズ": 0.95,
+            "役立たず": 0.95, "無能": 0.95, "うざい": 0.9, "キモい": 0.9,
+        },
+    },
+}
+
+# 誤検出を防ぐ除外表現（これに含まれる一致は無視する。例: 「ばかり」の中の「ばか」）
+GUARD_PATTERNS = ["ばかり", "ばかばかしい", "無理しない", "無理せず", "無理のない", "失敗しても大丈夫"]
+
+# マイナスワードが見つからなかった場合のアドバイス
+CLEAN_ADVICE = "前向きな気持ちが伝わってきます。その調子で自分のペースを大切にしてくださいね。"
+
+# 一致が全くない場合の確からしさ
+# 辞書にない言い回し（「生きている意味がわからない」など）や皮肉は捉えられないため低くし、
+# hybrid モードでは LLM に委ねる（閾値をこれ以下に下げた場合のみ辞書で応答する）
+CLEAN_CONFIDENCE = 0.5
+
+# フレーズの区切り（NFKC後）
+_CLAUSE_BREAKS = set("、。,.!?…\n")
+
+
+# =========================
+# 正規化
+# =========================
+def normalize_text(text: str) -> str:
+    """NFKC正規化 + 空白の統一（抽出するフレーズはこの文字列から切り出す）"""
+    normalized = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+def fold_text(text: str) -> str:
+    """
+    照合用に表記ゆれを畳み込む（カタカナ→ひらがな・英字の小文字化）
+
+    1文字を1文字に置き換えるため、位置は normalize_text の結果と一致する。
+    """
+    return "".join(
+        chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch.lower()
+        for ch in text
+    )
+
+
+# =========================
+# Aho–Corasick
+# =========================
+class AhoCorasick:
+    """複数パターンを入力長に比例する時間で一括照合するオートマトン"""
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+        Args:
+            patterns: 照合するパターン（fold_text 済みであること）
+        """
+        self.patterns = list(patterns)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[int]] = [[]]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+
+        # 幅優先で失敗遷移を構築
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int, int]]:
+        """
+        一致箇所を列挙
+
+        Args:
+            text: 照合対象（fold_text 済み）
+
+        Yields:
+            tuple[int, int, int]: (開始位置, 終了位置, パターン番号)
+        """
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for index in self._output[state]:
+                yield position + 1 - len(self.patterns[index]), position + 1, index
+
+
+# =========================
+# 判定
+# =========================
+class LexiconVerdict:
+    """辞書による判定結果"""
+
+    def __init__(self, minus_words: list[str], categories: list[str], confidence: float, advice: str):
+        self.minus_words = minus_words
+        self.categories = categories      # 一致したカテゴリ（確からしさの高い順）
+        self.confidence = confidence      # 判定全体の確からしさ（0.0〜1.0）
+        self.advice = advice
+
+    @property
+    def is_clean(self) -> bool:
+        return not self.minus_words
+
+    def to_result(self) -> dict[str, Any]:
+        """generate_advice と同じ形式の結果"""
+        return {"minus_words": list(self.minus_words), "advice": self.advice}
+
+
+class Lexicon:
+    """
+    カテゴリ別の表現辞書によるマイナスワード判定
+
+    一致した表現を含む節（読点・句点で区切った範囲）をマイナスワードとして返す。
+    確からしさは一致した表現の重みを noisy-OR で合成したもの。
+    """
+
+    def __init__(self, categories: dict[str, dict[str, Any]] = CATEGORIES,
+                 guard_patterns: Iterable[str] = GUARD_PATTERNS):
+        self.categories = categories
+
+        # パターン番号 -> (カテゴリ, 重み)。カテゴリが None のものは除外表現
+        self._entries: list[tuple[str | None, float]] = []
+        patterns: list[str] = []
+        for category, spec in categories.items():
+            for pattern, weight in spec["patterns"].items():
+                patterns.append(fold_text(normalize_text(pattern)))
+                self._entries.append((category, weight))
+        for pattern in guard_patterns:
+            patterns.append(fold_text(normalize_text(pattern)))
+            self._entries.append((None, 0.0))
+
+        self._automaton = AhoCorasick(patterns)
+
+        self._stats_lock = Lock()
+        self.stats = {"resolved_clean": 0, "resolved_match": 0, "deferred": 0}
+
+    @staticmethod
+    def _clause(text: str, start: int, end: int) -> str:
+        """一致箇所を含む節を切り出す"""
+        while start > 0 and text[start - 1] not in _CLAUSE_BREAKS:
+            start -= 1
+        while end < len(text) and text[end] not in _CLAUSE_BREAKS:
+            end += 1
+        return text[start:end].strip()
+
+    def analyze(self, text: str) -> LexiconVerdict:
+        """
+        入力文を判定
+
+        Args:
+            text: ユーザーの入力文章
+
+        Returns:
+            LexiconVerdict: 判定結果
+        """
+        normalized = normalize_text(text)
+        matches = list(self._automaton.iter_matches(fold_text(normalized)))
+
+        guards = [(start, end) for start, end, index in matches if self._entries[index][0] is None]
+        hits = [
+            (start, end, index) for start, end, index in matches
+            if self._entries[index][0] is not None
+            and not any(g_start <= start and end <= g_end for g_start, g_end in guards)
+        ]
+
+        if not hits:
+            return LexiconVerdict([], [], CLEAN_CONFIDENCE, CLEAN_ADVICE)
+
+        # 節ごとに最も確からしい一致を採用（同じ節の重複一致をまとめる）
+        clauses: dict[str, tuple[str, float]] = {}
+        category_weights: dict[str, float] = {}
+        for start, end, index in sorted(hits):
+            category, weight = self._entries[index]
+            clause = self._clause(normalized, start, end)
+            if clause not in clauses or clauses[clause][1] < weight:
+                clauses[clause] = (category, weight)
+            category_weights[category] = max(category_weights.get(category, 0.0), weight)
+
+        remaining = 1.0
+        for _, weight in clauses.values():
+            remaining *= 1.0 - weight
+        confidence = 1.0 - remaining
+
+        categories = sorted(category_weights, key=category_weights.get, reverse=True)
+        return LexiconVerdict(
+            minus_words=list(clauses),
+            categories=categories,
+            confidence=confidence,
+            advice=self.categories[categories[0]]["advice"],
+        )
+
+    def record(self, verdict: LexiconVerdict, resolved: bool) -> None:
+        """判定結果を使ったか（LLMに委ねたか）を記録"""
+        with self._stats_lock:
+            if not resolved:
+                self.stats["deferred"] += 1
+            elif verdict.is_clean:
+                self.stats["resolved_clean"] += 1
+            else:
+                self.stats["resolved_match"] += 1
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        辞書判定で応答できた割合などを取得
+
+        Returns:
+            dict: 判定件数・LLMに委ねた件数・辞書で応答できた割合
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        total = stats["resolved_clean"] + stats["resolved_match"] + stats["deferred"]
+        stats["resolved_rate"] = (total - stats["deferred"]) / total if total else 0.0
+        return stats
+
+
+# グローバルインスタンス
+lexicon = Lexicon()
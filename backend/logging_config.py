@@ -6,18 +6,19 @@ from pathlib import Path
 import sys
 from config import APP_DATA_DIR, APP_VERSION, APP_NAME
 
-def setup_logging(log_level=logging.INFO):
+def setup_logging(log_level=logging.INFO, log_name='backend.log'):
     """
     ログ設定（ファイル + コンソール）
     
     Args:
         log_level: ログレベル（デフォルト: INFO）
+        log_name: ログファイル名（推論デーモンなど別プロセスは別ファイルにする）
     """
     
     # ログディレクトリ
     log_dir = APP_DATA_DIR / 'logs'
     log_dir.mkdir(exist_ok=True)
-    log_file = log_dir / 'backend.log'
+    log_file = log_dir / log_name
     
     # ログフォーマット
     formatter = logging.Formatter(
@@ -44,7 +45,9 @@ def setup_logging(log_level=logging.INFO):
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)  # 最も詳細なレベル
     
-    # 既存のハンドラをクリア（重複防止）
+    # 既存のハンドラを閉じてクリア（重複防止）
+    for handler in root_logger.handlers:
+        handler.close()
     root_logger.handlers.clear()
     
     # 新しいハンドラを追加
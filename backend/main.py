@@ -1,6 +1,7 @@
 # backend/main.py（修正版）
 
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import sys
@@ -12,10 +13,13 @@ from logging_config import setup_logging
 from config import APP_VERSION, APP_NAME
 from database import init_db
 from inference_manager import get_inference_manager
+from inference_protocol import INFERENCE_MODE
+from ai_model import build_warmup_request, start_semantic_cache
 
 # ルーターのインポート
 import routes
 import ai_routes
+import model_routes
 import wc_routes
 
 logger = logging.getLogger(__name__)
@@ -38,6 +42,7 @@ app.add_middleware(
 
 # ルーター登録
 app.include_router(ai_routes.router)
+app.include_router(model_routes.router)
 app.include_router(routes.router)
 app.include_router(wc_routes.router)
 
@@ -55,13 +60,27 @@ async def startup_event():
         logger.error(f"❌ データベース初期化失敗: {e}")
         sys.exit(1)
     
-    # 推論エンジン初期化
+    # 推論エンジン初期化（読み込みはバックグラウンドで行い、完了を待たない）
+    # DB・ワードクラウド等のLLMを使わないAPIはすぐに利用できる。
+    # 読み込み状況は /health の model_state / model_progress で確認する。
     try:
-        inference_manager = get_inference_manager()
-        logger.info("✅ 推論エンジン初期化完了")
+        if INFERENCE_MODE == "daemon":
+            # モデルは推論デーモンが読み込む。ここでは接続と状態の取得だけを始める
+            from inference_client import get_inference_client
+            await get_inference_client().start()
+            logger.info("🔌 推論デーモンを使用します")
+        get_inference_manager(warmup=build_warmup_request())
+        logger.info("🔄 推論エンジンの読み込みをバックグラウンドで開始しました")
     except Exception as e:
         logger.error(f"❌ 推論エンジン初期化失敗: {e}")
-        sys.exit(1)
+    
+    # 類似入力キャッシュ（埋め込みモデルの読み込みはバックグラウンド）
+    start_semantic_cache()
+    
+    # ワードクラウドのワーカープロセス（辞書の読み込みを先に済ませておく）
+    from wc_pool import wordcloud_pool
+    if wordcloud_pool is not None:
+        wordcloud_pool.start()
     
     logger.info("✅ アプリケーション起動完了")
 
@@ -70,9 +89,24 @@ async def shutdown_event():
     """アプリケーションシャットダウン時の処理"""
     logger.info("🛑 アプリケーションシャットダウン中...")
     
-    from inference_manager import inference_manager
-    if inference_manager:
-        inference_manager.shutdown()
+    from model_registry import model_registry
+    if model_registry:
+        model_registry.shutdown()
+    
+    from semantic_cache import semantic_cache
+    if semantic_cache is not None:
+        semantic_cache.shutdown()
+    
+    from wc_pool import wordcloud_pool
+    if wordcloud_pool is not None:
+        await wordcloud_pool.close()
+    
+    from tokenizer_service import tokenizer_service
+    tokenizer_service.shutdown_pool()
+    
+    if INFERENCE_MODE == "daemon":
+        from inference_client import get_inference_client
+        await get_inference_client().close()
     
     logger.info("✅ シャットダウン完了")
 
@@ -80,15 +114,92 @@ async def shutdown_event():
 async def health_check():
     """ヘルスチェックエンドポイント"""
     from inference_manager import inference_manager
+    from result_cache import result_cache
+    from semantic_cache import semantic_cache
+    from wc_pool import wordcloud_pool
+    from wc_cache import wordcloud_cache
+    from tokenizer_service import tokenizer_service
+    from ai_model import ADVICE_MODE
+    from lexicon import lexicon
+    from model_registry import get_model_registry
+    
+    model_status = inference_manager.get_status() if inference_manager is not None else None
+    
+    # 推論コンテキストの再読み込み中・失敗中は degraded（応答は継続）
+    degraded = model_status is not None and model_status.get("health") == "degraded"
     
     return {
-        "status": "ok",
+        "status": "degraded" if degraded else "ok",
         "version": APP_VERSION,
-        "model_loaded": inference_manager is not None and inference_manager.llm is not None
+        "model_loaded": inference_manager is not None and inference_manager.is_ready,
+        "model_state": model_status["state"] if model_status else "failed",
+        "model_progress": model_status["progress"] if model_status else 0.0,
+        "model_detail": model_status["detail"] if model_status else "モデルが設定されていません",
+        "model_error": model_status["error"] if model_status else None,
+        "model_health": model_status.get("health") if model_status else None,
+        "model_contexts": model_status.get("contexts") if model_status else None,
+        "inference": inference_manager.get_stats() if inference_manager is not None else None,
+        "result_cache": result_cache.get_stats() if result_cache is not None else None,
+        "semantic_cache": semantic_cache.get_stats() if semantic_cache is not None else None,
+        "wordcloud_pool": wordcloud_pool.get_stats() if wordcloud_pool is not None else None,
+        "wordcloud_cache": wordcloud_cache.get_stats() if wordcloud_cache is not None else None,
+        "tokenizer": tokenizer_service.get_stats(),
+        "advice_mode": ADVICE_MODE,
+        "lexicon": lexicon.get_stats() if ADVICE_MODE != "llm" else None,
+        "inference_mode": INFERENCE_MODE,
+        "models": get_model_registry().get_stats()
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus テキスト形式のメトリクス"""
+    import metrics
+    
+    if INFERENCE_MODE != "daemon":
+        return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+    
+    # 推論のメトリクスはデーモン側で記録されるため連結する
+    from inference_client import get_inference_client
+    content = metrics.registry.render(include_empty=False)
+    try:
+        content += (await get_inference_client().call("metrics", timeout=5))["text"]
+    except Exception as e:
+        logger.warning(f"⚠️ 推論デーモンのメトリクス取得失敗: {e}")
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
+    import multiprocessing
+    
+    # PyInstaller でexe化した場合の子プロセス（uvicorn のワーカー）対応
+    multiprocessing.freeze_support()
+    
+    if "--inference-daemon" in sys.argv:
+        # DaemonSupervisor から推論デーモンとして起動された
+        from inference_daemon import main as run_inference_daemon
+        run_inference_daemon([arg for arg in sys.argv[1:] if arg != "--inference-daemon"])
+        sys.exit(0)
+    
     import uvicorn
-    from config import API_HOST, API_PORT
+    from config import API_HOST, API_PORT, API_WORKERS
+    from inference_daemon import DaemonSupervisor
+    
+    # 既存DBの初回起動時はワードクラウドの集計を履歴から作る（ワーカー数によらず1回だけ）
+    from wc_aggregates import start_rebuild_if_empty
+    init_db()
+    start_rebuild_if_empty()
     
-    uvicorn.run(app, host=API_HOST, port=API_PORT, log_level="info")
+    # 複数ワーカーではモデルを各ワーカーに読み込まないよう、推論デーモンを共有する
+    supervisor = None
+    if INFERENCE_MODE == "daemon" or API_WORKERS > 1:
+        supervisor = DaemonSupervisor()
+        supervisor.export_env()  # ワーカーは環境変数を引き継いでデーモンに接続する
+        supervisor.start()
+    
+    try:
+        if API_WORKERS > 1:
+            uvicorn.run("main:app", host=API_HOST, port=API_PORT, workers=API_WORKERS, log_level="info")
+        else:
+            uvicorn.run(app, host=API_HOST, port=API_PORT, log_level="info")
+    finally:
+        if supervisor is not None:
+            supervisor.stop()
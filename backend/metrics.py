@@ -0,0 +1,269 @@
+# backend/metrics.py（新規）
+
+import bisect
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Iterable
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# メトリクスの収集（0で無効化。記録処理がすべて何もしなくなる）
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# 秒単位のヒストグラムの既定バケット
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# トークン数のヒストグラムのバケット
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    """ラベル値のエスケープ（\\ " 改行）"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    """{a="x",b="y"} 形式のラベル文字列"""
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """メトリクス共通部分（ラベルごとの値を保持）"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """累積バケット付きのヒストグラム"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル -> [バケットごとの件数（累積ではない）..., 合計, 件数]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 3)
+            state[index] += 1          # 最後のバケットは +Inf
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with ブロックの所要時間を記録"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = self._header()
+        for key, state in sorted(values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    取得時に値を計算するゲージ
+
+    キューの長さなど既に他で保持している値を、記録処理なしで公開する。
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Callable[[], Iterable[tuple[dict[str, str], float]]] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def collect(self) -> list[str]:
+        lines = self._header()
+        if self.callback is None:
+            return lines
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, self._key(labels))} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録とテキスト形式への変換"""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス名が重複しています: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def render(self, include_empty: bool = True) -> str:
+        """
+        Prometheus テキスト形式で出力
+
+        Args:
+            include_empty: 値のないメトリクスも HELP / TYPE を出力するか
+                （推論デーモンの出力と連結する場合は False にして重複を避ける）
+
+        Returns:
+            str: /metrics のレスポンス本文
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            try:
+                collected = metric.collect()
+                if include_empty or len(collected) > 2:
+                    lines.extend(collected)
+            except Exception as e:
+                # 1つのゲージの取得失敗で全体を落とさない
+                lines.append(f"# {metric.name} の取得に失敗: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# グローバルインスタンス
+registry = MetricsRegistry()
+
+
+# =========================
+# 推論
+# =========================
+INFERENCE_QUEUE_WAIT = registry.histogram(
+    "mcapp_inference_queue_wait_seconds", "投入から推論開始までの待ち時間", ["model"])
+INFERENCE_SLOT_WAIT = registry.histogram(
+    "mcapp_inference_slot_wait_seconds", "空きコンテキスト（推論ロック）の取得待ち時間", ["model"])
+INFERENCE_PROMPT_EVAL = registry.histogram(
+    "mcapp_inference_prompt_eval_seconds", "推論開始から最初のトークンまでの時間（プロンプト評価）", ["model"])
+INFERENCE_DECODE = registry.histogram(
+    "mcapp_inference_decode_seconds", "最初のトークンから生成終了までの時間", ["model"])
+INFERENCE_PROMPT_TOKENS = registry.histogram(
+    "mcapp_inference_prompt_tokens", "1リクエストのプロンプトトークン数（再利用分を含む）", ["model"], TOKEN_BUCKETS)
+INFERENCE_GENERATED_TOKENS = registry.histogram(
+    "mcapp_inference_generated_tokens", "1リクエストの生成トークン数", ["model"], TOKEN_BUCKETS)
+INFERENCE_ERRORS = registry.counter(
+    "mcapp_inference_errors_total", "推論エラー数", ["model"])
+INFERENCE_REINITIALIZATIONS = registry.counter(
+    "mcapp_inference_reinitializations_total", "連続エラーによるコンテキスト再初期化の回数", ["model", "result"])
+INFERENCE_TIMEOUTS = registry.counter(
+    "mcapp_inference_timeouts_total", "推論のタイムアウト数", ["model"])
+INFERENCE_CANCELLED = registry.counter(
+    "mcapp_inference_cancelled_total", "キャンセルされた推論数", ["model", "reason"])
+INFERENCE_REJECTED = registry.counter(
+    "mcapp_inference_rejected_total", "待機キュー満杯で断ったリクエスト数（429）")
+INFERENCE_EXPIRED = registry.counter(
+    "mcapp_inference_expired_total", "締め切りに間に合わず推論せずに破棄したジョブ数")
+
+# =========================
+# アドバイス生成
+# =========================
+ADVICE_PARSE = registry.counter(
+    "mcapp_advice_parse_total", "モデル出力のJSON解析結果", ["result"])
+ADVICE_DEGRADED_FALLBACK = registry.counter(
+    "mcapp_advice_degraded_fallback_total", "コンテキスト再読み込み中に辞書判定で応答した数")
+SEMANTIC_CACHE_LOOKUPS = registry.counter(
+    "mcapp_semantic_cache_lookups_total", "類似入力キャッシュの検索結果", ["result"])
+SEMANTIC_CACHE_EMBED = registry.histogram(
+    "mcapp_semantic_cache_embed_seconds", "類似入力キャッシュの埋め込み計算時間",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+SEMANTIC_CACHE_SEARCH = registry.histogram(
+    "mcapp_semantic_cache_search_seconds", "類似入力キャッシュのベクトル検索時間",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+
+# =========================
+# ワードクラウド
+# =========================
+WORDCLOUD_PHASE = registry.histogram(
+    "mcapp_wordcloud_phase_seconds", "ワードクラウド生成の各段階の所要時間", ["phase"])
+
+# =========================
+# データベース
+# =========================
+DB_CHECKOUT = registry.histogram(
+    "mcapp_db_pool_checkout_seconds", "コネクションプールからの接続取得時間",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
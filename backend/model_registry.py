@@ -0,0 +1,325 @@
+# backend/model_registry.py（新規）
+
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock, Thread
+
+import psutil
+
+import metrics
+from config import MODEL_PATH, get_model_dirs
+from inference_manager import CONTEXT_MEMORY_MB, InferenceManager, get_optimal_pool_size
+from inference_protocol import INFERENCE_MODE
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 同時に読み込むモデルのメモリ予算（MB, 0 = 物理メモリの60%）
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# 既定モデルのID（ファイル名から拡張子を除いたもの。未指定なら config の MODEL_PATH）
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "")
+# 読み込みに失敗したモデルを再読み込みするまでの待ち時間（秒。連続で失敗するごとに倍にする）
+MODEL_RELOAD_BACKOFF = float(os.getenv("MODEL_RELOAD_BACKOFF", "30"))
+MODEL_RELOAD_BACKOFF_MAX = float(os.getenv("MODEL_RELOAD_BACKOFF_MAX", "600"))
+
+# ファイル名から量子化形式を取り出す（例: gemma-2-2b-jpn-it-Q4_K_M → Q4_K_M）
+_QUANT_PATTERN = re.compile(r"(?:^|[-_.])((?:I?Q\d+(?:_[A-Z0-9]+)*)|BF16|F16|F32)$", re.IGNORECASE)
+
+
+class UnknownModelError(KeyError):
+    """指定されたモデルが見つからない"""
+
+
+class ModelBudgetError(Exception):
+    """メモリ予算内にモデルを読み込めない"""
+
+
+class ModelInfo:
+    """検出されたGGUFモデル1つ分"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.id = path.stem
+        self.size_bytes = path.stat().st_size
+        match = _QUANT_PATTERN.search(self.id)
+        self.quantization = match.group(1).upper() if match else None
+
+
+def discover_models(model_dirs: list[Path] | None = None) -> dict[str, ModelInfo]:
+    """
+    モデルディレクトリ内のGGUFファイルを列挙
+
+    同じファイル名が複数の場所にある場合は優先順位の高いディレクトリを採用する。
+
+    Args:
+        model_dirs: 探索するディレクトリ（優先順位順）
+
+    Returns:
+        dict: モデルID -> ModelInfo
+    """
+    models: dict[str, ModelInfo] = {}
+    for model_dir in model_dirs or get_model_dirs():
+        if not model_dir.is_dir():
+            continue
+        for path in sorted(model_dir.glob("*.gguf")):
+            if path.stem not in models:
+                models[path.stem] = ModelInfo(path)
+    return models
+
+
+class ModelRegistry:
+    """
+    複数モデルの検出・読み込み・退避を管理
+
+    - 読み込み済みモデルの見積もりメモリ（ファイルサイズ + コンテキスト分）が
+      予算を超える場合、最後に使われてから最も時間の経ったモデルから退避する
+    - 既定モデルは退避しない
+    - 未読み込みのモデルが要求されたらバックグラウンドで読み込み、
+      その間のリクエストには準備中（503 + Retry-After）を返す
+    - 退避するモデルは新規受付を止め、処理中・待機中のリクエストを終えてから解放する
+    """
+
+    def __init__(self, budget_mb: int = MODEL_MEMORY_BUDGET_MB):
+        if budget_mb <= 0:
+            budget_mb = int(psutil.virtual_memory().total * 0.6 / 1024**2)
+        self.budget_bytes = budget_mb * 1024**2
+
+        self.models = discover_models()
+        self.default_id = self._resolve_default()
+        self.warmup: dict | None = None
+
+        # モデルID -> InferenceManager（末尾ほど最近使用）
+        self._managers: OrderedDict[str, InferenceManager] = OrderedDict()
+        self._footprints: dict[str, int] = {}
+        self._last_used: dict[str, float] = {}
+        # モデルID -> 失敗して読み込み直した回数（読み込みに成功したら消す。再読み込みの待ち時間に使う）
+        self._load_failures: dict[str, int] = {}
+        self._lock = Lock()
+
+        logger.info(
+            f"📚 モデル検出: {len(self.models)}件 (既定={self.default_id}, "
+            f"メモリ予算={budget_mb}MB)"
+        )
+
+    def _resolve_default(self) -> str | None:
+        """既定モデルのIDを決定"""
+        if DEFAULT_MODEL:
+            return DEFAULT_MODEL
+        if MODEL_PATH:
+            model_id = Path(MODEL_PATH).stem
+            if model_id not in self.models:
+                self.models[model_id] = ModelInfo(Path(MODEL_PATH))
+            return model_id
+        return next(iter(self.models), None)
+
+    def refresh(self) -> None:
+        """モデルディレクトリを再探索（読み込み済みのモデルはそのまま）"""
+        with self._lock:
+            discovered = discover_models()
+            for model_id, info in self.models.items():
+                discovered.setdefault(model_id, info)
+            self.models = discovered
+
+    def _estimate_footprint(self, info: ModelInfo) -> tuple[int, int]:
+        """(コンテキスト数, 見積もりメモリ) を計算"""
+        pool_size = get_optimal_pool_size(str(info.path))
+        return pool_size, info.size_bytes + pool_size * CONTEXT_MEMORY_MB * 1024**2
+
+    def _evict_for(self, needed: int) -> None:
+        """予算に収まるまでLRUで退避（ロック保持中に呼ぶ）"""
+        used = sum(self._footprints.values())
+        for model_id in list(self._managers):
+            if used + needed <= self.budget_bytes:
+                return
+            manager = self._managers[model_id]
+            # 既定モデルと読み込み途中のモデルは退避しない
+            if model_id == self.default_id or manager.state not in ("ready", "failed"):
+                continue
+
+            logger.info(f"♻️ メモリ予算のためモデルを退避: {model_id}")
+            del self._managers[model_id]
+            used -= self._footprints.pop(model_id)
+            Thread(target=manager.drain_and_shutdown, name=f"evict-{model_id}", daemon=True).start()
+
+        if used + needed > self.budget_bytes:
+            raise ModelBudgetError(
+                f"メモリ予算({self.budget_bytes // 1024**2}MB)内にモデルを読み込めません"
+            )
+
+    def _drop_failed(self, model_id: str, manager: InferenceManager) -> bool:
+        """
+        読み込みに失敗したマネージャーを、待ち時間が過ぎていれば登録から外す（ロック保持中に呼ぶ）
+
+        待ち時間は MODEL_RELOAD_BACKOFF から、読み込み直しても失敗が続くごとに倍になる。
+
+        Returns:
+            bool: 外した場合 True（呼び出し側で新しいマネージャーを作る）
+        """
+        if manager.state != "failed" or manager.failed_at is None:
+            return False
+        failures = self._load_failures.get(model_id, 0)
+        backoff = min(MODEL_RELOAD_BACKOFF * 2 ** failures, MODEL_RELOAD_BACKOFF_MAX)
+        if time.monotonic() - manager.failed_at < backoff:
+            return False
+
+        self._load_failures[model_id] = failures + 1
+        logger.info(f"🔁 読み込みに失敗したモデルを再読み込みします: {model_id} (失敗から{backoff:.0f}秒経過)")
+        del self._managers[model_id]
+        self._footprints.pop(model_id, None)
+        Thread(target=manager.shutdown, name=f"failed-{model_id}", daemon=True).start()
+        return True
+
+    def get_manager(self, model_id: str | None = None) -> InferenceManager:
+        """
+        モデルの推論マネージャーを取得（未読み込みならバックグラウンドで読み込み開始）
+
+        読み込みに失敗したマネージャーは、待ち時間（失敗が続くほど長くなる）が過ぎた後の
+        呼び出しで破棄して読み込み直す。それまでは失敗したマネージャーを返す。
+
+        Args:
+            model_id: モデルID（None の場合は既定モデル）
+
+        Returns:
+            InferenceManager: 推論マネージャー（読み込み中の場合あり。is_ready で確認）
+
+        Raises:
+            UnknownModelError: モデルが見つからない場合
+            ModelBudgetError: メモリ予算内に読み込めない場合
+        """
+        model_id = model_id or self.default_id
+        if model_id is None:
+            raise UnknownModelError("利用できるモデルがありません")
+
+        with self._lock:
+            manager = self._managers.get(model_id)
+            if manager is not None and not self._drop_failed(model_id, manager):
+                if manager.is_ready:
+                    self._load_failures.pop(model_id, None)
+                self._managers.move_to_end(model_id)
+                self._last_used[model_id] = time.time()
+                return manager
+
+            info = self.models.get(model_id)
+            if info is None:
+                raise UnknownModelError(f"モデルが見つかりません: {model_id}")
+
+            pool_size, footprint = self._estimate_footprint(info)
+            self._evict_for(footprint)
+
+            logger.info(f"📥 モデルを読み込みます: {model_id} (見積もり {footprint / 1024**3:.1f}GB)")
+            manager = InferenceManager(model_path=str(info.path), pool_size=pool_size)
+            self._managers[model_id] = manager
+            self._footprints[model_id] = footprint
+            self._last_used[model_id] = time.time()
+
+        manager.start_background(warmup=self.warmup)
+        return manager
+
+    def attach(self, model_id: str, manager: InferenceManager, default: bool = True) -> None:
+        """
+        作成済みの推論マネージャーを登録（ベンチマークでスタブに差し替える場合など）
+
+        Args:
+            model_id: モデルID
+            manager: 推論マネージャー
+            default: 既定モデルにするか
+        """
+        with self._lock:
+            self.models[model_id] = ModelInfo(Path(manager.model_path))
+            self._managers[model_id] = manager
+            self._footprints[model_id] = 0
+            self._last_used[model_id] = time.time()
+            if default:
+                self.default_id = model_id
+
+    def list_models(self) -> list[dict]:
+        """
+        検出済みモデルの一覧（/models 用）
+
+        Returns:
+            list[dict]: id / quantization / size_bytes / state / progress / default / last_used_at
+        """
+        with self._lock:
+            result = []
+            for model_id, info in self.models.items():
+                manager = self._managers.get(model_id)
+                result.append({
+                    "id": model_id,
+                    "quantization": info.quantization,
+                    "size_bytes": info.size_bytes,
+                    "state": manager.state if manager is not None else "unloaded",
+                    "progress": round(manager.progress, 3) if manager is not None else 0.0,
+                    "default": model_id == self.default_id,
+                    "last_used_at": self._last_used.get(model_id),
+                })
+            return result
+
+    def loaded_managers(self) -> list[tuple[str, InferenceManager]]:
+        """読み込み済み（読み込み中を含む）のモデルID と推論マネージャー"""
+        with self._lock:
+            return list(self._managers.items())
+
+    def get_stats(self) -> dict:
+        """読み込み済みモデルとメモリ使用量の見積もり"""
+        with self._lock:
+            return {
+                "loaded": list(self._managers),
+                "estimated_bytes": sum(self._footprints.values()),
+                "budget_bytes": self.budget_bytes,
+            }
+
+    def shutdown(self) -> None:
+        """全モデルをシャットダウン"""
+        with self._lock:
+            managers = list(self._managers.values())
+            self._managers.clear()
+            self._footprints.clear()
+        for manager in managers:
+            manager.shutdown()
+
+
+# グローバルインスタンス
+model_registry: ModelRegistry | None = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    ModelRegistryのシングルトン取得
+
+    INFERENCE_MODE=daemon の場合は推論デーモン上のレジストリを操作する
+    RemoteModelRegistry を返す（このプロセスではモデルを読み込まない）。
+    """
+    global model_registry
+    if INFERENCE_MODE == "daemon":
+        from inference_client import get_remote_registry
+        return get_remote_registry()
+    if model_registry is None:
+        model_registry = ModelRegistry()
+    return model_registry
+
+
+def _per_model(value_of) -> list[tuple[dict[str, str], float]]:
+    """読み込み済みの各モデルについて値を取得（/metrics のゲージ用）"""
+    if model_registry is None:
+        return []
+    return [({"model": manager.model_id}, value_of(manager)) for _, manager in model_registry.loaded_managers()]
+
+
+metrics.registry.gauge(
+    "mcapp_inference_queue_depth", "推論の待機キューの長さ", ["model"],
+    callback=lambda: _per_model(lambda m: m.scheduler.qsize()))
+metrics.registry.gauge(
+    "mcapp_inference_idle_contexts", "空いているコンテキスト数", ["model"],
+    callback=lambda: _per_model(lambda m: m._idle_slots.qsize()))
+metrics.registry.gauge(
+    "mcapp_inference_consecutive_errors", "コンテキストの連続エラー数の最大値（error_count）", ["model"],
+    callback=lambda: _per_model(lambda m: m.error_count))
+metrics.registry.gauge(
+    "mcapp_model_ready", "モデルが推論を受け付けられるか（1 = ready）", ["model"],
+    callback=lambda: _per_model(lambda m: 1 if m.is_ready else 0))
@@ -0,0 +1,41 @@
+# backend/model_routes.py（新規）
+
+from fastapi import APIRouter, HTTPException
+import logging
+
+from inference_manager import ModelNotReadyError
+from model_registry import ModelBudgetError, UnknownModelError, get_model_registry
+from schemas import ModelInfoRead
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/models", response_model=list[ModelInfoRead])
+def list_models():
+    """利用できるモデルの一覧（models ディレクトリを再探索する）"""
+    registry = get_model_registry()
+    registry.refresh()
+    return [ModelInfoRead(**info) for info in registry.list_models()]
+
+
+@router.post("/models/{model_id}/load", response_model=ModelInfoRead, status_code=202)
+def load_model(model_id: str):
+    """
+    モデルをバックグラウンドで読み込む（事前に切り替えておく場合に使用）
+
+    読み込み完了は GET /models の state で確認する。
+    """
+    registry = get_model_registry()
+    try:
+        registry.get_manager(model_id)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=404, detail=e.args[0] if e.args else "モデルが見つかりません") from e
+    except (ModelBudgetError, ModelNotReadyError) as e:
+        # メモリ予算超過・推論デーモンの再起動中
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+    logger.info(f"📥 モデルの読み込みを受け付けました: {model_id}")
+    info = next(info for info in registry.list_models() if info["id"] == model_id)
+    return ModelInfoRead(**info)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer, Text
+from sqlalchemy import Column, Date, DateTime, Float, Index, Integer, String, Text
 from sqlalchemy.sql import func
 
 from database import Base
@@ -13,3 +13,30 @@ class Conversation(Base):
     ai_response_words = Column(Text, nullable=True)
     ai_response_advice = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    # ワードクラウドの元データの版（ユーザーごとの最新ID）を求めるため
+    __table_args__ = (Index("ix_conversations_user_id_id", "user_id", "id"),)
+
+
+class AdviceCacheEntry(Base):
+    """generate_advice の結果キャッシュ（result_cache.py が管理）"""
+    __tablename__ = "advice_cache"
+
+    cache_key = Column(String(64), primary_key=True)
+    minus_words = Column(Text, nullable=False)
+    advice = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+    last_accessed_at = Column(Float, nullable=False, index=True)
+
+
+class WordFrequency(Base):
+    """ワードクラウド用の単語出現数の日次集計（wc_aggregates.py が管理）"""
+    __tablename__ = "word_frequencies"
+
+    # ユーザーIDのない会話は ANONYMOUS_USER_ID（主キーに NULL を使えないため）
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    word = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_word_frequencies_day", "day"),)
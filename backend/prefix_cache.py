@@ -0,0 +1,135 @@
+# backend/prefix_cache.py（新規）
+
+import hashlib
+import logging
+import pickle
+from pathlib import Path
+from threading import Lock
+
+from config import APP_DATA_DIR, get_model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 保存ファイルの形式バージョン（LlamaStateの保存内容を変えたら上げる）
+STATE_FORMAT_VERSION = 1
+
+
+class PrefixStateCache:
+    """
+    固定プロンプト（システムプロンプト）部分のKVキャッシュ状態を保持する
+
+    プレフィックスを一度だけ評価して llama.cpp の状態をスナップショットし、
+    以降のリクエストではその状態を復元してからユーザー入力部分だけを評価する。
+    スナップショットは APP_DATA_DIR 配下に保存し、再起動後も再利用する。
+    """
+
+    def __init__(self, model_path: str, n_ctx: int, cache_dir: Path | None = None):
+        """
+        PrefixStateCacheを初期化
+
+        Args:
+            model_path (str): モデルファイルのパス
+            n_ctx (int): コンテキストサイズ（状態の互換性キーに使用）
+            cache_dir (Path | None): 保存先ディレクトリ
+        """
+        self.model_fingerprint = get_model_fingerprint(model_path)
+        self.n_ctx = n_ctx
+        self.cache_dir = cache_dir or (APP_DATA_DIR / 'cache' / 'prefix_state')
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # key -> (プレフィックスのトークン列, LlamaState)
+        self._states: dict[str, tuple[list[int], object]] = {}
+        self._lock = Lock()
+
+    def _make_key(self, prefix: str, version: str) -> str:
+        """モデル・プロンプトバージョン・プレフィックス内容からキーを生成"""
+        prefix_hash = hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:12]
+        return f"{self.model_fingerprint}_v{version}_{prefix_hash}_ctx{self.n_ctx}"
+
+    def _state_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.state"
+
+    def _load_from_disk(self, key: str, tokens: list[int]):
+        """ディスクからスナップショットを読み込み（不一致なら None）"""
+        path = self._state_path(key)
+        if not path.exists():
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+
+            if payload.get('format') != STATE_FORMAT_VERSION or payload.get('tokens') != tokens:
+                logger.warning(f"⚠️ プレフィックス状態が一致しません。再生成します: {path.name}")
+                return None
+
+            return payload['state']
+        except Exception as e:
+            logger.warning(f"⚠️ プレフィックス状態の読み込み失敗: {e}")
+            return None
+
+    def _save_to_disk(self, key: str, tokens: list[int], state) -> None:
+        """スナップショットをディスクに保存（一時ファイル経由で置き換え）"""
+        path = self._state_path(key)
+        tmp_path = path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(
+                    {'format': STATE_FORMAT_VERSION, 'tokens': tokens, 'state': state},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                )
+            tmp_path.replace(path)
+            logger.info(f"💾 プレフィックス状態を保存: {path.name}")
+        except Exception as e:
+            logger.warning(f"⚠️ プレフィックス状態の保存失敗: {e}")
+
+    def _build(self, llm, key: str, prefix: str) -> tuple[list[int], object]:
+        """プレフィックスを評価してスナップショットを作成"""
+        tokens = llm.tokenize(prefix.encode('utf-8'), add_bos=True, special=True)
+
+        state = self._load_from_disk(key, tokens)
+        if state is None:
+            logger.info(f"🔄 プレフィックスを評価中... ({len(tokens)}トークン)")
+            llm.reset()
+            llm.eval(tokens)
+            state = llm.save_state()
+
+            # ロジットは全語彙×トークン数で巨大になるため最終行のみ保持する
+            # （復元後は必ずユーザー入力を追加評価するので参照されない）
+            state.scores = state.scores[-1:].copy()
+
+            self._save_to_disk(key, tokens, state)
+
+        return tokens, state
+
+    def restore(self, llm, prefix: str, version: str) -> int:
+        """
+        llm のコンテキストにプレフィックスの状態を復元
+
+        既にKVキャッシュの先頭がプレフィックスと一致している場合は何もしない。
+
+        Args:
+            llm: llama_cpp.Llama インスタンス
+            prefix (str): 固定プロンプト文字列
+            version (str): プロンプトテンプレートのバージョン
+
+        Returns:
+            int: 再利用されたプレフィックスのトークン数
+        """
+        key = self._make_key(prefix, version)
+
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is None:
+                entry = self._build(llm, key, prefix)
+                self._states[key] = entry
+
+        tokens, state = entry
+        n_prefix = len(tokens)
+
+        if llm.n_tokens >= n_prefix and list(llm.input_ids[:n_prefix]) == tokens:
+            return n_prefix
+
+        llm.load_state(state)
+        return n_prefix
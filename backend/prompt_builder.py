@@ -0,0 +1,199 @@
+# backend/prompt_builder.py（新規）
+
+import logging
+import os
+import re
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 予算計算の余裕（テンプレート境界でのトークン化の差などを吸収するトークン数）
+PROMPT_SAFETY_MARGIN_TOKENS = int(os.getenv("PROMPT_SAFETY_MARGIN_TOKENS", "16"))
+# トークン化する前に入力文を切り詰める文字数（巨大な入力のトークン化そのものを避ける）
+MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", "4000"))
+
+# 文末（句点・感嘆符・疑問符・改行）と直後の閉じ括弧までを1文とする
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]*(?:[。！？!?\n]+[」』）)]*|$)")
+
+
+class PromptBudgetError(ValueError):
+    """テンプレートの固定部分と生成トークンだけでコンテキストに収まらない"""
+
+
+def split_sentences(text: str) -> list[str]:
+    """
+    文単位に分割（連結すると元の文字列に戻る）
+
+    Args:
+        text: 入力文
+
+    Returns:
+        list[str]: 文のリスト
+    """
+    return [sentence for sentence in _SENTENCE_PATTERN.findall(text) if sentence]
+
+
+class PromptTemplate:
+    """
+    入力文を1か所に差し込むプロンプトテンプレート
+
+    prefix はリクエスト間で共通のためKV状態を再利用する部分（BOS付きでトークン化）、
+    before_input / after_input は入力文の前後に付く固定部分。
+    """
+
+    def __init__(self, name: str, prefix: str, before_input: str, after_input: str, version: str = "0"):
+        self.name = name
+        self.prefix = prefix
+        self.before_input = before_input
+        self.after_input = after_input
+        self.version = version
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:v{self.version}"
+
+    def render(self, user_text: str) -> str:
+        """文字列としてのプロンプト（文字列で推論する場合・計測用）"""
+        return f"{self.prefix}{self.before_input}{user_text}{self.after_input}"
+
+
+class TemplatePrompt:
+    """
+    テンプレートと入力文の組
+
+    推論ワーカーがモデルのトークナイザーでトークン列に組み立てる。
+    """
+
+    def __init__(self, template: PromptTemplate, user_text: str):
+        self.template = template
+        self.user_text = user_text
+
+    def render(self) -> str:
+        return self.template.render(self.user_text)
+
+    def __str__(self) -> str:
+        return self.render()
+
+
+class PromptBuilder:
+    """
+    トークン予算内でプロンプトをトークン列に組み立てる
+
+    - テンプレートの固定部分はモデルごとに一度だけトークン化して保持し、
+      リクエストごとには入力文だけをトークン化する
+    - 入力文に使えるトークン数 = n_ctx - max_tokens - 固定部分 - 余裕
+    - 予算を超える入力は文単位で先頭から収まる分だけ残す
+      （1文目だけで超える場合はトークン単位で切る）
+    - 入力文は special=False でトークン化するため、
+      <start_of_turn> などを書き込まれても制御トークンとして解釈されない
+    """
+
+    def __init__(self, n_ctx: int, safety_margin: int = PROMPT_SAFETY_MARGIN_TOKENS):
+        self.n_ctx = n_ctx
+        self.safety_margin = safety_margin
+        # テンプレートのキー -> (prefix, before_input, after_input) のトークン列
+        self._segments: dict[str, tuple[list[int], list[int], list[int]]] = {}
+        self._lock = Lock()
+        self.stats = {"built": 0, "truncated": 0}
+
+    def _get_segments(self, template: PromptTemplate, tokenize) -> tuple[list[int], list[int], list[int]]:
+        """テンプレートの固定部分のトークン列（初回のみトークン化）"""
+        with self._lock:
+            segments = self._segments.get(template.key)
+            if segments is None:
+                segments = (
+                    tokenize(template.prefix.encode("utf-8"), add_bos=True, special=True),
+                    tokenize(template.before_input.encode("utf-8"), add_bos=False, special=True),
+                    tokenize(template.after_input.encode("utf-8"), add_bos=False, special=True),
+                )
+                self._segments[template.key] = segments
+                logger.info(
+                    f"🧩 テンプレートをトークン化: {template.key} "
+                    f"(固定部分 {sum(len(s) for s in segments)}トークン)"
+                )
+            return segments
+
+    def input_budget(self, template: PromptTemplate, max_tokens: int, tokenize) -> int:
+        """
+        入力文に使えるトークン数
+
+        Raises:
+            PromptBudgetError: 固定部分と生成トークンだけでコンテキストに収まらない場合
+        """
+        fixed = sum(len(segment) for segment in self._get_segments(template, tokenize))
+        budget = self.n_ctx - max_tokens - fixed - self.safety_margin
+        if budget <= 0:
+            raise PromptBudgetError(
+                f"コンテキスト({self.n_ctx})が不足しています: "
+                f"固定部分={fixed}, 生成={max_tokens}, 余裕={self.safety_margin}"
+            )
+        return budget
+
+    def fit(self, text: str, budget: int, tokenize) -> list[int]:
+        """
+        入力文を予算内のトークン列にする
+
+        Args:
+            text: 入力文
+            budget: 使えるトークン数
+            tokenize: モデルのトークナイザー（llama_cpp.Llama.tokenize と同じ形式）
+
+        Returns:
+            list[int]: 入力文のトークン列
+        """
+        def encode(value: str) -> list[int]:
+            return tokenize(value.encode("utf-8"), add_bos=False, special=False)
+
+        tokens = encode(text[:MAX_INPUT_CHARS])
+        if len(tokens) <= budget and len(text) <= MAX_INPUT_CHARS:
+            return tokens
+
+        # 文単位で先頭から収まる分だけ残す
+        kept, used = [], 0
+        for sentence in split_sentences(text[:MAX_INPUT_CHARS]):
+            n_tokens = len(encode(sentence))
+            if used + n_tokens > budget:
+                break
+            kept.append(sentence)
+            used += n_tokens
+
+        if kept:
+            # 連結後のトークン化は文ごとの合計と僅かに異なることがあるため再確認
+            truncated = encode("".join(kept))
+            if len(truncated) <= budget:
+                tokens = truncated
+
+        with self._lock:
+            self.stats["truncated"] += 1
+        logger.warning(f"⚠️ 入力文がトークン予算({budget})を超えたためトリミングしました: {len(kept)}文を使用")
+        return tokens[:budget]
+
+    def build(self, prompt: TemplatePrompt, max_tokens: int, tokenize) -> list[int]:
+        """
+        プロンプトをトークン列に組み立て
+
+        Args:
+            prompt: テンプレートと入力文
+            max_tokens: 生成する最大トークン数
+            tokenize: モデルのトークナイザー
+
+        Returns:
+            list[int]: BOS から始まるトークン列（先頭は prefix のトークン列と一致）
+
+        Raises:
+            PromptBudgetError: 固定部分と生成トークンだけでコンテキストに収まらない場合
+        """
+        budget = self.input_budget(prompt.template, max_tokens, tokenize)
+        prefix, before_input, after_input = self._get_segments(prompt.template, tokenize)
+        user_tokens = self.fit(prompt.user_text, budget, tokenize)
+
+        with self._lock:
+            self.stats["built"] += 1
+        return prefix + before_input + user_tokens + after_input
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, templates=list(self._segments))
@@ -0,0 +1,238 @@
+# backend/result_cache.py（新規）
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import AdviceCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "1024"))
+RESULT_CACHE_DB_ITEMS = int(os.getenv("RESULT_CACHE_DB_ITEMS", "50000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+
+# DB側の件数チェックを行う間隔（書き込み回数）
+_EVICT_INTERVAL = 100
+
+
+def make_cache_key(normalized_text: str, model_fingerprint: str, prompt_version: str, params: dict[str, Any]) -> str:
+    """
+    キャッシュキーを生成
+
+    Args:
+        normalized_text: NFKC正規化済みの入力文
+        model_fingerprint: モデルファイルの識別ハッシュ
+        prompt_version: プロンプトテンプレートのバージョン
+        params: サンプリングパラメータ
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    material = json.dumps(
+        {"text": normalized_text, "model": model_fingerprint, "prompt": prompt_version, "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    generate_advice の2段キャッシュ
+
+    - 1段目: プロセス内のLRU（マイクロ秒で応答）
+    - 2段目: 既存DBの advice_cache テーブル（再起動後も有効）
+    どちらもTTLと件数上限を持つ。
+    """
+
+    def __init__(
+        self,
+        max_memory_items: int = RESULT_CACHE_MEMORY_ITEMS,
+        max_db_items: int = RESULT_CACHE_DB_ITEMS,
+        ttl_seconds: float = RESULT_CACHE_TTL,
+        session_factory=SessionLocal,
+    ):
+        self.max_memory_items = max_memory_items
+        self.max_db_items = max_db_items
+        self.ttl_seconds = ttl_seconds
+        self.session_factory = session_factory
+
+        # key -> (保存時刻, 結果)
+        self._memory: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = Lock()
+        self._writes_since_evict = 0
+
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+        }
+
+    # ===== メモリ層 =====
+    def _get_memory(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return result
+
+    def _put_memory(self, key: str, result: dict[str, Any], stored_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (stored_at, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    # ===== DB層 =====
+    def _get_db(self, key: str) -> tuple[float, dict[str, Any]] | None:
+        db = self.session_factory()
+        try:
+            entry = db.get(AdviceCacheEntry, key)
+            if entry is None:
+                return None
+
+            now = time.time()
+            if now - entry.created_at > self.ttl_seconds:
+                db.delete(entry)
+                db.commit()
+                return None
+
+            entry.last_accessed_at = now
+            db.commit()
+            return entry.created_at, {"minus_words": json.loads(entry.minus_words), "advice": entry.advice}
+        finally:
+            db.close()
+
+    def _put_db(self, key: str, result: dict[str, Any], stored_at: float) -> None:
+        db = self.session_factory()
+        try:
+            db.merge(AdviceCacheEntry(
+                cache_key=key,
+                minus_words=json.dumps(result["minus_words"], ensure_ascii=False),
+                advice=result["advice"],
+                created_at=stored_at,
+                last_accessed_at=stored_at,
+            ))
+            db.commit()
+
+            # to_thread で同時に呼ばれるため、数えて判定するまでをロック内で行う
+            with self._lock:
+                self._writes_since_evict += 1
+                evict = self._writes_since_evict >= _EVICT_INTERVAL
+                if evict:
+                    self._writes_since_evict = 0
+            if evict:
+                self._evict_db(db)
+        finally:
+            db.close()
+
+    def _evict_db(self, db) -> None:
+        """期限切れと上限超過分（最終アクセスが古い順）を削除"""
+        expired = db.query(AdviceCacheEntry).filter(
+            AdviceCacheEntry.created_at < time.time() - self.ttl_seconds
+        ).delete(synchronize_session=False)
+
+        overflow = db.query(AdviceCacheEntry).count() - self.max_db_items
+        if overflow > 0:
+            oldest = (
+                select(AdviceCacheEntry.cache_key)
+                .order_by(AdviceCacheEntry.last_accessed_at.asc())
+                .limit(overflow)
+            )
+            db.query(AdviceCacheEntry).filter(
+                AdviceCacheEntry.cache_key.in_(oldest)
+            ).delete(synchronize_session=False)
+
+        db.commit()
+        logger.info(f"🧹 結果キャッシュ整理: 期限切れ={expired}, 上限超過={max(0, overflow)}")
+
+    # ===== 公開API =====
+    async def get(self, key: str) -> dict[str, Any] | None:
+        """
+        キャッシュを検索（メモリ → DB の順）
+
+        Args:
+            key: make_cache_key で生成したキー
+
+        Returns:
+            dict | None: キャッシュされた結果（なければ None）
+        """
+        result = self._get_memory(key)
+        if result is not None:
+            self.stats["memory_hits"] += 1
+            return result
+
+        try:
+            entry = await asyncio.to_thread(self._get_db, key)
+        except Exception as e:
+            logger.warning(f"⚠️ 結果キャッシュ(DB)の読み込み失敗: {e}")
+            entry = None
+
+        if entry is not None:
+            stored_at, result = entry
+            self._put_memory(key, result, stored_at)
+            self.stats["db_hits"] += 1
+            return result
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, result: dict[str, Any]) -> None:
+        """
+        結果を両方の層に保存
+
+        Args:
+            key: make_cache_key で生成したキー
+            result: {"minus_words": [...], "advice": "..."}
+        """
+        stored_at = time.time()
+        result = {"minus_words": list(result["minus_words"]), "advice": result["advice"]}
+        self._put_memory(key, result, stored_at)
+        self.stats["stores"] += 1
+
+        try:
+            await asyncio.to_thread(self._put_db, key, result, stored_at)
+        except Exception as e:
+            logger.warning(f"⚠️ 結果キャッシュ(DB)の保存失敗: {e}")
+
+    def record_bypass(self) -> None:
+        """キャッシュを使わなかったリクエストを記録"""
+        self.stats["bypassed"] += 1
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        ヒット率などの統計を取得
+
+        Returns:
+            dict: ヒット/ミス数・ヒット率・メモリ層の件数
+        """
+        stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+        stats["memory_items"] = len(self._memory)
+        return stats
+
+
+# グローバルインスタンス
+result_cache = ResultCache() if RESULT_CACHE_ENABLED else None
@@ -0,0 +1,258 @@
+# backend/scheduler.py（新規）
+
+import logging
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 待機キューの上限（超えた分は 429 で即時に断る）
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "16"))
+# ユーザーごとの重み（例: "1=2,2=1"。未指定のユーザーは 1）
+INFERENCE_USER_WEIGHTS = os.getenv("INFERENCE_USER_WEIGHTS", "")
+# サービス時間の指数移動平均の係数
+SERVICE_TIME_ALPHA = 0.2
+# サービス時間の初期推定値（秒、実測されるまで使用）
+INITIAL_SERVICE_TIME = 5.0
+
+
+def parse_user_weights(spec: str) -> dict[int | None, float]:
+    """
+    "1=2,2=0.5" 形式の重み指定を解析
+
+    Args:
+        spec: 重み指定文字列
+
+    Returns:
+        dict: user_id -> 重み
+    """
+    weights: dict[int | None, float] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        user, weight = item.split("=", 1)
+        try:
+            weights[int(user.strip())] = max(0.01, float(weight))
+        except ValueError:
+            logger.warning(f"⚠️ 重み指定を無視しました: {item}")
+    return weights
+
+
+class QueueFullError(Exception):
+    """待機キューが満杯で受け付けられない"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SchedulerClosedError(RuntimeError):
+    """スケジューラが停止済み（モデルの退避・切り替え中）で受け付けられない"""
+
+
+class InferenceJob:
+    """スケジューラに投入する推論1件分"""
+
+    def __init__(self, prompt: str, kwargs: dict, deadline: float, user_id: int | None = None,
+                 on_text=None, cancel_token=None):
+        self.prompt = prompt
+        self.kwargs = kwargs
+        self.deadline = deadline          # time.monotonic 基準の締め切り
+        self.user_id = user_id
+        self.on_text = on_text
+        self.cancel_token = cancel_token
+        self.submitted_at = time.perf_counter()
+        self.future: Future = Future()
+
+
+class InferenceScheduler:
+    """
+    上限付き・締め切り付きの推論キュー
+
+    - キューが満杯なら QueueFullError（Retry-After の推定値付き）
+    - 取り出し時点で締め切りまでに終わらないジョブは推論せずに破棄
+    - user_id ごとのキューを重み付きラウンドロビン（Deficit Round Robin）で取り出し、
+      特定クライアントの大量リクエストが他を待たせないようにする
+    """
+
+    def __init__(self, workers: int, max_queue: int = INFERENCE_MAX_QUEUE,
+                 weights: dict[int | None, float] | None = None):
+        """
+        Args:
+            workers: 並行に処理できるジョブ数（コンテキスト数）
+            max_queue: 待機キューの上限
+            weights: user_id -> 重み
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.weights = weights if weights is not None else parse_user_weights(INFERENCE_USER_WEIGHTS)
+
+        self._cond = Condition()
+        self._queues: dict[int | None, deque[InferenceJob]] = {}
+        self._active: deque[int | None] = deque()   # 待機ジョブのあるユーザー（巡回順）
+        self._deficit: dict[int | None, float] = {}
+        self._size = 0
+        self._closed = False
+
+        self.service_time = INITIAL_SERVICE_TIME
+        self._service_time_measured = False
+        self.stats = {"submitted": 0, "rejected": 0, "expired": 0}
+
+    # ===== 投入 =====
+    def submit(self, job: InferenceJob) -> Future:
+        """
+        ジョブを投入
+
+        Args:
+            job: 推論ジョブ
+
+        Returns:
+            Future: 推論結果
+
+        Raises:
+            QueueFullError: キューが満杯の場合
+            SchedulerClosedError: 停止済みの場合
+        """
+        with self._cond:
+            if self._closed:
+                raise SchedulerClosedError("スケジューラは停止しています")
+
+            if self._size >= self.max_queue:
+                self.stats["rejected"] += 1
+                metrics.INFERENCE_REJECTED.inc()
+                retry_after = self._estimate_wait(self._size)
+                logger.warning(f"🚦 推論キューが満杯です ({self._size}/{self.max_queue}), Retry-After={retry_after}秒")
+                raise QueueFullError("推論キューが満杯です", retry_after=retry_after)
+
+            user_queue = self._queues.get(job.user_id)
+            if user_queue is None:
+                user_queue = self._queues[job.user_id] = deque()
+            if not user_queue:
+                self._active.append(job.user_id)
+                self._deficit.setdefault(job.user_id, 0.0)
+
+            user_queue.append(job)
+            self._size += 1
+            self.stats["submitted"] += 1
+            self._cond.notify()
+
+        return job.future
+
+    # ===== 取り出し =====
+    def _pop_fair(self) -> InferenceJob:
+        """重み付きラウンドロビンで次のジョブを取り出す（ロック保持中に呼ぶ）"""
+        while True:
+            user = self._active[0]
+            if self._deficit[user] < 1.0:
+                # 今回の巡回分を付与して次のユーザーへ
+                self._deficit[user] += self.weights.get(user, 1.0)
+                self._active.rotate(-1)
+                continue
+
+            user_queue = self._queues[user]
+            job = user_queue.popleft()
+            self._size -= 1
+            self._deficit[user] -= 1.0
+
+            if not user_queue:
+                # 待機ジョブがなくなったユーザーは巡回から外す（貯めた分は破棄）
+                self._active.popleft()
+                self._deficit[user] = 0.0
+            return job
+
+    def next_job(self, timeout: float | None = None) -> InferenceJob | None:
+        """
+        次に実行するジョブを取得（締め切りに間に合わないジョブは破棄）
+
+        Args:
+            timeout: 待機する最大秒数
+
+        Returns:
+            InferenceJob | None: ジョブ（停止時・タイムアウト時は None）
+        """
+        with self._cond:
+            while True:
+                while self._size == 0 and not self._closed:
+                    if not self._cond.wait(timeout=timeout):
+                        return None
+                if self._closed and self._size == 0:
+                    return None
+
+                job = self._pop_fair()
+
+                if job.cancel_token is not None and job.cancel_token.cancelled:
+                    job.future.cancel()
+                    continue
+
+                # 推論に平均的な時間がかかると締め切りを過ぎるジョブは実行しない
+                if time.monotonic() + self.service_time > job.deadline:
+                    self.stats["expired"] += 1
+                    metrics.INFERENCE_EXPIRED.inc()
+                    logger.warning("⌛ 締め切りに間に合わないジョブを破棄しました")
+                    if job.future.set_running_or_notify_cancel():
+                        job.future.set_exception(TimeoutError("締め切りまでに推論を開始できませんでした"))
+                    continue
+
+                return job
+
+    # ===== サービス時間 =====
+    def record_service_time(self, seconds: float) -> None:
+        """実測したサービス時間（推論時間）を指数移動平均に反映"""
+        with self._cond:
+            if not self._service_time_measured:
+                self.service_time = seconds
+                self._service_time_measured = True
+            else:
+                self.service_time += SERVICE_TIME_ALPHA * (seconds - self.service_time)
+
+    def _estimate_wait(self, queued: int) -> int:
+        """待機ジョブ数とサービス時間から Retry-After（秒）を推定"""
+        return max(1, math.ceil((queued / self.workers + 1) * self.service_time))
+
+    def estimate_retry_after(self) -> int:
+        """現在のキュー長から Retry-After（秒）を推定"""
+        with self._cond:
+            return self._estimate_wait(self._size)
+
+    def is_full(self) -> bool:
+        with self._cond:
+            return self._size >= self.max_queue
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._size
+
+    def close(self, drain: bool = False) -> None:
+        """
+        停止（以降の投入は受け付けない）
+
+        Args:
+            drain: True の場合は待機中のジョブを処理し終えてからワーカーを止める
+                   （False の場合は待機中のジョブをキャンセル）
+        """
+        with self._cond:
+            self._closed = True
+            if not drain:
+                for user_queue in self._queues.values():
+                    while user_queue:
+                        user_queue.popleft().future.cancel()
+                self._active.clear()
+                self._size = 0
+            self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queued"] = self._size
+            stats["max_queue"] = self.max_queue
+            stats["service_time_seconds"] = self.service_time
+        return stats
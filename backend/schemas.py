@@ -9,6 +9,12 @@ from pydantic import BaseModel, Field
 # =============================
 class InputData(BaseModel):
     text: str = Field(min_length=1, max_length=140, description="入力文")
+    user_id: int | None = Field(None, description="ユーザーID（推論キューの公平な割り当てに使用）")
+    temperature: float | None = Field(
+        None, ge=0.0, le=2.0,
+        description="温度パラメータ（> 0 を指定すると結果キャッシュを使わず再生成）"
+    )
+    model: str | None = Field(None, description="使用するモデルのID（/models で取得。省略時は既定モデル）")
 
 
 class OutputData(BaseModel):
@@ -16,12 +22,55 @@ class OutputData(BaseModel):
     advice: str = Field(..., description="アドバイス文")
 
 
+# バッチ解析の1リクエストあたりの最大件数（メモリ使用量を一定に保つ）
+MAX_BATCH_ITEMS = 32
+
+# 会話履歴に保存できる入力文の最大文字数（バッチ解析で履歴を再解析できるよう1件の上限にも使う）
+MAX_USER_INPUT_CHARS = 500
+
+
+class BatchInputData(BaseModel):
+    texts: list[str] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS, description="入力文のリスト")
+    user_id: int | None = Field(None, description="ユーザーID（推論キューの公平な割り当てに使用）")
+    temperature: float | None = Field(
+        None, ge=0.0, le=2.0,
+        description="温度パラメータ（> 0 を指定すると結果キャッシュを使わず再生成）"
+    )
+    model: str | None = Field(None, description="使用するモデルのID（/models で取得。省略時は既定モデル）")
+
+
+class BatchItemResult(BaseModel):
+    index: int = Field(..., description="texts 内の位置")
+    ok: bool = Field(..., description="解析に成功したか")
+    result: OutputData | None = Field(None, description="解析結果（成功時）")
+    error: str | None = Field(None, description="エラー内容（失敗時）")
+
+
+class BatchOutputData(BaseModel):
+    results: list[BatchItemResult] = Field(..., description="入力と同じ順序の結果")
+    succeeded: int = Field(..., description="成功件数")
+    failed: int = Field(..., description="失敗件数")
+
+
+# =============================
+# モデル一覧用スキーマ
+# =============================
+class ModelInfoRead(BaseModel):
+    id: str = Field(..., description="モデルID（GGUFファイル名から拡張子を除いたもの）")
+    quantization: str | None = Field(None, description="量子化形式（例: Q4_K_M, Q8_0）")
+    size_bytes: int = Field(..., description="ファイルサイズ")
+    state: str = Field(..., description="unloaded / loading / warming / ready / failed / draining")
+    progress: float = Field(..., description="読み込みの進捗（0.0〜1.0）")
+    default: bool = Field(..., description="既定モデルか")
+    last_used_at: float | None = Field(None, description="最後に使われた時刻（UNIX時間）")
+
+
 # =============================
 # 会話履歴用スキーマ
 # =============================
 class ConversationCreate(BaseModel):
     user_id: int | None = None
-    user_input: str = Field(..., min_length=1, max_length=500)
+    user_input: str = Field(..., min_length=1, max_length=MAX_USER_INPUT_CHARS)
     ai_response_words: list[str] = Field(..., description="検出されたマイナスワード")
     ai_response_advice: str = Field(..., min_length=1, description="アドバイス文")
 
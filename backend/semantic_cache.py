@@ -0,0 +1,712 @@
+# backend/semantic_cache.py（新規）
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Any
+
+import numpy as np
+
+import metrics
+from config import APP_DATA_DIR, get_model_dirs, get_model_fingerprint
+from lexicon import lexicon, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 埋め込みモデルが見つからない場合は有効にしても動作しない（完全一致キャッシュのみ）
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+# 埋め込みモデル（パス指定がなければモデルディレクトリからファイル名で探す）
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "multilingual-e5-small-q8_0.gguf")
+# 入力文の前に付ける文字列（e5系は "query: " を付けて学習されている）
+EMBEDDING_PREFIX = os.getenv("EMBEDDING_PREFIX", "query: ")
+EMBEDDING_N_CTX = int(os.getenv("EMBEDDING_N_CTX", "512"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "2"))
+# これ以上のコサイン類似度なら同じ入力とみなす
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "200000"))
+# 検索時に走査するクラスタ数（多いほど取りこぼしが減り、遅くなる）
+SEMANTIC_CACHE_NPROBE = int(os.getenv("SEMANTIC_CACHE_NPROBE", "8"))
+# インデックスをファイルに保存する間隔（秒）
+SEMANTIC_CACHE_SAVE_INTERVAL = float(os.getenv("SEMANTIC_CACHE_SAVE_INTERVAL", "60"))
+# インデックスがない場合に conversations テーブルから登録する件数（新しい順）
+SEMANTIC_CACHE_BACKFILL_LIMIT = int(os.getenv("SEMANTIC_CACHE_BACKFILL_LIMIT", "5000"))
+SEMANTIC_CACHE_DIR = APP_DATA_DIR / "cache" / "semantic"
+
+# この件数までは全件を走査する（以降はクラスタに分割）
+_IVF_MIN_ENTRIES = 4096
+# クラスタに振り分けていない追加分がこの件数を超えたら並べ直す
+_IVF_MAX_TAIL = 4096
+# 重心の学習に使う1クラスタあたりの標本数と反復回数
+_TRAIN_ROWS_PER_CLUSTER = 32
+_TRAIN_ITERATIONS = 8
+# 上限を超えたときに最終利用が古い順に削除する割合
+_EVICT_RATIO = 0.1
+# 一度に行列積で計算する行数（一時メモリの上限）
+_ASSIGN_CHUNK = 8192
+
+
+def find_embedding_model() -> str | None:
+    """
+    埋め込みモデルのパスを取得
+
+    Returns:
+        str | None: モデルファイルのパス（見つからない場合は None）
+    """
+    if EMBEDDING_MODEL_PATH:
+        return EMBEDDING_MODEL_PATH if Path(EMBEDDING_MODEL_PATH).exists() else None
+    for model_dir in get_model_dirs():
+        model_path = model_dir / EMBEDDING_MODEL_NAME
+        if model_path.exists():
+            return str(model_path)
+    return None
+
+
+class LlamaEmbedder:
+    """llama.cpp の埋め込みモードで文ベクトルを計算（平均プーリング・L2正規化済み）"""
+
+    def __init__(self, model_path: str):
+        from llama_cpp import LLAMA_POOLING_TYPE_MEAN, Llama
+
+        self.model_path = model_path
+        self.model_id = Path(model_path).stem
+        self.fingerprint = get_model_fingerprint(model_path)
+        self._llm = Llama(
+            model_path=model_path,
+            embedding=True,
+            pooling_type=LLAMA_POOLING_TYPE_MEAN,
+            n_ctx=EMBEDDING_N_CTX,
+            n_threads=EMBEDDING_THREADS,
+            verbose=False,
+        )
+        self.dim = self._llm.n_embd()
+        self._lock = Lock()  # Llama インスタンスはスレッドセーフではない
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        文ベクトルを計算
+
+        Args:
+            text: 正規化済みの入力文
+
+        Returns:
+            np.ndarray: 長さ1に正規化した float32 のベクトル
+        """
+        with self._lock:
+            vector = self._llm.embed(EMBEDDING_PREFIX + text, truncate=True)
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.ndim == 2:
+            # プーリングに対応しないモデルはトークンごとのベクトルを返す
+            vector = vector.mean(axis=0)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+
+# =========================
+# ベクトルインデックス
+# =========================
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """各ベクトルに最も近い重心の番号"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = vectors[start:start + _ASSIGN_CHUNK]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(sample: np.ndarray, n_clusters: int, seed: int = 0) -> np.ndarray:
+    """
+    球面 k-means で重心を学習
+
+    Args:
+        sample: 正規化済みベクトルの標本
+        n_clusters: クラスタ数
+        seed: 乱数シード
+
+    Returns:
+        np.ndarray: 正規化済みの重心（n_clusters × 次元）
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(_TRAIN_ITERATIONS):
+        assignments = _nearest(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_clusters)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+
+        sums = np.empty_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        # 空になったクラスタは標本から選び直す
+        sums[~nonempty] = sample[rng.choice(len(sample), int((~nonempty).sum()))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """
+    正規化済みベクトルの近傍検索インデックス（内積 = コサイン類似度）
+
+    - _IVF_MIN_ENTRIES 件までは全件を1回の行列積で走査する
+    - それ以上は k-means の重心で約 sqrt(N) 個のクラスタに分け、行をクラスタ順に
+      並べて保持する。検索では重心との類似度が高い nprobe 個のクラスタの連続領域と、
+      まだ並べ直していない末尾の追加分だけを走査する（10万件でも数千行の走査で済む）
+    - 各行は名前空間（生成モデルとプロンプトの版）を持ち、異なる名前空間の行とは一致しない
+
+    スレッドセーフではないため、呼び出し側でロックすること。
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self.size = 0
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._namespaces = np.zeros(capacity, dtype=np.int32)
+        self._clusters = np.zeros(capacity, dtype=np.int32)
+        # 行ごとの正規化済み入力文と結果
+        self.texts: list[str] = []
+        self.results: list[dict[str, Any]] = []
+        self.namespace_names: list[str] = []
+        self._namespace_ids: dict[str, int] = {}
+        self._rows: dict[tuple[int, str], int] = {}
+        # クラスタ c の行は [offsets[c], offsets[c + 1])。indexed 行目以降は未整列の追加分
+        self.centroids: np.ndarray | None = None
+        self._offsets: np.ndarray | None = None
+        self.indexed = 0
+        self.trained_size = 0
+
+    def _namespace_id(self, namespace: str) -> int:
+        namespace_id = self._namespace_ids.get(namespace)
+        if namespace_id is None:
+            namespace_id = self._namespace_ids[namespace] = len(self.namespace_names)
+            self.namespace_names.append(namespace)
+        return namespace_id
+
+    def _grow(self) -> None:
+        capacity = len(self._vectors) * 2
+        for name in ("_vectors", "_last_used", "_namespaces", "_clusters"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _permute(self, order: np.ndarray) -> None:
+        """行を order の順に並べ替える（order に含まれない行は削除）"""
+        n = len(order)
+        for name in ("_vectors", "_last_used", "_namespaces", "_clusters"):
+            array = getattr(self, name)
+            array[:n] = array[order]
+        self.texts = [self.texts[i] for i in order]
+        self.results = [self.results[i] for i in order]
+        self.size = n
+        self._rows = {
+            (int(self._namespaces[row]), text): row for row, text in enumerate(self.texts)
+        }
+
+    # ===== 検索 =====
+    def search(self, query: np.ndarray, namespace: str, nprobe: int = SEMANTIC_CACHE_NPROBE) -> tuple[int, float]:
+        """
+        最も類似度の高い行を検索
+
+        Args:
+            query: 正規化済みの検索ベクトル
+            namespace: 名前空間
+            nprobe: 走査するクラスタ数
+
+        Returns:
+            tuple: (行番号, 類似度)（該当なしは (-1, -1.0)）
+        """
+        best_row, best_score = -1, -1.0
+        namespace_id = self._namespace_ids.get(namespace)
+        if namespace_id is None:
+            return best_row, best_score
+
+        def scan(start: int, end: int) -> None:
+            nonlocal best_row, best_score
+            if end <= start:
+                return
+            scores = self._vectors[start:end] @ query
+            scores[self._namespaces[start:end] != namespace_id] = -1.0
+            index = int(np.argmax(scores))
+            if scores[index] > best_score:
+                best_row, best_score = start + index, float(scores[index])
+
+        if self.centroids is None:
+            scan(0, self.size)
+            return best_row, best_score
+
+        similarities = self.centroids @ query
+        nprobe = min(nprobe, len(similarities))
+        for cluster in np.argpartition(similarities, -nprobe)[-nprobe:]:
+            scan(int(self._offsets[cluster]), int(self._offsets[cluster + 1]))
+        scan(self.indexed, self.size)
+        return best_row, best_score
+
+    def touch(self, row: int) -> None:
+        """最終利用時刻を更新（削除の優先順位に使う）"""
+        self._last_used[row] = time.time()
+
+    # ===== 追加・削除 =====
+    def add(self, vector: np.ndarray, namespace: str, text: str, result: dict[str, Any]) -> int:
+        """
+        行を追加（同じ名前空間・入力文の行があれば結果を上書き）
+
+        Returns:
+            int: 行番号
+        """
+        namespace_id = self._namespace_id(namespace)
+        row = self._rows.get((namespace_id, text))
+        if row is not None:
+            self.results[row] = result
+            self.touch(row)
+            return row
+
+        if self.size == len(self._vectors):
+            self._grow()
+        row = self.size
+        self._vectors[row] = vector
+        self._namespaces[row] = namespace_id
+        self._clusters[row] = _nearest(vector[None, :], self.centroids)[0] if self.centroids is not None else 0
+        self.texts.append(text)
+        self.results.append(result)
+        self._rows[(namespace_id, text)] = row
+        self.size += 1
+        self.touch(row)
+        return row
+
+    def evict(self, count: int) -> None:
+        """最終利用が古い順に count 行を削除"""
+        count = min(count, self.size)
+        if count <= 0:
+            return
+        dropped = np.argpartition(self._last_used[:self.size], count - 1)[:count]
+        keep = np.ones(self.size, dtype=bool)
+        keep[dropped] = False
+        self._permute(np.flatnonzero(keep))
+        if self.size < _IVF_MIN_ENTRIES:
+            self.centroids, self._offsets, self.indexed, self.trained_size = None, None, 0, 0
+        else:
+            self.reindex()
+
+    # ===== クラスタ =====
+    @property
+    def n_clusters(self) -> int:
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def needs_training(self) -> bool:
+        """重心の（再）学習が必要か（初回と、学習時から件数が倍になった時）"""
+        return self.size >= _IVF_MIN_ENTRIES and (self.centroids is None or self.size >= 2 * self.trained_size)
+
+    def needs_reindex(self) -> bool:
+        return self.centroids is not None and self.size - self.indexed > _IVF_MAX_TAIL
+
+    def training_sample(self, max_rows: int, seed: int = 0) -> np.ndarray:
+        """重心の学習に使う標本（コピー）"""
+        if self.size <= max_rows:
+            return self._vectors[:self.size].copy()
+        rows = np.random.default_rng(seed).choice(self.size, max_rows, replace=False)
+        return self._vectors[rows]
+
+    def set_centroids(self, centroids: np.ndarray) -> None:
+        """重心を入れ替えて全行を振り分け直す"""
+        self.centroids = centroids
+        self._clusters[:self.size] = _nearest(self._vectors[:self.size], centroids)
+        self.trained_size = self.size
+        self.reindex()
+
+    def reindex(self) -> None:
+        """行をクラスタ順に並べ直す（末尾の追加分もクラスタの連続領域に入る）"""
+        self._permute(np.argsort(self._clusters[:self.size], kind="stable"))
+        self._offsets = np.searchsorted(self._clusters[:self.size], np.arange(self.n_clusters + 1))
+        self.indexed = self.size
+
+    # ===== 永続化 =====
+    def save(self, path: Path, meta: dict[str, Any]) -> None:
+        """
+        インデックスを1つの .npz ファイルに保存（一時ファイルに書いてから置き換える）
+
+        Args:
+            path: 保存先
+            meta: 一緒に保存する付加情報（埋め込みモデルの識別子など）
+        """
+        n = self.size
+        arrays = {
+            "vectors": self._vectors[:n].copy(),
+            "last_used": self._last_used[:n].copy(),
+            "namespaces": self._namespaces[:n].copy(),
+            "clusters": self._clusters[:n].copy(),
+            "centroids": self.centroids if self.centroids is not None else np.zeros((0, self.dim), np.float32),
+        }
+        document = dict(
+            meta,
+            dim=self.dim,
+            indexed=self.indexed,
+            trained_size=self.trained_size,
+            namespaces=list(self.namespace_names),
+            texts=list(self.texts),
+            results=list(self.results),
+        )
+        arrays["meta"] = np.frombuffer(json.dumps(document, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 複数のAPIワーカーが同じファイルに保存しても壊れないよう、一時ファイルはプロセスごと
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["VectorIndex", dict[str, Any]]:
+        """
+        保存したインデックスを読み込む
+
+        Returns:
+            tuple: (インデックス, 保存時の付加情報)
+        """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            vectors = data["vectors"]
+            n = len(vectors)
+            index = cls(meta["dim"], capacity=max(1024, n))
+            index._vectors[:n] = vectors
+            index._last_used[:n] = data["last_used"]
+            index._namespaces[:n] = data["namespaces"]
+            index._clusters[:n] = data["clusters"]
+            centroids = data["centroids"]
+
+        index.size = n
+        index.texts = meta.pop("texts")
+        index.results = meta.pop("results")
+        index.namespace_names = meta.pop("namespaces")
+        index._namespace_ids = {name: i for i, name in enumerate(index.namespace_names)}
+        index._rows = {
+            (int(index._namespaces[row]), text): row for row, text in enumerate(index.texts)
+        }
+        index.trained_size = meta.pop("trained_size")
+        indexed = meta.pop("indexed")
+        if len(centroids):
+            index.centroids = centroids
+            index._offsets = np.searchsorted(index._clusters[:indexed], np.arange(len(centroids) + 1))
+            index.indexed = indexed
+        return index, meta
+
+
+# =========================
+# 結果の流用
+# =========================
+def adapt_result(text: str, stored: dict[str, Any]) -> dict[str, Any] | None:
+    """
+    類似入力の結果を今回の入力に合わせる
+
+    アドバイスはそのまま使い、マイナスワードは今回の入力に含まれるものだけ残す。
+    言い換えで残らなかった分は辞書判定で今回の入力から抜き出した節で補う。
+    元の結果と食い違う（マイナスワードの有無が変わる）場合は流用しない。
+
+    Args:
+        text: 正規化済みの今回の入力文
+        stored: 類似入力の結果
+
+    Returns:
+        dict | None: {"minus_words": [...], "advice": "..."}（流用できない場合は None）
+    """
+    stored_words = [normalize_text(word) for word in stored["minus_words"]]
+    words = [word for word in stored_words if word and word in text]
+
+    if len(words) < len(stored_words) or not stored_words:
+        verdict = lexicon.analyze(text)
+        if not stored_words:
+            return None if verdict.minus_words else {"minus_words": [], "advice": stored["advice"]}
+        for word in verdict.minus_words:
+            if not any(word in kept or kept in word for kept in words):
+                words.append(word)
+
+    if not words:
+        return None
+    return {"minus_words": words, "advice": stored["advice"]}
+
+
+# =========================
+# 類似入力キャッシュ
+# =========================
+class SemanticCache:
+    """
+    generate_advice の前段に置く類似入力キャッシュ
+
+    「どうせ私なんて無理」と「どうせ僕には無理だ」のような言い換えは完全一致の
+    キャッシュに当たらないため、入力文の埋め込みベクトルで過去の入力を検索し、
+    コサイン類似度がしきい値以上なら保存済みの結果を流用する。
+
+    - 埋め込みモデルの読み込みは start() でバックグラウンドに行う
+    - インデックスは APP_DATA_DIR/cache/semantic に埋め込みモデルごとに保存し、
+      初回は conversations テーブルの履歴から作る
+    - 件数が上限を超えたら最終利用が古い順に削除する
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        nprobe: int = SEMANTIC_CACHE_NPROBE,
+        directory: Path = SEMANTIC_CACHE_DIR,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.nprobe = nprobe
+        self.directory = directory
+
+        self.state = "idle"  # idle / loading / ready / disabled / failed
+        self.embedder: LlamaEmbedder | None = None
+        self.index: VectorIndex | None = None
+        self.path: Path | None = None
+        self._lock = Lock()               # インデックスの操作
+        self._maintenance_lock = Lock()   # 重心の学習・並べ直し（同時に1つだけ）
+        self._closing = Event()
+        self._dirty = False
+        self._last_saved = time.monotonic()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "rejected": 0,  # 類似度は十分だがマイナスワードが食い違った
+            "stores": 0,
+            "backfilled": 0,
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    # ===== 起動・終了 =====
+    def start(self, backfill_namespace: str | None = None) -> None:
+        """
+        埋め込みモデルとインデックスの読み込みをバックグラウンドで開始
+
+        Args:
+            backfill_namespace: 履歴から登録する行の名前空間（None の場合は履歴を使わない）
+        """
+        if self.state != "idle":
+            return
+        self.state = "loading"
+        Thread(target=self._load, args=(backfill_namespace,), daemon=True, name="semantic-cache").start()
+
+    def _load(self, backfill_namespace: str | None) -> None:
+        model_path = find_embedding_model()
+        if model_path is None:
+            self.state = "disabled"
+            logger.info(f"ℹ️ 埋め込みモデルが見つからないため類似入力キャッシュは無効です: {EMBEDDING_MODEL_NAME}")
+            return
+
+        try:
+            self.embedder = LlamaEmbedder(model_path)
+            self.path = self.directory / f"index-{self.embedder.fingerprint}.npz"
+
+            index = None
+            if self.path.exists():
+                try:
+                    index, _ = VectorIndex.load(self.path)
+                except Exception as e:
+                    logger.warning(f"⚠️ 類似入力インデックスの読み込み失敗（作り直します）: {e}")
+            if index is not None and index.dim != self.embedder.dim:
+                index = None
+
+            backfill = index is None
+            self.index = index or VectorIndex(self.embedder.dim)
+            self.state = "ready"
+            logger.info(
+                f"✅ 類似入力キャッシュ準備完了: {self.embedder.model_id} "
+                f"({self.index.size}件, {self.index.n_clusters}クラスタ)"
+            )
+        except Exception as e:
+            self.state = "failed"
+            logger.error(f"❌ 類似入力キャッシュの初期化失敗: {e}")
+            return
+
+        if backfill and backfill_namespace is not None:
+            self._backfill(backfill_namespace)
+
+    def _backfill(self, namespace: str) -> None:
+        """conversations テーブルの履歴をインデックスに登録"""
+        from database import SessionLocal
+        from models import Conversation
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Conversation.user_input, Conversation.ai_response_words, Conversation.ai_response_advice)
+                .filter(Conversation.ai_response_advice.isnot(None))
+                .order_by(Conversation.created_at.desc())
+                .limit(SEMANTIC_CACHE_BACKFILL_LIMIT)
+                .all()
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 類似入力キャッシュ用の履歴取得失敗: {e}")
+            return
+        finally:
+            db.close()
+
+        for user_input, words, advice in rows:
+            if self._closing.is_set():
+                break
+            try:
+                minus_words = json.loads(words) if words else []
+                self._store(user_input, namespace, {"minus_words": list(minus_words), "advice": advice})
+                self.stats["backfilled"] += 1
+            except Exception as e:
+                logger.debug(f"履歴の登録をスキップ: {e}")
+
+        logger.info(f"📚 類似入力キャッシュに履歴を登録: {self.stats['backfilled']}件")
+        self.save()
+
+    def shutdown(self) -> None:
+        """履歴の登録を止め、未保存の変更を保存"""
+        self._closing.set()
+        self.save()
+
+    # ===== 検索・登録 =====
+    def _lookup(self, inputed_text: str, namespace: str) -> tuple[dict[str, Any] | None, np.ndarray]:
+        text = normalize_text(inputed_text)
+        with metrics.SEMANTIC_CACHE_EMBED.time():
+            vector = self.embedder.embed(text)
+
+        with self._lock:
+            with metrics.SEMANTIC_CACHE_SEARCH.time():
+                row, score = self.index.search(vector, namespace, self.nprobe)
+            if row < 0 or score < self.threshold:
+                self.stats["misses"] += 1
+                metrics.SEMANTIC_CACHE_LOOKUPS.inc(result="miss")
+                return None, vector
+            stored = self.index.results[row]
+            self.index.touch(row)
+
+        result = adapt_result(text, stored)
+        if result is None:
+            self.stats["rejected"] += 1
+            metrics.SEMANTIC_CACHE_LOOKUPS.inc(result="rejected")
+            return None, vector
+
+        self.stats["hits"] += 1
+        metrics.SEMANTIC_CACHE_LOOKUPS.inc(result="hit")
+        logger.info(f"🧲 類似入力キャッシュヒット (類似度 {score:.3f}): {inputed_text[:50]}...")
+        return result, vector
+
+    def _store(self, inputed_text: str, namespace: str, result: dict[str, Any], vector: np.ndarray | None = None) -> None:
+        text = normalize_text(inputed_text)
+        if vector is None:
+            vector = self.embedder.embed(text)
+        result = {"minus_words": list(result["minus_words"]), "advice": result["advice"]}
+        with self._lock:
+            self.index.add(vector, namespace, text, result)
+            self._dirty = True
+        self._maintain()
+        self._maybe_save()
+
+    def _maintain(self) -> None:
+        """件数上限の削除・重心の学習・並べ直し"""
+        if not self._maintenance_lock.acquire(blocking=False):
+            return  # 他のスレッドが実行中
+        try:
+            with self._lock:
+                index = self.index
+                if index.size > self.max_entries:
+                    index.evict(index.size - int(self.max_entries * (1 - _EVICT_RATIO)))
+                    logger.info(f"🧹 類似入力キャッシュ整理: 残り{index.size}件")
+                if not index.needs_training():
+                    if index.needs_reindex():
+                        index.reindex()
+                    return
+                n_clusters = max(16, int(math.sqrt(index.size)))
+                sample = index.training_sample(n_clusters * _TRAIN_ROWS_PER_CLUSTER)
+
+            # 学習は時間がかかるためロックの外で行い、検索を止めない
+            centroids = train_centroids(sample, n_clusters)
+            with self._lock:
+                self.index.set_centroids(centroids)
+                size = self.index.size
+            logger.info(f"🗂️ 類似入力インデックスを再構築: {size}件 / {n_clusters}クラスタ")
+        finally:
+            self._maintenance_lock.release()
+
+    def _maybe_save(self) -> None:
+        if self._dirty and time.monotonic() - self._last_saved >= SEMANTIC_CACHE_SAVE_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        """未保存の変更があればインデックスをファイルに保存"""
+        if self.index is None or not self._dirty:
+            return
+        try:
+            with self._lock:
+                self.index.save(self.path, {"embedding_model": self.embedder.fingerprint})
+                self._dirty = False
+            self._last_saved = time.monotonic()
+        except Exception as e:
+            logger.warning(f"⚠️ 類似入力インデックスの保存失敗: {e}")
+
+    # ===== 公開API =====
+    async def get(self, inputed_text: str, namespace: str) -> tuple[dict[str, Any] | None, np.ndarray | None]:
+        """
+        類似入力の結果を検索
+
+        Args:
+            inputed_text: ユーザーの入力文章
+            namespace: 名前空間（生成モデルとプロンプトの版）
+
+        Returns:
+            tuple: (流用した結果（なければ None）, 入力文の埋め込み（put に渡すと再計算しない）)
+        """
+        if not self.ready:
+            return None, None
+        try:
+            return await asyncio.to_thread(self._lookup, inputed_text, namespace)
+        except Exception as e:
+            logger.warning(f"⚠️ 類似入力キャッシュの検索失敗: {e}")
+            return None, None
+
+    async def put(self, inputed_text: str, namespace: str, result: dict[str, Any], vector: np.ndarray | None = None) -> None:
+        """
+        推論結果を登録
+
+        Args:
+            inputed_text: ユーザーの入力文章
+            namespace: 名前空間
+            result: {"minus_words": [...], "advice": "..."}
+            vector: get で得た入力文の埋め込み
+        """
+        if not self.ready:
+            return
+        self.stats["stores"] += 1
+        try:
+            await asyncio.to_thread(self._store, inputed_text, namespace, result, vector)
+        except Exception as e:
+            logger.warning(f"⚠️ 類似入力キャッシュの登録失敗: {e}")
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        ヒット率などの統計を取得
+
+        Returns:
+            dict: 状態・ヒット/ミス数・ヒット率・件数・クラスタ数
+        """
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"] + stats["rejected"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["state"] = self.state
+        stats["threshold"] = self.threshold
+        stats["embedding_model"] = self.embedder.model_id if self.embedder is not None else None
+        stats["entries"] = self.index.size if self.index is not None else 0
+        stats["clusters"] = self.index.n_clusters if self.index is not None else 0
+        return stats
+
+
+# グローバルインスタンス
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
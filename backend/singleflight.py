@@ -0,0 +1,71 @@
+# backend/singleflight.py（新規）
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """実行中の共有処理と待機者数"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    同一キーの同時リクエストを1回の処理にまとめる
+
+    - 実行中の処理があれば新たに開始せず、その結果を共有する
+    - 待機者の1人がキャンセルされても共有処理は継続する
+    - 全ての待機者がいなくなった場合のみ共有処理をキャンセルする
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: dict[str, _Call] = {}
+        self.coalesced_count = 0
+
+    def _forget(self, key: str, call: _Call) -> None:
+        """キーが同じ処理を指している場合のみ登録を解除"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キー単位で処理を共有して実行
+
+        Args:
+            key (str): 同一リクエスト判定用のキー
+            factory (callable): 処理本体のコルーチンを返す関数（初回のみ呼ばれる）
+
+        Returns:
+            Any: 処理結果
+        """
+        call = self._calls.get(key)
+
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, c=call: self._forget(key, c))
+        else:
+            self.coalesced_count += 1
+            logger.info(f"🔗 [{self.name}] 実行中の同一リクエストに合流 (待機者={call.waiters + 1})")
+
+        call.waiters += 1
+        try:
+            # shield: 待機者のキャンセルを共有処理に伝播させない
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                logger.info(f"🛑 [{self.name}] 待機者がいなくなったため処理をキャンセル")
+                call.task.cancel()
+                self._forget(key, call)
+
+    def in_flight(self) -> int:
+        """実行中の共有処理数"""
+        return len(self._calls)
@@ -0,0 +1,144 @@
+# backend/speculative.py（新規）
+
+import logging
+import os
+from threading import Lock
+
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# off: 通常デコード / prompt_lookup: プロンプト中のn-gramから先読み / draft: 小型GGUFで先読み
+#
+# ※ 先読みの検証には全位置のロジットが必要なため、llama-cpp-python は logits_all を有効にする。
+#    語彙数の大きい Gemma では n_ctx × 語彙数 の配列（n_ctx=2048 で約2GB）がコンテキストごとに
+#    確保されるので、コンテキスト数や n_ctx を小さくして使うこと。
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "off")
+# 1回に先読みするトークン数
+SPECULATIVE_NUM_PRED_TOKENS = int(os.getenv("SPECULATIVE_NUM_PRED_TOKENS", "10"))
+# prompt_lookup で照合する n-gram の最大長
+SPECULATIVE_MAX_NGRAM = int(os.getenv("SPECULATIVE_MAX_NGRAM", "3"))
+# draft モードで使う小型モデル（本体とトークナイザが同じであること）
+DRAFT_MODEL_PATH = os.getenv("DRAFT_MODEL_PATH", "")
+
+SPECULATIVE_MODES = ("off", "prompt_lookup", "draft")
+
+
+class SpeculativeStats:
+    """先読みの採用率を集計"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.draft_calls = 0        # 先読み（＝検証サイクル）の回数
+        self.drafted_tokens = 0     # 先読みで提案されたトークン数
+        self.generated_tokens = 0   # 実際に生成されたトークン数
+
+    def record_draft(self, n_drafted: int) -> None:
+        with self._lock:
+            self.draft_calls += 1
+            self.drafted_tokens += n_drafted
+
+    def record_generated(self, n_generated: int) -> None:
+        with self._lock:
+            self.generated_tokens += n_generated
+
+    def get_stats(self) -> dict:
+        """
+        採用率などを取得
+
+        検証1サイクルごとに「本体が選んだ1トークン + 採用された先読み」が出力されるため、
+        採用トークン数 ≒ 生成トークン数 - サイクル数 として推定する。
+
+        Returns:
+            dict: 先読み回数・提案数・採用数・採用率・1サイクルあたりのトークン数
+        """
+        with self._lock:
+            accepted = max(0, self.generated_tokens - self.draft_calls)
+            return {
+                "draft_calls": self.draft_calls,
+                "drafted_tokens": self.drafted_tokens,
+                "accepted_tokens": accepted,
+                "acceptance_rate": accepted / self.drafted_tokens if self.drafted_tokens else 0.0,
+                "tokens_per_cycle": self.generated_tokens / self.draft_calls if self.draft_calls else 0.0,
+            }
+
+
+class CountingDraftModel(LlamaDraftModel):
+    """先読みモデルをラップして提案数を記録する"""
+
+    def __init__(self, inner: LlamaDraftModel, stats: SpeculativeStats):
+        self.inner = inner
+        self.stats = stats
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = self.inner(input_ids, **kwargs)
+        self.stats.record_draft(len(draft))
+        return draft
+
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    小型のGGUFモデルで貪欲に先読みする
+
+    本体と同じトークナイザのモデルを使うこと。先読み用コンテキストも
+    前回の入力との共通部分のKVキャッシュを再利用するため、評価は差分のみ。
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int, n_ctx: int, n_threads: int):
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            verbose=False
+        )
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft: list[int] = []
+        for token in self.llm.generate(input_ids.tolist(), temp=0.0, top_k=1, reset=True):
+            if token == self.llm.token_eos():
+                break
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.array(draft, dtype=np.intc)
+
+
+def create_draft_model(stats: SpeculativeStats, n_ctx: int, n_threads: int) -> LlamaDraftModel | None:
+    """
+    設定に応じた先読みモデルを作成（コンテキストごとに1つ）
+
+    Args:
+        stats: 採用率の集計先
+        n_ctx: コンテキストサイズ（draft モード用）
+        n_threads: スレッド数（draft モード用）
+
+    Returns:
+        LlamaDraftModel | None: 先読みモデル（off の場合は None）
+
+    Raises:
+        ValueError: 不明なモード・draft モードでモデル未指定の場合
+    """
+    if SPECULATIVE_MODE not in SPECULATIVE_MODES:
+        raise ValueError(f"SPECULATIVE_MODE が不正です: {SPECULATIVE_MODE} ({' / '.join(SPECULATIVE_MODES)})")
+
+    if SPECULATIVE_MODE == "off":
+        return None
+
+    if SPECULATIVE_MODE == "prompt_lookup":
+        inner = LlamaPromptLookupDecoding(
+            max_ngram_size=SPECULATIVE_MAX_NGRAM,
+            num_pred_tokens=SPECULATIVE_NUM_PRED_TOKENS
+        )
+    else:
+        if not DRAFT_MODEL_PATH or not os.path.exists(DRAFT_MODEL_PATH):
+            raise ValueError(f"DRAFT_MODEL_PATH のモデルが見つかりません: {DRAFT_MODEL_PATH or '未設定'}")
+        inner = GGUFDraftModel(DRAFT_MODEL_PATH, SPECULATIVE_NUM_PRED_TOKENS, n_ctx, n_threads)
+
+    logger.info(f"⚡ 投機的デコード: mode={SPECULATIVE_MODE}, 先読み={SPECULATIVE_NUM_PRED_TOKENS}トークン")
+    return CountingDraftModel(inner, stats)
@@ -0,0 +1,13 @@
+# backend/tests/conftest.py（新規）
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# アプリのデータディレクトリ（~/.local/share/MCApp）をテストごとの一時ディレクトリに向ける
+os.environ["HOME"] = tempfile.mkdtemp(prefix="mcapp-test-")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "0")
+
+# backend/ のモジュールを import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,133 @@
+# backend/tests/test_benchmark.py（新規）
+#
+# benchmark.py のハーネスを GGUF なしで検証する（StubLlama を使用）
+
+import asyncio
+import json
+import sys
+from functools import partial
+
+import pytest
+
+import benchmark
+from ai_model import build_warmup_request
+from benchmark import StubLlama, benchmark_manager, compare, create_stub_model_file, percentile, summarize
+from inference_manager import InferenceManager
+
+# 計測の流れだけを確認するため、スタブの処理時間は短くする
+FastStubLlama = partial(StubLlama, prompt_seconds_per_token=0.00005, decode_seconds_per_token=0.0002)
+
+
+@pytest.fixture
+def stub_manager():
+    manager = InferenceManager(create_stub_model_file(), pool_size=1, llama_factory=FastStubLlama)
+    manager.load(warmup=build_warmup_request())
+    yield manager
+    manager.shutdown()
+
+
+def make_result(ttft_p50: float, prompt_tps_p50: float, decode_tps_p50: float) -> dict:
+    return {
+        "manager": {
+            "ttft_seconds": {"p50": ttft_p50},
+            "prompt_eval_tokens_per_second": {"p50": prompt_tps_p50},
+            "decode_tokens_per_second": {"p50": decode_tps_p50},
+        }
+    }
+
+
+# =========================
+# InferenceManager の計測
+# =========================
+def test_benchmark_manager_with_stub_reports_ttft_and_tokens_per_second(stub_manager):
+    corpus = benchmark.CORPUS[:3]
+
+    result = asyncio.run(benchmark_manager(stub_manager, corpus))
+
+    assert result["requests"] == 3
+    assert result["completed"] == 3
+    for key in ("ttft_seconds", "total_seconds", "prompt_eval_tokens_per_second", "decode_tokens_per_second"):
+        assert set(result[key]) == {"mean", "p50", "p95", "p99", "max"}
+    assert 0 < result["ttft_seconds"]["p50"] <= result["total_seconds"]["p50"]
+    assert result["prompt_eval_tokens_per_second"]["p50"] > 0
+    assert result["decode_tokens_per_second"]["p50"] > 0
+
+
+# =========================
+# 集計
+# =========================
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+    assert percentile(values, 0) == 1.0
+
+
+def test_percentile_ignores_input_order_and_handles_small_samples():
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile([3.0, 1.0, 2.0], 95) == 3.0
+    assert percentile([5.0], 99) == 5.0
+    assert percentile([], 50) == 0.0
+
+
+def test_summarize_empty_values():
+    assert summarize([]) == {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+
+# =========================
+# 前回結果との比較
+# =========================
+def test_compare_detects_degraded_metrics_only_beyond_tolerance():
+    baseline = make_result(ttft_p50=0.10, prompt_tps_p50=200.0, decode_tps_p50=20.0)
+
+    assert compare(baseline, make_result(0.105, 195.0, 19.5), tolerance=0.10) == []
+
+    regressions = compare(baseline, make_result(0.20, 200.0, 10.0), tolerance=0.10)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("manager.ttft_seconds.p50")
+    assert regressions[1].startswith("manager.decode_tokens_per_second.p50")
+
+
+def test_compare_includes_endpoint_levels():
+    baseline = {"endpoint": {"4": {"latency_seconds": {"p95": 1.0}, "throughput_rps": 10.0}}}
+    current = {"endpoint": {"4": {"latency_seconds": {"p95": 1.5}, "throughput_rps": 10.0}}}
+
+    regressions = compare(baseline, current, tolerance=0.10)
+
+    assert regressions == ["endpoint.4.latency_seconds.p95: 1.0000 → 1.5000 (+50.0%)"]
+
+
+def run_main_with_baseline(monkeypatch, tmp_path, baseline: dict, current: dict):
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(baseline), encoding="utf-8")
+
+    async def fake_run(args):
+        return current
+
+    monkeypatch.setattr(benchmark, "run", fake_run)
+    monkeypatch.setattr("logging_config.setup_logging", lambda: None)
+    monkeypatch.setattr(sys, "argv", ["benchmark.py", "--stub", "--baseline", str(baseline_path)])
+    benchmark.main()
+
+
+def test_main_exits_non_zero_when_baseline_metric_degraded(monkeypatch, tmp_path, capsys):
+    baseline = make_result(ttft_p50=0.10, prompt_tps_p50=200.0, decode_tps_p50=20.0)
+    degraded = make_result(ttft_p50=0.30, prompt_tps_p50=200.0, decode_tps_p50=20.0)
+
+    with pytest.raises(SystemExit) as exc_info:
+        run_main_with_baseline(monkeypatch, tmp_path, baseline, degraded)
+
+    assert exc_info.value.code == 1
+    assert "manager.ttft_seconds.p50" in capsys.readouterr().out
+
+
+def test_main_succeeds_when_baseline_not_degraded(monkeypatch, tmp_path, capsys):
+    baseline = make_result(ttft_p50=0.10, prompt_tps_p50=200.0, decode_tps_p50=20.0)
+    improved = make_result(ttft_p50=0.08, prompt_tps_p50=250.0, decode_tps_p50=22.0)
+
+    run_main_with_baseline(monkeypatch, tmp_path, baseline, improved)
+
+    assert "劣化なし" in capsys.readouterr().out
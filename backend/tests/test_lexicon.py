@@ -0,0 +1,70 @@
+# backend/tests/test_lexicon.py（新規）
+#
+# 辞書判定と ADVICE_MODE による使い分け
+
+import pytest
+
+import ai_model
+from lexicon import CLEAN_ADVICE, lexicon
+
+
+@pytest.fixture
+def hybrid_mode(monkeypatch):
+    monkeypatch.setattr(ai_model, "ADVICE_MODE", "hybrid")
+    monkeypatch.setattr(ai_model, "LEXICON_CONFIDENCE_THRESHOLD", 0.85)
+
+
+@pytest.mark.parametrize("text", ["私には何の価値もない", "生きている意味がわからない", "もう全部やめたい"])
+def test_hybrid_defers_to_llm_when_lexicon_has_no_hits(hybrid_mode, text):
+    assert lexicon.analyze(text).is_clean
+
+    assert ai_model.resolve_with_lexicon(text, record=False) is None
+
+
+def test_hybrid_resolves_confident_lexicon_hits(hybrid_mode):
+    result = ai_model.resolve_with_lexicon("お前は本当に役立たずだ", record=False)
+
+    assert result is not None
+    assert result["minus_words"] == ["お前は本当に役立たずだ"]
+    assert result["advice"] != CLEAN_ADVICE
+
+
+def test_fast_mode_answers_no_hit_input_from_lexicon(monkeypatch):
+    monkeypatch.setattr(ai_model, "ADVICE_MODE", "fast")
+
+    assert ai_model.resolve_with_lexicon("今日はいい天気ですね。", record=False) == {
+        "minus_words": [], "advice": CLEAN_ADVICE,
+    }
+
+
+def test_llm_mode_never_uses_lexicon(monkeypatch):
+    monkeypatch.setattr(ai_model, "ADVICE_MODE", "llm")
+
+    assert ai_model.resolve_with_lexicon("お前は本当に役立たずだ", record=False) is None
+
+
+# =========================
+# 全コンテキスト再読み込み中の辞書判定
+# =========================
+class ReloadingManager:
+    """全ての推論コンテキストが再読み込み中のマネージャー"""
+
+    def get_status(self):
+        return {"state": "ready", "healthy_contexts": 0}
+
+
+@pytest.fixture
+def all_contexts_reloading(monkeypatch):
+    monkeypatch.setattr(ai_model, "DEGRADED_LEXICON_FALLBACK", True)
+    monkeypatch.setattr(ai_model, "get_inference_manager", lambda **kwargs: ReloadingManager())
+
+
+def test_degraded_fallback_answers_lexicon_hits(all_contexts_reloading):
+    result = ai_model.resolve_degraded("お前は本当に役立たずだ")
+
+    assert result is not None
+    assert result["minus_words"] == ["お前は本当に役立たずだ"]
+
+
+def test_degraded_fallback_leaves_no_hit_input_to_llm(all_contexts_reloading):
+    assert ai_model.resolve_degraded("生きている意味がわからない") is None
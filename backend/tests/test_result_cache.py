@@ -0,0 +1,58 @@
+# backend/tests/test_result_cache.py（新規）
+#
+# 結果キャッシュのDB層（削除の間隔と上限）
+
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import result_cache
+from database import Base
+from models import AdviceCacheEntry
+from result_cache import ResultCache
+
+
+def make_result(i: int) -> dict:
+    return {"minus_words": [f"word-{i}"], "advice": f"advice-{i}"}
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def test_concurrent_puts_run_one_eviction_per_interval(session_factory, monkeypatch):
+    monkeypatch.setattr(result_cache, "_EVICT_INTERVAL", 5)
+    cache = ResultCache(max_db_items=1000, session_factory=session_factory)
+    evictions = []
+    monkeypatch.setattr(cache, "_evict_db", lambda db: evictions.append(True))
+
+    async def scenario():
+        await asyncio.gather(*(cache.put(f"key-{i}", make_result(i)) for i in range(50)))
+
+    asyncio.run(scenario())
+
+    assert len(evictions) == 10
+    assert cache._writes_since_evict == 0
+
+
+def test_eviction_keeps_most_recently_used_entries(session_factory, monkeypatch):
+    monkeypatch.setattr(result_cache, "_EVICT_INTERVAL", 1)
+    cache = ResultCache(max_memory_items=1, max_db_items=3, session_factory=session_factory)
+
+    async def scenario():
+        for i in range(6):
+            await cache.put(f"key-{i}", make_result(i))
+
+    asyncio.run(scenario())
+
+    with session_factory() as db:
+        keys = {entry.cache_key for entry in db.query(AdviceCacheEntry)}
+    assert keys == {"key-3", "key-4", "key-5"}
+    assert cache._get_db("key-5")[1] == make_result(5)
+    assert cache._get_db("key-0") is None
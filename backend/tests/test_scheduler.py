@@ -0,0 +1,112 @@
+# backend/tests/test_scheduler.py（新規）
+#
+# InferenceScheduler の公平性・締め切り・受付制御
+
+import time
+from collections import Counter
+
+import pytest
+
+from scheduler import InferenceJob, InferenceScheduler, QueueFullError, SchedulerClosedError
+
+
+def make_job(user_id: int | None = None, timeout: float = 100.0) -> InferenceJob:
+    return InferenceJob("prompt", {}, deadline=time.monotonic() + timeout, user_id=user_id)
+
+
+def drain(scheduler: InferenceScheduler, count: int) -> list[InferenceJob]:
+    jobs = []
+    for _ in range(count):
+        job = scheduler.next_job(timeout=0)
+        assert job is not None
+        jobs.append(job)
+    return jobs
+
+
+# =========================
+# 公平性（Deficit Round Robin）
+# =========================
+def test_weighted_users_share_in_proportion_to_weight():
+    scheduler = InferenceScheduler(workers=1, max_queue=32, weights={1: 2.0, 2: 1.0})
+    for _ in range(6):
+        scheduler.submit(make_job(user_id=1))
+        scheduler.submit(make_job(user_id=2))
+
+    served = Counter(job.user_id for job in drain(scheduler, 6))
+
+    assert served == {1: 4, 2: 2}
+
+
+def test_flooding_user_does_not_starve_another():
+    scheduler = InferenceScheduler(workers=1, max_queue=32, weights={})
+    flood = [make_job(user_id=1) for _ in range(5)]
+    for job in flood:
+        scheduler.submit(job)
+    other = make_job(user_id=2)
+    scheduler.submit(other)
+
+    order = drain(scheduler, 6)
+
+    assert order[1] is other
+    assert [job for job in order if job.user_id == 1] == flood
+
+
+# =========================
+# 締め切り
+# =========================
+def test_job_that_cannot_finish_before_deadline_is_expired():
+    scheduler = InferenceScheduler(workers=1, max_queue=4, weights={})
+    scheduler.record_service_time(1.0)
+    late = make_job(timeout=0.5)
+    on_time = make_job(timeout=100.0)
+    scheduler.submit(late)
+    scheduler.submit(on_time)
+
+    assert scheduler.next_job(timeout=0) is on_time
+    with pytest.raises(TimeoutError):
+        late.future.result(timeout=0)
+    assert scheduler.get_stats()["expired"] == 1
+
+
+# =========================
+# 受付制御
+# =========================
+def test_submit_at_capacity_raises_queue_full_with_retry_after():
+    scheduler = InferenceScheduler(workers=1, max_queue=2, weights={})
+    scheduler.record_service_time(2.0)
+    scheduler.submit(make_job())
+    scheduler.submit(make_job())
+
+    with pytest.raises(QueueFullError) as exc_info:
+        scheduler.submit(make_job())
+
+    # (待機2件 / ワーカー1 + 1) × サービス時間2秒
+    assert exc_info.value.retry_after == 6
+    assert scheduler.get_stats()["rejected"] == 1
+    assert scheduler.qsize() == 2
+
+
+def test_submit_after_close_raises_scheduler_closed():
+    scheduler = InferenceScheduler(workers=1, max_queue=4, weights={})
+    pending = make_job()
+    scheduler.submit(pending)
+
+    scheduler.close()
+
+    assert pending.future.cancelled()
+    assert scheduler.next_job(timeout=0) is None
+    with pytest.raises(SchedulerClosedError):
+        scheduler.submit(make_job())
+
+
+def test_close_with_drain_keeps_queued_jobs():
+    scheduler = InferenceScheduler(workers=1, max_queue=4, weights={})
+    queued = make_job()
+    scheduler.submit(queued)
+
+    scheduler.close(drain=True)
+
+    assert scheduler.next_job(timeout=0) is queued
+    assert scheduler.next_job(timeout=0) is None
+    with pytest.raises(SchedulerClosedError):
+        scheduler.submit(make_job())
@@ -0,0 +1,122 @@
+# backend/tests/test_singleflight.py（新規）
+#
+# SingleFlight による同時リクエストの集約とキャンセル
+
+import asyncio
+
+from singleflight import SingleFlight
+
+
+class SlowWork:
+    """release() されるまで完了しない処理（呼ばれた回数を数える）"""
+
+    def __init__(self, result="done"):
+        self.result = result
+        self.calls = 0
+        self.cancelled = False
+        self.released = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.released.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def release(self):
+        self.released.set()
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = SlowWork()
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flight.in_flight() == 1
+
+        work.release()
+        results = await asyncio.gather(*waiters)
+
+        assert results == ["done"] * 3
+        assert work.calls == 1
+        assert flight.coalesced_count == 2
+        assert flight.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_waiter_keeps_shared_work_running():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = SlowWork()
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        work.release()
+
+        assert await second == "done"
+        assert first.cancelled()
+        assert not work.cancelled
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_all_waiters_cancels_shared_work():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = SlowWork()
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert work.cancelled
+        assert flight.in_flight() == 0
+
+        # 次の呼び出しは新しく実行する
+        retry = SlowWork("again")
+        retry.release()
+        assert await flight.do("key", retry) == "again"
+
+    asyncio.run(scenario())
+
+
+def test_error_is_shared_and_key_is_released():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = SlowWork(ValueError("boom"))
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        work.release()
+
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert work.calls == 1
+        assert flight.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_run_independently():
+    async def scenario():
+        flight = SingleFlight("test")
+        first, second = SlowWork("a"), SlowWork("b")
+        first.release()
+        second.release()
+
+        assert await asyncio.gather(flight.do("a", first), flight.do("b", second)) == ["a", "b"]
+        assert flight.coalesced_count == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,150 @@
+# backend/tests/test_vector_index.py（新規）
+#
+# 類似入力キャッシュのベクトルインデックス（検索・削除・保存と読み込み）
+
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import _IVF_MIN_ENTRIES, _TRAIN_ROWS_PER_CLUSTER, VectorIndex, train_centroids
+
+DIM = 16
+
+
+def random_vectors(count: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_index(vectors: np.ndarray, namespace: str = "ns") -> VectorIndex:
+    index = VectorIndex(DIM)
+    for i, vector in enumerate(vectors):
+        index.add(vector, namespace, f"text-{i}", {"minus_words": [], "advice": f"advice-{i}"})
+    return index
+
+
+def train(index: VectorIndex) -> None:
+    n_clusters = int(math.sqrt(index.size))
+    index.set_centroids(train_centroids(index.training_sample(n_clusters * _TRAIN_ROWS_PER_CLUSTER), n_clusters))
+
+
+@pytest.fixture
+def ivf_index():
+    vectors = random_vectors(_IVF_MIN_ENTRIES + 500)
+    index = build_index(vectors)
+    train(index)
+    return index, vectors
+
+
+# =========================
+# 検索
+# =========================
+def test_flat_search_finds_exact_match():
+    vectors = random_vectors(100)
+    index = build_index(vectors)
+
+    for i in (0, 42, 99):
+        row, score = index.search(vectors[i], "ns")
+        assert index.texts[row] == f"text-{i}"
+        assert score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_search_does_not_cross_namespaces():
+    vectors = random_vectors(2)
+    index = VectorIndex(DIM)
+    index.add(vectors[0], "model-a", "text", {"advice": "a"})
+    index.add(vectors[1], "model-b", "other", {"advice": "b"})
+
+    row, _ = index.search(vectors[0], "model-b")
+    assert index.texts[row] == "other"
+    assert index.search(vectors[0], "unknown") == (-1, -1.0)
+
+
+def test_add_same_text_overwrites_result():
+    vector = random_vectors(1)[0]
+    index = VectorIndex(DIM)
+    first = index.add(vector, "ns", "text", {"advice": "old"})
+
+    second = index.add(vector, "ns", "text", {"advice": "new"})
+
+    assert first == second
+    assert index.size == 1
+    assert index.results[second] == {"advice": "new"}
+
+
+def test_ivf_search_finds_indexed_and_tail_rows(ivf_index):
+    index, vectors = ivf_index
+    assert index.n_clusters > 0
+
+    for i in range(0, len(vectors), 397):
+        row, score = index.search(vectors[i], "ns")
+        assert index.texts[row] == f"text-{i}"
+        assert score == pytest.approx(1.0, abs=1e-5)
+
+    # 並べ直す前の追加分も検索できる
+    extra = random_vectors(1, seed=1)[0]
+    index.add(extra, "ns", "extra", {"advice": "extra"})
+    assert index.indexed < index.size
+    row, _ = index.search(extra, "ns")
+    assert index.texts[row] == "extra"
+
+
+# =========================
+# 削除
+# =========================
+def test_evict_drops_least_recently_used(monkeypatch):
+    clock = itertools.count(1)
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: float(next(clock)))
+    vectors = random_vectors(10)
+    index = build_index(vectors)
+    index.touch(index._rows[(0, "text-0")])  # 最も古い行を使い直す
+
+    index.evict(3)
+
+    assert index.size == 7
+    assert set(index.texts) == {"text-0"} | {f"text-{i}" for i in range(4, 10)}
+    for i in (0, 5, 9):
+        row, _ = index.search(vectors[i], "ns")
+        assert index.texts[row] == f"text-{i}"
+        assert index.results[row]["advice"] == f"advice-{i}"
+
+
+def test_evict_below_ivf_threshold_falls_back_to_flat_scan(ivf_index):
+    index, vectors = ivf_index
+
+    index.evict(index.size - 100)
+
+    assert index.centroids is None
+    assert index.size == 100
+    row, _ = index.search(index._vectors[0], "ns")
+    assert row == 0
+
+
+# =========================
+# 保存と読み込み
+# =========================
+def test_save_and_load_round_trip(ivf_index, tmp_path):
+    index, vectors = ivf_index
+    extra = random_vectors(1, seed=1)[0]
+    index.add(extra, "other", "extra", {"advice": "extra"})
+    path = tmp_path / "index.npz"
+
+    index.save(path, {"embedding_model": "test"})
+    loaded, meta = VectorIndex.load(path)
+
+    assert meta["embedding_model"] == "test"
+    assert loaded.size == index.size
+    assert loaded.indexed == index.indexed
+    assert loaded.trained_size == index.trained_size
+    assert loaded.texts == index.texts
+    assert loaded.results == index.results
+    assert loaded.namespace_names == index.namespace_names
+    np.testing.assert_array_equal(loaded._vectors[:loaded.size], index._vectors[:index.size])
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    np.testing.assert_array_equal(loaded._offsets, index._offsets)
+    for query, namespace in [(vectors[7], "ns"), (vectors[4000], "ns"), (extra, "other")]:
+        assert loaded.search(query, namespace) == index.search(query, namespace)
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,97 @@
+# backend/tests/test_wc_aggregates.py（新規）
+#
+# ワードクラウド集計の作り直し（会話IDの上限で二重に数えないこと）
+
+import json
+from collections import Counter
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import cruds
+import wc_aggregates
+from database import Base
+from models import Conversation
+from schemas import ConversationCreate
+from tokenizer_service import tokenizer_service
+from wc_aggregates import count_words, query_frequencies, rebuild
+
+HISTORY = [["仕事が辛い"], ["勉強が嫌い", "また失敗した"]]
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def insert_history(session_factory, history: list[list[str]]) -> None:
+    """集計のない既存DBの会話（cruds を通さずに保存）"""
+    with session_factory() as db:
+        for words in history:
+            db.add(Conversation(
+                user_id=1,
+                user_input="入力",
+                ai_response_words=json.dumps(words, ensure_ascii=False),
+                ai_response_advice="アドバイス",
+            ))
+        db.commit()
+
+
+def save_conversation(session_factory, words: list[str]) -> None:
+    with session_factory() as db:
+        cruds.create_conversation(db, ConversationCreate(
+            user_id=1, user_input="入力", ai_response_words=words, ai_response_advice="アドバイス",
+        ))
+
+
+def expected_counts(history: list[list[str]]) -> dict[str, int]:
+    total = Counter()
+    for words in history:
+        total += count_words(words)
+    return dict(total)
+
+
+def frequencies(session_factory) -> dict[str, int]:
+    with session_factory() as db:
+        return query_frequencies(db, user_id=1)
+
+
+def test_conversation_saved_after_rebuild_is_counted_once(session_factory):
+    insert_history(session_factory, HISTORY)
+
+    assert rebuild(session_factory, batch_size=1) == 2
+    save_conversation(session_factory, ["上司が怖い"])
+
+    assert frequencies(session_factory) == expected_counts(HISTORY + [["上司が怖い"]])
+
+
+def test_conversation_saved_during_rebuild_is_counted_once(session_factory, monkeypatch):
+    insert_history(session_factory, HISTORY)
+    extract_batch = tokenizer_service.extract_batch
+    saved = []
+
+    def extract_and_save(phrases):
+        # 最初のバッチの解析中（会話IDの上限を記録した後）に新しい会話が保存される
+        if not saved:
+            saved.append(True)
+            save_conversation(session_factory, ["上司が怖い"])
+        return extract_batch(phrases)
+
+    monkeypatch.setattr(wc_aggregates.tokenizer_service, "extract_batch", extract_and_save)
+
+    assert rebuild(session_factory, batch_size=1) == 2
+    assert frequencies(session_factory) == expected_counts(HISTORY + [["上司が怖い"]])
+
+
+def test_rebuild_replaces_existing_aggregates(session_factory):
+    save_conversation(session_factory, ["仕事が辛い"])
+    save_conversation(session_factory, ["勉強が嫌い"])
+
+    assert rebuild(session_factory) == 2
+    assert rebuild(session_factory) == 2
+
+    assert frequencies(session_factory) == expected_counts([["仕事が辛い"], ["勉強が嫌い"]])
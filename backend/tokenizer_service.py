@@ -0,0 +1,373 @@
+# backend/tokenizer_service.py（新規）
+#
+# Janome による形態素解析の共通サービス
+#
+#   - 辞書は import 時ではなく初回の解析時に読み込む（mmap で読み込み、プロセス間でページを共有）
+#   - フレーズごとの抽出結果を正規化した文字列をキーに LRU で保持（同じマイナスワードは再解析しない）
+#   - 大量のフレーズ（集計の作り直しなど）はプロセスプールで並列に解析する
+#
+# ワードクラウド（wc_model・wc_aggregates）のほか、ai_model などから
+# tokenizer_service.tokenize / extract を呼んで同じ辞書・キャッシュを使える。
+
+import logging
+import math
+import multiprocessing
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Iterable
+
+from lexicon import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 辞書を mmap で読み込む（0 の場合はメモリに展開。起動は遅いが解析はわずかに速い）
+TOKENIZER_MMAP = os.getenv("TOKENIZER_MMAP", "1") == "1"
+# フレーズ単位の抽出結果を保持する件数
+TOKENIZER_CACHE_SIZE = int(os.getenv("TOKENIZER_CACHE_SIZE", "20000"))
+# 並列解析のプロセス数（0 の場合はCPUコア数の半分・最大4。1 の場合は並列化しない）
+TOKENIZER_PROCESSES = int(os.getenv("TOKENIZER_PROCESSES", "0"))
+# この件数以上の未解析フレーズをまとめて渡された場合にプロセスプールを使う
+TOKENIZER_PARALLEL_MIN_PHRASES = int(os.getenv("TOKENIZER_PARALLEL_MIN_PHRASES", "1000"))
+
+# 絵文字・一部記号を除去(ただし「!」「?」は残す)
+_STRIP_PATTERN = re.compile(r'[^\w\s!?ー〜]')
+
+# ===== ストップワード(ワードクラウド用・約60語) =====
+# マイナスワード検出とは異なり、視覚化用の除外語
+STOP_WORDS = frozenset({
+    # 助詞(文法接続のみ)
+    'の', 'は', 'が', 'を', 'に', 'と', 'で', 'や', 'も',
+    'から', 'まで', 'より', 'へ', 'ば', 'て', 'つ',
+
+    # 複合助詞
+    'において', 'における', 'について', 'にて',
+    'によって', 'により', 'による',
+
+    # 丁寧語
+    'です', 'ます', 'ました',
+    'おり', 'おります', 'あり', 'あります',
+    'い', 'いる', 'います',
+
+    # 一人称
+    '私', 'わたし', '僕', '俺',
+
+    # 場所指示語
+    'ここ', 'そこ', 'あそこ', 'どこ',
+
+    # 抽象形式名詞
+    'こと', 'もの', 'ため', 'ところ', 'うち',
+
+    # その他(元のリストから必要なもの)
+    'それ', 'よう', 'これ', 'そう', 'あなた', 'あれ', 'いつ',
+    'とき', 'なに', 'なん', 'よ', 'ん', 'だ', 'た', 'な', 'く',
+    're', # 元のリストにあった'れる'の一部
+})
+
+# ===== 品詞ベースの除外設定 =====
+EXCLUDE_POS = frozenset({
+    '助詞',
+    '記号',
+    '空白',
+    '補助記号',
+})
+
+# 否定的な副詞（短くても保持する）
+NEGATIVE_ADVERBS = frozenset({'どうせ', 'やっぱり', 'また', 'いつも', 'もう', 'そんな', 'あんな'})
+
+
+def clean_phrase(text: str) -> str:
+    """解析前の正規化（NFKC + 空白の統一 + 記号の除去）。抽出結果のキャッシュキーにもなる"""
+    return _STRIP_PATTERN.sub('', normalize_text(text))
+
+
+def load_tokenizer(mmap: bool = TOKENIZER_MMAP):
+    """Janome の Tokenizer を生成（辞書の読み込みに数秒かかることがある）"""
+    from janome.tokenizer import Tokenizer
+
+    started_at = time.perf_counter()
+    tokenizer = Tokenizer(mmap=mmap)
+    logger.info(f"📚 Janome 辞書読み込み完了: {time.perf_counter() - started_at:.2f}秒 (mmap={mmap})")
+    return tokenizer
+
+
+def extract_content_words(tokenizer, text: str) -> tuple[str, ...]:
+    """
+    正規化済みのフレーズから名詞・形容詞・動詞などを抽出
+    例: 「誰も私を理解してくれない」→ ('誰', '理解', 'くれ', 'ない')
+
+    - 品詞ベースで除外
+    - 否定語・感情語を保持
+    - ストップワードは最小限
+
+    Args:
+        tokenizer: Janome の Tokenizer
+        text: clean_phrase で正規化したフレーズ
+
+    Returns:
+        tuple: 抽出した単語（出現順）
+    """
+    words = []
+
+    for token in tokenizer.tokenize(text):
+        parts = token.part_of_speech.split(',')
+        word_type = parts[0]
+        word_subtype = parts[1] if len(parts) > 1 else ''
+        surface = token.surface
+
+        # ===== 1. 品詞ベースで除外 =====
+        if word_type in EXCLUDE_POS:
+            continue
+
+        # ===== 2. ストップワード除外(最小限) =====
+        if surface in STOP_WORDS:
+            continue
+
+        # ===== 3. 名詞・形容詞・動詞を抽出 =====
+        # 名詞の場合
+        if word_type == '名詞':
+            # 一般名詞・固有名詞・形容動詞語幹を保持(1文字は除外)
+            # ⚠️ 非自立名詞は除外(「こと」「もの」など)
+            if word_subtype in ('一般', '固有名詞', '形容動詞語幹') and len(surface) > 1:
+                words.append(surface)
+
+        # 形容詞の場合(感情語として重要)
+        elif word_type == '形容詞':
+            if len(surface) > 1:
+                words.append(surface)
+
+        # 動詞の場合(基本形に変換)
+        elif word_type == '動詞':
+            base_form = parts[6] if len(parts) > 6 and parts[6] != '*' else surface
+            if len(base_form) > 1:
+                words.append(base_form)
+
+        # ===== 4. 副詞・連体詞も保持(感情表現で重要) =====
+        elif word_type in ('副詞', '連体詞'):
+            if surface in NEGATIVE_ADVERBS or len(surface) > 2:
+                words.append(surface)
+
+    return tuple(words)
+
+
+# =========================
+# 並列解析（プロセスプールのワーカー側）
+# =========================
+_worker_tokenizer = None
+
+
+def _init_worker(mmap: bool) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = load_tokenizer(mmap)
+
+
+def _extract_chunk(texts: list[str]) -> list[tuple[str, ...]]:
+    return [extract_content_words(_worker_tokenizer, text) for text in texts]
+
+
+def _default_processes() -> int:
+    return max(1, min(4, (os.cpu_count() or 1) // 2))
+
+
+class TokenizerService:
+    """
+    形態素解析と単語抽出のサービス
+
+    Tokenizer はスレッドセーフではないため、プロセス内の解析はロックで直列化する。
+    抽出結果はプロセスごとの LRU に保持する（ワードクラウドのワーカープロセスでも同様）。
+    """
+
+    def __init__(
+        self,
+        cache_size: int = TOKENIZER_CACHE_SIZE,
+        processes: int = TOKENIZER_PROCESSES,
+        parallel_min_phrases: int = TOKENIZER_PARALLEL_MIN_PHRASES,
+        mmap: bool = TOKENIZER_MMAP,
+    ):
+        self.cache_size = cache_size
+        self.processes = processes if processes > 0 else _default_processes()
+        self.parallel_min_phrases = parallel_min_phrases
+        self.mmap = mmap
+
+        self._tokenizer = None
+        self._tokenizer_lock = Lock()
+        self._cache: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+        self._cache_lock = Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = Lock()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "parallel_batches": 0,
+            "load_seconds": None,
+        }
+
+    # ===== 辞書 =====
+    def _get_tokenizer(self):
+        """Tokenizer を取得（初回のみ辞書を読み込む。_tokenizer_lock を保持して呼ぶ）"""
+        if self._tokenizer is None:
+            started_at = time.perf_counter()
+            self._tokenizer = load_tokenizer(self.mmap)
+            self.stats["load_seconds"] = round(time.perf_counter() - started_at, 3)
+        return self._tokenizer
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._tokenizer is not None
+
+    def tokenize(self, text: str) -> list[tuple[str, str, str]]:
+        """
+        形態素解析（キャッシュしない）
+
+        Args:
+            text: 解析する文章
+
+        Returns:
+            list: (表層形, 品詞, 基本形) のリスト
+        """
+        with self._tokenizer_lock:
+            tokenizer = self._get_tokenizer()
+            return [
+                (token.surface, token.part_of_speech, token.base_form)
+                for token in tokenizer.tokenize(normalize_text(text))
+            ]
+
+    # ===== 抽出結果のキャッシュ =====
+    def _cache_get(self, key: str) -> tuple[str, ...] | None:
+        with self._cache_lock:
+            words = self._cache.get(key)
+            if words is not None:
+                self._cache.move_to_end(key)
+            return words
+
+    def _cache_put(self, key: str, words: tuple[str, ...]) -> None:
+        with self._cache_lock:
+            self._cache[key] = words
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ===== 抽出 =====
+    def extract(self, phrase: str) -> tuple[str, ...]:
+        """
+        フレーズから単語を抽出（同じフレーズは再解析しない）
+
+        Args:
+            phrase: マイナスワードなどのフレーズ
+
+        Returns:
+            tuple: 抽出した単語
+        """
+        return self.extract_batch([phrase])[0]
+
+    def extract_batch(self, phrases: Iterable[str]) -> list[tuple[str, ...]]:
+        """
+        複数のフレーズから単語を抽出（未解析のフレーズが多い場合はプロセスプールで並列に解析）
+
+        Args:
+            phrases: フレーズのリスト
+
+        Returns:
+            list: フレーズごとの抽出結果（入力と同じ順）
+        """
+        keys = [clean_phrase(phrase) for phrase in phrases]
+
+        results: dict[str, tuple[str, ...]] = {}
+        pending: list[str] = []
+        for key in dict.fromkeys(keys):
+            words = self._cache_get(key)
+            if words is None:
+                pending.append(key)
+            else:
+                results[key] = words
+
+        self.stats["hits"] += len(keys) - len(pending)
+        self.stats["misses"] += len(pending)
+
+        if pending:
+            if self._should_parallelize(len(pending)):
+                extracted = self._extract_parallel(pending)
+            else:
+                with self._tokenizer_lock:
+                    tokenizer = self._get_tokenizer()
+                    extracted = [extract_content_words(tokenizer, key) for key in pending]
+            for key, words in zip(pending, extracted):
+                self._cache_put(key, words)
+                results[key] = words
+
+        return [results[key] for key in keys]
+
+    def extract_words(self, phrases: Iterable[str]) -> list[str]:
+        """
+        複数のフレーズから抽出した単語を1つのリストにまとめて返す
+
+        Args:
+            phrases: フレーズのリスト
+
+        Returns:
+            list: 抽出した単語（フレーズの順・出現順）
+        """
+        return [word for words in self.extract_batch(phrases) for word in words]
+
+    # ===== 並列解析 =====
+    def _should_parallelize(self, count: int) -> bool:
+        # ワードクラウドのワーカーなどデーモンプロセスは子プロセスを持てないため、メインプロセスのみ
+        return (
+            self.processes > 1
+            and count >= self.parallel_min_phrases
+            and multiprocessing.parent_process() is None
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                logger.info(f"⚙️ 形態素解析のプロセスプール起動: {self.processes}プロセス")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.mmap,),
+                )
+            return self._pool
+
+    def _extract_parallel(self, texts: list[str]) -> list[tuple[str, ...]]:
+        # 各プロセスに数回ずつ渡る大きさに分割（偏りを均す）
+        chunk_size = max(1, math.ceil(len(texts) / (self.processes * 4)))
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        self.stats["parallel_batches"] += 1
+        return [words for chunk in self._get_pool().map(_extract_chunk, chunks) for words in chunk]
+
+    def shutdown_pool(self) -> None:
+        """プロセスプールを終了（辞書を読み込んだプロセス分のメモリを解放する）"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("⚙️ 形態素解析のプロセスプール終了")
+
+    def get_stats(self) -> dict:
+        """
+        キャッシュのヒット率などを取得
+
+        Returns:
+            dict: ヒット/ミス数・ヒット率・キャッシュ件数・辞書の読み込み状況
+        """
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["cache_items"] = len(self._cache)
+        stats["dictionary_loaded"] = self.is_loaded
+        stats["processes"] = self.processes
+        stats["pool_running"] = self._pool is not None
+        return stats
+
+
+# グローバルインスタンス（辞書は初回の解析時に読み込む）
+tokenizer_service = TokenizerService()
@@ -0,0 +1,247 @@
+# backend/wc_aggregates.py（新規）
+#
+# ワードクラウド用の単語出現数の集計（word_frequencies テーブル）
+#
+#   会話の保存時にマイナスワードを形態素解析し、(ユーザー, 日, 単語) ごとの出現数に加算する。
+#   ワードクラウドの生成は集計テーブルの GROUP BY / SUM だけで済む。
+#
+# 使い方（既存DBの集計を会話履歴から作り直す）:
+#   python wc_aggregates.py --rebuild
+
+import argparse
+import json
+import logging
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from threading import Thread
+from typing import Iterable
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Conversation, WordFrequency
+from tokenizer_service import tokenizer_service
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# ワードクラウドに渡す単語数の上限（出現数の多い順。描画されるのは最大100語）
+WORDCLOUD_AGGREGATE_MAX_WORDS = int(os.getenv("WORDCLOUD_AGGREGATE_MAX_WORDS", "200"))
+# 作り直しで1回のトランザクションに含める会話数
+WORDCLOUD_REBUILD_BATCH = int(os.getenv("WORDCLOUD_REBUILD_BATCH", "500"))
+
+# ユーザーIDのない会話の集計に使うID
+ANONYMOUS_USER_ID = -1
+# word 列の長さ
+_MAX_WORD_LENGTH = 100
+
+def count_words(minus_words: list[str]) -> Counter:
+    """
+    マイナスワードから抽出した単語の出現数（ワードクラウドと同じ抽出・除外規則）
+
+    Args:
+        minus_words: 会話1件分のマイナスワード
+
+    Returns:
+        Counter: 単語 -> 出現数
+    """
+    if not minus_words:
+        return Counter()
+    return _count(tokenizer_service.extract_words(minus_words))
+
+
+def _count(words: Iterable[str]) -> Counter:
+    return Counter(word[:_MAX_WORD_LENGTH] for word in words)
+
+
+def day_bucket(created_at: datetime | None) -> date:
+    """集計する日（created_at は SQLite の CURRENT_TIMESTAMP のためUTC）"""
+    if created_at is None:
+        return datetime.now(timezone.utc).date()
+    return created_at.date()
+
+
+def since_day(days: int) -> date:
+    """直近 days 日分（今日を含む）の最初の日（UTC）"""
+    return datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+
+def add_counts(db: Session, user_id: int | None, day: date, counts: Counter) -> None:
+    """
+    単語の出現数を集計に加算（コミットは呼び出し側で行う）
+
+    Args:
+        db: セッション（会話の保存と同じトランザクションで加算する）
+        user_id: ユーザーID
+        day: 集計する日
+        counts: 単語 -> 出現数
+    """
+    if not counts:
+        return
+    user_key = ANONYMOUS_USER_ID if user_id is None else user_id
+    stmt = insert(WordFrequency).values([
+        {"user_id": user_key, "day": day, "word": word, "count": count}
+        for word, count in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WordFrequency.user_id, WordFrequency.day, WordFrequency.word],
+        set_={"count": WordFrequency.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+
+
+def query_frequencies(
+    db: Session,
+    user_id: int | None = None,
+    days: int | None = None,
+    max_words: int = WORDCLOUD_AGGREGATE_MAX_WORDS,
+) -> dict[str, int]:
+    """
+    ワードクラウド用の単語の出現数を集計テーブルから取得
+
+    Args:
+        db: セッション
+        user_id: ユーザーID（None の場合は全ユーザー）
+        days: 直近何日分か（None の場合は全期間。今日を含む）
+        max_words: 取得する単語数の上限（出現数の多い順）
+
+    Returns:
+        dict: 単語 -> 出現数
+    """
+    total = func.sum(WordFrequency.count).label("total")
+    stmt = select(WordFrequency.word, total)
+    if user_id is not None:
+        stmt = stmt.where(WordFrequency.user_id == user_id)
+    if days is not None and days > 0:
+        stmt = stmt.where(WordFrequency.day >= since_day(days))
+    stmt = stmt.group_by(WordFrequency.word).order_by(total.desc()).limit(max_words)
+    return {word: int(count) for word, count in db.execute(stmt)}
+
+
+def _parse_words(value: str | None) -> list[str]:
+    """ai_response_words（JSON配列の文字列）をリストに変換"""
+    if not value:
+        return []
+    try:
+        words = json.loads(value)
+    except json.JSONDecodeError:
+        return []
+    return [word for word in words if isinstance(word, str)] if isinstance(words, list) else []
+
+
+# =========================
+# 作り直し（既存DB向け）
+# =========================
+def rebuild(session_factory=SessionLocal, batch_size: int = WORDCLOUD_REBUILD_BATCH) -> int:
+    """
+    集計テーブルを会話履歴から作り直す
+
+    削除と同じトランザクションで会話IDの最大値を記録し、それ以下の会話だけを集計する。
+    作り直し中に保存された会話は保存時に加算されるため、二重に数えない。
+    完了までの間、ワードクラウドは途中までの集計で描画される。
+    フレーズの解析はバッチ単位で tokenizer_service に渡し、完了後にプロセスプールを終了する。
+
+    Args:
+        session_factory: セッションの生成関数
+        batch_size: 1回のトランザクションに含める会話数
+
+    Returns:
+        int: 集計した会話数
+    """
+    db = session_factory()
+    try:
+        db.execute(delete(WordFrequency))
+        watermark = db.execute(select(func.max(Conversation.id))).scalar() or 0
+        db.commit()
+
+        last_id, processed = 0, 0
+        while True:
+            rows = db.execute(
+                select(Conversation.id, Conversation.user_id, Conversation.created_at, Conversation.ai_response_words)
+                .where(
+                    Conversation.id > last_id,
+                    Conversation.id <= watermark,
+                    Conversation.ai_response_words.isnot(None),
+                )
+                .order_by(Conversation.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            # バッチ内のフレーズをまとめて解析（件数が多ければプロセスプールで並列に解析）
+            phrases = [_parse_words(words) for _, _, _, words in rows]
+            extracted = iter(tokenizer_service.extract_batch(
+                phrase for conversation_phrases in phrases for phrase in conversation_phrases
+            ))
+            for (_, user_id, created_at, _), conversation_phrases in zip(rows, phrases):
+                words = [word for _ in conversation_phrases for word in next(extracted)]
+                add_counts(db, user_id, day_bucket(created_at), _count(words))
+            db.commit()
+
+            last_id = rows[-1][0]
+            processed += len(rows)
+            logger.info(f"📊 ワードクラウド集計を作成中: {processed}件")
+
+        logger.info(f"✅ ワードクラウド集計の作成完了: {processed}件")
+        return processed
+    finally:
+        db.close()
+        tokenizer_service.shutdown_pool()
+
+
+def _rebuild_if_empty() -> None:
+    db = SessionLocal()
+    try:
+        has_aggregates = db.execute(select(WordFrequency.word).limit(1)).first() is not None
+        has_history = db.execute(
+            select(Conversation.id).where(Conversation.ai_response_words.isnot(None)).limit(1)
+        ).first() is not None
+    finally:
+        db.close()
+
+    if has_aggregates or not has_history:
+        return
+    logger.info("📊 ワードクラウド集計がないため会話履歴から作成します")
+    try:
+        rebuild()
+    except Exception as e:
+        logger.error(f"❌ ワードクラウド集計の作成失敗: {e}")
+
+
+def start_rebuild_if_empty() -> None:
+    """
+    集計テーブルが空で会話履歴がある場合（既存DBの初回起動）にバックグラウンドで作成
+
+    APIワーカーが複数でも1回だけ実行されるよう、起動元の1プロセスから呼ぶ。
+    """
+    Thread(target=_rebuild_if_empty, daemon=True, name="wordcloud-rebuild").start()
+
+
+def main():
+    """コマンドラインから集計を作り直す"""
+    from database import init_db
+    from logging_config import setup_logging
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="ワードクラウド用の単語出現数の集計")
+    parser.add_argument("--rebuild", action="store_true", help="会話履歴から集計を作り直す")
+    parser.add_argument("--batch-size", type=int, default=WORDCLOUD_REBUILD_BATCH, help="1回のトランザクションの会話数")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    init_db()
+    processed = rebuild(batch_size=args.batch_size)
+    print(f"集計した会話数: {processed}")
+
+
+if __name__ == "__main__":
+    main()
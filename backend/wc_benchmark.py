@@ -0,0 +1,187 @@
+# backend/wc_benchmark.py（新規）
+#
+# ワードクラウド描画の計測（wordcloud パッケージと NumPy 配置エンジン wc_layout の比較）
+#
+#   キャンバスサイズ × 単語数 ごとに、次の3通りの描画時間を計測する。
+#     wordcloud : wordcloud パッケージの generate_from_frequencies（従来の経路）
+#     numpy     : wc_layout で配置を計算（字形・配置のキャッシュを毎回破棄）
+#     reuse     : 順位が変わらない程度に出現数を変えて再描画（配置を再利用して着色のみ）
+#
+# 使い方:
+#   python wc_benchmark.py                                         # 既定のサイズ・単語数で計測
+#   python wc_benchmark.py --sizes 800x400,2000x1000 --words 25,100 --repeat 5
+#   python wc_benchmark.py --output wc_result.json                 # 結果をJSONで保存
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import time
+from typing import Any
+
+from wc_layout import layout_engine
+from wc_model import WordCloudGenerator
+
+logger = logging.getLogger(__name__)
+
+# 既定の計測条件（API で指定できる範囲: 幅 400〜2000・高さ 200〜1000）
+DEFAULT_SIZES = [(400, 200), (800, 400), (1200, 600), (2000, 1000)]
+DEFAULT_WORDS = [25, 50, 100]
+DEFAULT_REPEAT = 3
+
+# 単語の候補（マイナスワードから抽出される語に近いもの。不足分は番号付きで補う）
+WORD_POOL = [
+    "無理", "失敗", "ダメ", "できない", "辛い", "疲れる", "嫌い", "不安", "怖い", "悲しい",
+    "どうせ", "いつも", "また", "もう", "普通", "当たり前", "仕事", "勉強", "自分", "みんな",
+    "役立たず", "無能", "遅い", "うるさい", "面倒", "意味", "理解", "頑張る", "言う", "思う",
+    "比べる", "やっぱり", "そんな", "あんな", "最悪", "苦しい", "寂しい", "虚しい", "焦る", "怒る",
+]
+
+
+def make_frequencies(n_words: int, seed: int = 0) -> dict[str, int]:
+    """Zipf 分布に近い出現数（順位が重複しないよう単調に減らす）"""
+    words = [WORD_POOL[i] if i < len(WORD_POOL) else f"{WORD_POOL[i % len(WORD_POOL)]}{i}" for i in range(n_words)]
+    random.Random(seed).shuffle(words)
+    return {word: 10_000 // (rank + 1) + (n_words - rank) for rank, word in enumerate(words)}
+
+
+def perturb(frequencies: dict[str, int], amount: float = 0.05) -> dict[str, int]:
+    """順位を保ったまま出現数を少し変える（会話が数件増えた状態を想定）"""
+    ranked = sorted(frequencies.items(), key=lambda item: -item[1])
+    result: dict[str, int] = {}
+    previous = None
+    for word, freq in ranked:
+        value = int(freq * (1 + amount))
+        if previous is not None:
+            value = min(value, previous - 1)
+        result[word] = max(1, value)
+        previous = result[word]
+    return result
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """ミリ秒単位の集計値"""
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2),
+        "min_ms": round(min(values) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def measure(generator: WordCloudGenerator, frequencies: dict[str, int], width: int, height: int,
+            repeat: int, before_each=None) -> dict[str, Any]:
+    """
+    描画を repeat 回計測
+
+    Args:
+        generator: 計測するエンジンの WordCloudGenerator
+        frequencies: 単語 -> 出現数
+        width: 画像幅
+        height: 画像高さ
+        repeat: 計測回数
+        before_each: 各回の前に呼ぶ関数（計測時間に含めない）
+
+    Returns:
+        dict: 全体・配置段階の所要時間
+    """
+    totals, layouts = [], []
+    for _ in range(repeat):
+        if before_each is not None:
+            before_each()
+        started_at = time.perf_counter()
+        generator.generate_wordcloud_from_frequencies(frequencies, width=width, height=height)
+        totals.append(time.perf_counter() - started_at)
+        layouts.append(generator.timings.get("layout", 0.0))
+    return {"total": summarize(totals), "layout": summarize(layouts)}
+
+
+def run(sizes: list[tuple[int, int]], word_counts: list[int], repeat: int) -> dict[str, Any]:
+    """全ての条件を計測"""
+    baseline = WordCloudGenerator(engine="wordcloud")
+    numpy_engine = WordCloudGenerator(engine="numpy")
+
+    # フォント・matplotlib などの初回読み込みを計測から除く
+    baseline.generate_wordcloud_from_frequencies({"準備": 1}, width=400, height=200)
+    numpy_engine.generate_wordcloud_from_frequencies({"準備": 1}, width=400, height=200)
+
+    cases = []
+    for width, height in sizes:
+        for n_words in word_counts:
+            frequencies = make_frequencies(n_words)
+            case = {"width": width, "height": height, "words": n_words}
+
+            case["wordcloud"] = measure(baseline, frequencies, width, height, repeat)
+            case["numpy"] = measure(numpy_engine, frequencies, width, height, repeat, before_each=layout_engine.clear)
+
+            # 配置を1回計算してから、順位が同じ出現数で再描画する
+            layout_engine.clear()
+            numpy_engine.generate_wordcloud_from_frequencies(frequencies, width=width, height=height)
+            case["reuse"] = measure(numpy_engine, perturb(frequencies), width, height, repeat)
+
+            base_ms = case["wordcloud"]["total"]["median_ms"]
+            case["speedup"] = {
+                "numpy": round(base_ms / case["numpy"]["total"]["median_ms"], 2),
+                "reuse": round(base_ms / case["reuse"]["total"]["median_ms"], 2),
+            }
+            cases.append(case)
+            print(format_row(case), flush=True)
+
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "cases": cases,
+        "layout_engine": layout_engine.get_stats(),
+    }
+
+
+def format_header() -> str:
+    return (f"{'size':>10} {'words':>5} | {'wordcloud':>10} {'numpy':>10} {'reuse':>10} | "
+            f"{'layout(wc)':>10} {'layout(np)':>10} | {'x numpy':>7} {'x reuse':>7}")
+
+
+def format_row(case: dict[str, Any]) -> str:
+    size = f"{case['width']}x{case['height']}"
+    return (
+        f"{size:>10} {case['words']:>5} | "
+        f"{case['wordcloud']['total']['median_ms']:>8.1f}ms {case['numpy']['total']['median_ms']:>8.1f}ms "
+        f"{case['reuse']['total']['median_ms']:>8.1f}ms | "
+        f"{case['wordcloud']['layout']['median_ms']:>8.1f}ms {case['numpy']['layout']['median_ms']:>8.1f}ms | "
+        f"{case['speedup']['numpy']:>6.2f}x {case['speedup']['reuse']:>6.2f}x"
+    )
+
+
+def parse_sizes(value: str) -> list[tuple[int, int]]:
+    """「800x400,2000x1000」をサイズのリストに変換"""
+    sizes = []
+    for item in value.split(","):
+        width, height = item.lower().split("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def main():
+    from logging_config import setup_logging
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="ワードクラウド描画の計測（wordcloud パッケージと wc_layout の比較）")
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES, help="キャンバスサイズ（例: 800x400,2000x1000）")
+    parser.add_argument("--words", type=lambda s: [int(n) for n in s.split(",")], default=DEFAULT_WORDS,
+                        help="単語数（例: 25,50,100）")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="条件ごとの計測回数（中央値を表示）")
+    parser.add_argument("--output", help="結果JSONの保存先")
+    args = parser.parse_args()
+
+    print(format_header())
+    result = run(args.sizes, args.words, args.repeat)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
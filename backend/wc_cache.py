@@ -0,0 +1,265 @@
+# backend/wc_cache.py（新規）
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from config import APP_DATA_DIR
+from models import Conversation, WordFrequency
+from wc_aggregates import since_day
+from wc_layout import WORDCLOUD_LAYOUT_ENGINE
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+WORDCLOUD_CACHE_ENABLED = os.getenv("WORDCLOUD_CACHE_ENABLED", "1") == "1"
+WORDCLOUD_CACHE_MEMORY_ITEMS = int(os.getenv("WORDCLOUD_CACHE_MEMORY_ITEMS", "32"))
+WORDCLOUD_CACHE_DISK_ITEMS = int(os.getenv("WORDCLOUD_CACHE_DISK_ITEMS", "256"))
+WORDCLOUD_CACHE_DIR = APP_DATA_DIR / "cache" / "wordcloud"
+
+# 描画方法（wc_model の WORDCLOUD_OPTIONS・wc_layout の配置規則など）を変更したら必ず上げる
+WORDCLOUD_RENDER_VERSION = f"2:{WORDCLOUD_LAYOUT_ENGINE}"
+
+# ディスク層の件数チェックを行う間隔（書き込み回数）
+_EVICT_INTERVAL = 16
+
+
+def data_version(db: Session, user_id: int | None, limit: int | None, days: int | None) -> str:
+    """
+    ワードクラウドの元データの版（会話が追加されると変わる）
+
+    条件に合う会話の最新ID とその作成日時から求める（ID と作成日時はともに増加するため、
+    期間の指定は版に期間の開始日を含めるだけでよい）。集計テーブルから描画する場合は
+    出現数の合計も含め、集計の作り直し中の途中状態を完成後の画像と区別する。
+
+    Args:
+        db: セッション
+        user_id: ユーザーID（None の場合は全ユーザー）
+        limit: 直近の会話数（None の場合は集計テーブルから描画）
+        days: 直近何日分か
+
+    Returns:
+        str: 版を表す文字列
+    """
+    # 最大値だけを求める形にしてインデックスの末尾を読むだけで済ませる
+    stmt = select(func.max(Conversation.id))
+    if user_id is not None:
+        stmt = stmt.where(Conversation.user_id == user_id)
+    latest_id = db.execute(stmt).scalar()
+    latest_at = None
+    if latest_id is not None:
+        latest_at = db.execute(select(Conversation.created_at).where(Conversation.id == latest_id)).scalar()
+    parts = [latest_id, latest_at.isoformat() if latest_at is not None else None]
+
+    if limit is None:
+        stmt = select(func.coalesce(func.sum(WordFrequency.count), 0))
+        if user_id is not None:
+            stmt = stmt.where(WordFrequency.user_id == user_id)
+        if days is not None:
+            stmt = stmt.where(WordFrequency.day >= since_day(days))
+        parts.append(db.execute(stmt).scalar())
+
+    if days is not None:
+        # 日付が変わると期間の区切りが動くため別の版にする
+        parts.append(since_day(days).isoformat())
+
+    return ":".join(str(part) for part in parts)
+
+
+def make_render_key(params: dict, version: str) -> str:
+    """
+    描画結果のキャッシュキーを生成
+
+    Args:
+        params: 描画の条件（ユーザーID・件数・期間・サイズ・カラーマップ）
+        version: data_version で求めた元データの版
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    material = json.dumps(
+        {"params": params, "data": version, "render": WORDCLOUD_RENDER_VERSION},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def make_etag(key: str) -> str:
+    """
+    弱いETag（同じキーの画像は同じ内容だが、配置を再利用したかどうかでバイト列は変わりうる）
+    """
+    return f'W/"{key[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match ヘッダーが ETag に一致するか（RFC 9110 の弱い比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class WordCloudCache:
+    """
+    ワードクラウド画像の2段キャッシュ
+
+    - 1段目: プロセス内のLRU
+    - 2段目: APP_DATA_DIR/cache/wordcloud の PNG ファイル（再起動後・APIワーカー間で共有）
+    キーに元データの版を含むため、会話が追加されれば自然に別のキーになる（TTL は持たない）。
+    """
+
+    def __init__(
+        self,
+        max_memory_items: int = WORDCLOUD_CACHE_MEMORY_ITEMS,
+        max_disk_items: int = WORDCLOUD_CACHE_DISK_ITEMS,
+        directory: Path = WORDCLOUD_CACHE_DIR,
+    ):
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.directory = directory
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = Lock()
+        self._writes_since_evict = 0
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "not_modified": 0,
+            "stores": 0,
+        }
+
+    # ===== メモリ層 =====
+    def _get_memory(self, key: str) -> bytes | None:
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+            return png
+
+    def _put_memory(self, key: str, png: bytes) -> None:
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    # ===== ディスク層 =====
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+
+    def _get_disk(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            png = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # 更新日時を最終利用日時として整理に使う
+        return png
+
+    def _put_disk(self, key: str, png: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(png)
+        os.replace(tmp_path, path)
+
+        self._writes_since_evict += 1
+        if self._writes_since_evict >= _EVICT_INTERVAL:
+            self._writes_since_evict = 0
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """上限を超えた分を最終利用が古い順に削除"""
+        files = []
+        for path in self.directory.glob("*.png"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        overflow = len(files) - self.max_disk_items
+        if overflow <= 0:
+            return
+        for _, path in sorted(files)[:overflow]:
+            path.unlink(missing_ok=True)
+        logger.info(f"🧹 ワードクラウドキャッシュ整理: {overflow}件削除")
+
+    # ===== 公開API =====
+    async def get(self, key: str) -> bytes | None:
+        """
+        キャッシュを検索（メモリ → ディスク の順）
+
+        Args:
+            key: make_render_key で生成したキー
+
+        Returns:
+            bytes | None: PNG画像（なければ None）
+        """
+        png = self._get_memory(key)
+        if png is not None:
+            self.stats["memory_hits"] += 1
+            return png
+
+        try:
+            png = await asyncio.to_thread(self._get_disk, key)
+        except OSError as e:
+            logger.warning(f"⚠️ ワードクラウドキャッシュ(ディスク)の読み込み失敗: {e}")
+            png = None
+
+        if png is not None:
+            self._put_memory(key, png)
+            self.stats["disk_hits"] += 1
+            return png
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, png: bytes) -> None:
+        """
+        画像を両方の層に保存
+
+        Args:
+            key: make_render_key で生成したキー
+            png: PNG画像
+        """
+        self._put_memory(key, png)
+        self.stats["stores"] += 1
+        try:
+            await asyncio.to_thread(self._put_disk, key, png)
+        except OSError as e:
+            logger.warning(f"⚠️ ワードクラウドキャッシュ(ディスク)の保存失敗: {e}")
+
+    def record_not_modified(self) -> None:
+        """304 で応答したリクエストを記録"""
+        self.stats["not_modified"] += 1
+
+    def get_stats(self) -> dict:
+        """
+        ヒット率などの統計を取得
+
+        Returns:
+            dict: ヒット/ミス数・304の数・ヒット率・メモリ層の件数
+        """
+        stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_items"] = len(self._memory)
+        return stats
+
+
+# グローバルインスタンス
+wordcloud_cache = WordCloudCache() if WORDCLOUD_CACHE_ENABLED else None
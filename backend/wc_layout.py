@@ -0,0 +1,441 @@
+# backend/wc_layout.py（新規）
+#
+# ワードクラウドの配置エンジン（wordcloud パッケージの generate_from_frequencies の代替）
+#
+#   - 占有マップの積分画像から、単語の外接矩形が収まる位置を NumPy で一括に求める
+#   - 単語の字形（ラスタライズ結果）を (フォント, 単語, フォントサイズ) ごとにキャッシュ
+#   - 上位の単語の順位が前回と同じなら配置を再利用し、拡大縮小・着色だけやり直す
+#
+#   フォントサイズの決め方・縦書きの割合・余白は wordcloud パッケージと同じ規則にしている。
+#   計測: python wc_benchmark.py
+
+import logging
+import os
+import random
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 配置エンジン（numpy: このモジュール / wordcloud: wordcloud パッケージ）
+WORDCLOUD_LAYOUT_ENGINE = os.getenv("WORDCLOUD_LAYOUT_ENGINE", "numpy")
+# 字形キャッシュの上限（MB）
+WORDCLOUD_GLYPH_CACHE_MB = float(os.getenv("WORDCLOUD_GLYPH_CACHE_MB", "32"))
+# 再利用のために保持する配置の数
+WORDCLOUD_LAYOUT_CACHE_SIZE = int(os.getenv("WORDCLOUD_LAYOUT_CACHE_SIZE", "16"))
+# 配置を再利用できる出現数の変化（最大の単語を 1.0 とした相対値の差）
+WORDCLOUD_LAYOUT_REUSE_TOLERANCE = float(os.getenv("WORDCLOUD_LAYOUT_REUSE_TOLERANCE", "0.15"))
+# 配置を拡大縮小して再利用できる倍率の上限（縦横比が同じ場合のみ）
+WORDCLOUD_LAYOUT_MAX_SCALE = float(os.getenv("WORDCLOUD_LAYOUT_MAX_SCALE", "2.0"))
+
+# 単語の外接矩形の周囲に空ける余白（px）
+LAYOUT_MARGIN = 2
+# 収まらない場合に1回で下げるフォントサイズ
+FONT_STEP = 1
+# 空き位置をまず調べる格子の間隔（px）
+SEARCH_STRIDE = 4
+# 縦横比が同じとみなす誤差
+_ASPECT_TOLERANCE = 0.01
+
+
+class Placement:
+    """配置した単語1つ"""
+
+    __slots__ = ("word", "font_size", "row", "col", "vertical")
+
+    def __init__(self, word: str, font_size: int, row: int, col: int, vertical: bool):
+        self.word = word
+        self.font_size = font_size
+        self.row = row            # 上端（px）
+        self.col = col            # 左端（px）
+        self.vertical = vertical  # 90度回転（下から上へ読む）
+
+
+class Layout:
+    """配置結果（描画の色以外のすべて）"""
+
+    def __init__(self, width: int, height: int, font_path: str, ranking: tuple[str, ...],
+                 weights: dict[str, float], placements: list[Placement]):
+        self.width = width
+        self.height = height
+        self.font_path = font_path
+        self.ranking = ranking      # 出現数の多い順の単語（max_words まで）
+        self.weights = weights      # 単語 -> 最大を 1.0 とした出現数
+        self.placements = placements
+
+    def scaled(self, width: int, height: int) -> "Layout":
+        """縦横比が同じキャンバスに合わせて拡大縮小した配置"""
+        scale = width / self.width
+        placements = [
+            Placement(p.word, max(1, round(p.font_size * scale)), round(p.row * scale), round(p.col * scale), p.vertical)
+            for p in self.placements
+        ]
+        return Layout(width, height, self.font_path, self.ranking, self.weights, placements)
+
+
+class OccupancyMap:
+    """
+    描画済みの画素の占有マップと、その積分画像
+
+    積分画像 integral[r, c] は occupied[:r, :c] の画素数。外接矩形内の画素数は4点の加減算で求まるため、
+    全ての候補位置を配列演算でまとめて調べられる。
+    """
+
+    def __init__(self, height: int, width: int, stride: int = SEARCH_STRIDE):
+        self.height = height
+        self.width = width
+        self.stride = stride
+        self.occupied = np.zeros((height, width), dtype=bool)
+        self.integral = np.zeros((height + 1, width + 1), dtype=np.int32)
+
+    def _free(self, box_height: int, box_width: int, stride: int) -> np.ndarray:
+        """左上が stride 間隔の格子点にある矩形のうち、空いているもの（格子の行×列の真偽値）"""
+        ii = self.integral
+        rows = self.height + 1 - box_height
+        cols = self.width + 1 - box_width
+        counts = ii[box_height::stride, box_width::stride] - ii[:rows:stride, box_width::stride]
+        counts -= ii[box_height::stride, :cols:stride]
+        counts += ii[:rows:stride, :cols:stride]
+        return counts == 0
+
+    def find_position(self, box_height: int, box_width: int, rng: random.Random) -> tuple[int, int] | None:
+        """
+        外接矩形が他の単語と重ならない位置を無作為に1つ選ぶ
+
+        まず stride 間隔の格子点だけを調べ（計算量は 1/stride²）、見つからない場合のみ全ての位置を調べる。
+        どちらも積分画像による厳密な判定のため、重なる位置を返すことはない。
+
+        Args:
+            box_height: 矩形の高さ（余白を含む）
+            box_width: 矩形の幅（余白を含む）
+            rng: 乱数生成器
+
+        Returns:
+            tuple | None: (上端, 左端)。収まる位置がなければ None
+        """
+        if box_height > self.height or box_width > self.width:
+            return None
+        for stride in ((self.stride, 1) if self.stride > 1 else (1,)):
+            free = self._free(box_height, box_width, stride)
+            per_row = np.count_nonzero(free, axis=1)
+            total = int(per_row.sum())
+            if total == 0:
+                continue
+            # 全候補の添字を作らずに k 番目の空き位置を求める
+            k = rng.randrange(total)
+            cumulative = np.cumsum(per_row)
+            row = int(np.searchsorted(cumulative, k, side="right"))
+            offset = k - (int(cumulative[row - 1]) if row else 0)
+            col = int(np.flatnonzero(free[row])[offset])
+            return row * stride, col * stride
+        return None
+
+    def add(self, mask: np.ndarray, row: int, col: int) -> None:
+        """
+        単語の字形を占有マップに加え、積分画像を差分で更新
+
+        新たに埋まった画素の2次元累積和を、右下方向（行・列とも row/col 以降）に加算するだけで済む。
+        """
+        region = self.occupied[row:row + mask.shape[0], col:col + mask.shape[1]]
+        added = mask[:region.shape[0], :region.shape[1]] & ~region
+        region |= added
+
+        delta = np.cumsum(np.cumsum(added, axis=0, dtype=np.int32), axis=1, dtype=np.int32)
+        bottom, right = row + delta.shape[0] + 1, col + delta.shape[1] + 1
+        ii = self.integral
+        ii[row + 1:bottom, col + 1:right] += delta
+        ii[row + 1:bottom, right:] += delta[:, -1:]
+        ii[bottom:, col + 1:right] += delta[-1:, :]
+        ii[bottom:, right:] += delta[-1, -1]
+
+
+class GlyphCache:
+    """単語のラスタライズ結果（アルファ値の配列）のLRU。上限は合計バイト数で決める"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._glyphs: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._fonts: dict[tuple[str, int], ImageFont.FreeTypeFont] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+        key = (font_path, font_size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = ImageFont.truetype(font_path, font_size)
+        return font
+
+    def box(self, font_path: str, word: str, font_size: int) -> tuple[int, int]:
+        """横書きの外接矩形 (高さ, 幅)。ラスタライズせずに求める"""
+        _, _, right, bottom = self.font(font_path, font_size).getbbox(word, anchor="lt")
+        return max(1, bottom), max(1, right)
+
+    def get(self, font_path: str, word: str, font_size: int) -> np.ndarray:
+        """横書きの字形（uint8 のアルファ値。縦書きは np.rot90 で回転して使う）"""
+        key = (font_path, word, font_size)
+        glyph = self._glyphs.get(key)
+        if glyph is not None:
+            self._glyphs.move_to_end(key)
+            self.hits += 1
+            return glyph
+
+        self.misses += 1
+        height, width = self.box(font_path, word, font_size)
+        image = Image.new("L", (width, height))
+        ImageDraw.Draw(image).text((0, 0), word, fill=255, font=self.font(font_path, font_size), anchor="lt")
+        glyph = np.asarray(image)
+
+        self._glyphs[key] = glyph
+        self._bytes += glyph.nbytes
+        while self._bytes > self.max_bytes and len(self._glyphs) > 1:
+            _, evicted = self._glyphs.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return glyph
+
+    def clear(self) -> None:
+        self._glyphs.clear()
+        self._fonts.clear()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._glyphs)
+
+
+def default_font_path() -> str:
+    """日本語フォントが見つからない場合のフォント（wordcloud パッケージ同梱）"""
+    from wordcloud.wordcloud import FONT_PATH
+    return FONT_PATH
+
+
+class LayoutEngine:
+    """
+    ワードクラウドの配置と描画
+
+    ワーカープロセスごとに1つ使う（スレッドから同時に呼ばれる場合に備えてロックで直列化する）。
+    """
+
+    def __init__(
+        self,
+        glyph_cache_bytes: int = int(WORDCLOUD_GLYPH_CACHE_MB * 1024 * 1024),
+        layout_cache_size: int = WORDCLOUD_LAYOUT_CACHE_SIZE,
+        reuse_tolerance: float = WORDCLOUD_LAYOUT_REUSE_TOLERANCE,
+        max_scale: float = WORDCLOUD_LAYOUT_MAX_SCALE,
+    ):
+        self.glyphs = GlyphCache(glyph_cache_bytes)
+        self.layout_cache_size = layout_cache_size
+        self.reuse_tolerance = reuse_tolerance
+        self.max_scale = max_scale
+
+        self._layouts: OrderedDict[tuple, Layout] = OrderedDict()
+        self._lock = Lock()
+        self.stats = {"computed": 0, "reused": 0, "rescaled": 0}
+
+    # ===== 配置 =====
+    def layout(
+        self,
+        frequencies: dict[str, float],
+        width: int,
+        height: int,
+        font_path: str | None = None,
+        max_words: int = 100,
+        relative_scaling: float = 0.5,
+        min_font_size: int = 10,
+        max_font_size: int = 100,
+        prefer_horizontal: float = 0.7,
+        random_state: int | None = None,
+    ) -> Layout:
+        """
+        単語の配置を求める（順位が同じ配置があれば再利用）
+
+        Args:
+            frequencies: 単語 -> 出現数
+            width: キャンバスの幅
+            height: キャンバスの高さ
+            font_path: フォントのパス（None の場合は wordcloud パッケージ同梱のフォント）
+            max_words: 配置する単語数の上限
+            relative_scaling: 出現数の比をフォントサイズに反映する度合い（0〜1）
+            min_font_size: これより小さくしないと収まらない単語は配置しない
+            max_font_size: 最も多い単語のフォントサイズ
+            prefer_horizontal: 横書きにする割合
+            random_state: 乱数のシード
+
+        Returns:
+            Layout: 配置結果
+
+        Raises:
+            ValueError: 出現数が正の単語がない場合
+        """
+        font_path = font_path or default_font_path()
+        items = sorted(
+            ((word, freq) for word, freq in frequencies.items() if freq > 0),
+            key=lambda item: (-item[1], item[0]),
+        )[:max_words]
+        if not items:
+            raise ValueError("出現数が正の単語がありません")
+        max_frequency = float(items[0][1])
+        weights = {word: freq / max_frequency for word, freq in items}
+        ranking = tuple(word for word, _ in items)
+
+        options = (font_path, ranking, relative_scaling, min_font_size, max_font_size, prefer_horizontal, random_state)
+        with self._lock:
+            reused = self._find_reusable(options, weights, width, height)
+            if reused is not None:
+                return reused
+
+            layout = self._compute(
+                weights, ranking, width, height, font_path,
+                relative_scaling, min_font_size, max_font_size, prefer_horizontal, random_state,
+            )
+            self.stats["computed"] += 1
+            self._remember((options, width, height), layout)
+            return layout
+
+    def _find_reusable(self, options: tuple, weights: dict[str, float], width: int, height: int) -> Layout | None:
+        """同じ順位・近い出現数の配置を探す（同じサイズならそのまま、縦横比が同じなら拡大縮小）"""
+        exact = self._layouts.get((options, width, height))
+        candidates = [exact] if exact is not None else [
+            layout for (key, _, _), layout in self._layouts.items() if key == options
+        ]
+        for layout in candidates:
+            if any(abs(layout.weights[word] - weight) > self.reuse_tolerance for word, weight in weights.items()):
+                continue
+            if layout.width == width and layout.height == height:
+                self._layouts.move_to_end((options, width, height))
+                self.stats["reused"] += 1
+                return layout
+            scale = width / layout.width
+            if (abs(height / layout.height - scale) <= _ASPECT_TOLERANCE * scale
+                    and 1 / self.max_scale <= scale <= self.max_scale):
+                self.stats["rescaled"] += 1
+                return layout.scaled(width, height)
+        return None
+
+    def _remember(self, key: tuple, layout: Layout) -> None:
+        self._layouts[key] = layout
+        self._layouts.move_to_end(key)
+        while len(self._layouts) > self.layout_cache_size:
+            self._layouts.popitem(last=False)
+
+    def _compute(
+        self,
+        weights: dict[str, float],
+        ranking: tuple[str, ...],
+        width: int,
+        height: int,
+        font_path: str,
+        relative_scaling: float,
+        min_font_size: int,
+        max_font_size: int,
+        prefer_horizontal: float,
+        random_state: int | None,
+    ) -> Layout:
+        """wordcloud パッケージと同じ規則で配置（位置の探索だけを配列演算にしている）"""
+        rng = random.Random(random_state)
+        occupancy = OccupancyMap(height, width)
+        placements: list[Placement] = []
+
+        font_size = max_font_size
+        last_weight = 1.0
+        for word in ranking:
+            weight = weights[word]
+            if relative_scaling != 0:
+                font_size = int(round((relative_scaling * (weight / last_weight) + (1 - relative_scaling)) * font_size))
+
+            vertical = rng.random() >= prefer_horizontal
+            tried_other_orientation = False
+            position = None
+            while font_size >= min_font_size:
+                box_height, box_width = self.glyphs.box(font_path, word, font_size)
+                if vertical:
+                    box_height, box_width = box_width, box_height
+                position = occupancy.find_position(box_height + LAYOUT_MARGIN, box_width + LAYOUT_MARGIN, rng)
+                if position is not None:
+                    break
+                if not tried_other_orientation and prefer_horizontal < 1:
+                    vertical = not vertical
+                    tried_other_orientation = True
+                else:
+                    font_size -= FONT_STEP
+                    vertical = False
+
+            if position is None:
+                break  # 以降の単語はさらに小さくなるため打ち切る
+
+            row, col = (value + LAYOUT_MARGIN // 2 for value in position)
+            glyph = self.glyphs.get(font_path, word, font_size)
+            occupancy.add(np.rot90(glyph) > 0 if vertical else glyph > 0, row, col)
+            placements.append(Placement(word, font_size, row, col, vertical))
+            last_weight = weight
+
+        return Layout(width, height, font_path, ranking, weights, placements)
+
+    # ===== 描画 =====
+    def draw(self, layout: Layout, background_color: str = "white", colormap: str = "Reds",
+             random_state: int | None = None) -> Image.Image:
+        """
+        配置を着色して画像にする（配置を再利用した場合もここは毎回行う）
+
+        Args:
+            layout: layout で求めた配置
+            background_color: 背景色
+            colormap: matplotlib のカラーマップ名
+            random_state: 色を選ぶ乱数のシード
+
+        Returns:
+            Image.Image: RGB画像
+        """
+        from wordcloud.wordcloud import colormap_color_func
+
+        color_func = colormap_color_func(colormap)
+        rng = random.Random(random_state)
+        canvas = np.empty((layout.height, layout.width, 3), dtype=np.float32)
+        canvas[:] = ImageColor.getrgb(background_color)[:3]
+
+        with self._lock:
+            for p in layout.placements:
+                glyph = self.glyphs.get(layout.font_path, p.word, p.font_size)
+                if p.vertical:
+                    glyph = np.rot90(glyph)
+                # 拡大縮小した配置ははみ出すことがあるためキャンバス内に切り詰める
+                region = canvas[p.row:p.row + glyph.shape[0], p.col:p.col + glyph.shape[1]]
+                alpha = glyph[:region.shape[0], :region.shape[1], None] / np.float32(255)
+                color = ImageColor.getrgb(color_func(
+                    p.word, font_size=p.font_size, position=(p.row, p.col),
+                    orientation=Image.ROTATE_90 if p.vertical else None, random_state=rng,
+                ))
+                region *= 1 - alpha
+                region += alpha * np.asarray(color, dtype=np.float32)
+
+        return Image.fromarray(np.rint(canvas).astype(np.uint8), "RGB")
+
+    def clear(self) -> None:
+        """キャッシュを破棄（計測用）"""
+        with self._lock:
+            self.glyphs.clear()
+            self._layouts.clear()
+
+    def get_stats(self) -> dict:
+        """
+        配置の再利用率などを取得
+
+        Returns:
+            dict: 配置の計算/再利用/拡大縮小の回数・字形キャッシュのヒット率と件数
+        """
+        stats = dict(self.stats)
+        lookups = self.glyphs.hits + self.glyphs.misses
+        stats["glyph_hit_rate"] = self.glyphs.hits / lookups if lookups else 0.0
+        stats["glyphs"] = len(self.glyphs)
+        stats["layouts"] = len(self._layouts)
+        return stats
+
+
+# グローバルインスタンス（ワーカープロセスごと）
+layout_engine = LayoutEngine()
@@ -0,0 +1,378 @@
+# backend/wc_pool.py（新規）
+#
+# ワードクラウド生成を専用のワーカープロセスで実行する
+#
+#   Janome の形態素解析・WordCloud の配置計算・PNG エンコードはいずれも CPU を
+#   数百ミリ秒〜数秒占有するため、イベントループで実行すると他の API が止まる。
+#   ワーカーは起動時にフォントを読み込んで試し描画まで済ませておき（Janome の辞書は
+#   集計を使わない limit 指定のジョブで初めて読み込む）、
+#   タイムアウト・クライアント切断時は実行中のワーカーを終了して新しいものに入れ替える。
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+from threading import Lock
+
+import metrics
+from scheduler import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 設定（環境変数で上書き可）
+# =========================
+# 0 の場合はAPIプロセスのスレッドで生成する（タイムアウト時に処理を打ち切れない）
+WORDCLOUD_POOL_ENABLED = os.getenv("WORDCLOUD_POOL_ENABLED", "1") == "1"
+# ワーカープロセス数（形態素解析を行ったワーカーは Janome の辞書分のメモリを使う）
+WORDCLOUD_WORKERS = int(os.getenv("WORDCLOUD_WORKERS", "1"))
+# 空きワーカーを待てるジョブ数（超えた分は 429）
+WORDCLOUD_QUEUE_SIZE = int(os.getenv("WORDCLOUD_QUEUE_SIZE", "8"))
+# 1ジョブの上限時間（待ち時間を含む・秒）
+WORDCLOUD_TIMEOUT = float(os.getenv("WORDCLOUD_TIMEOUT", "30"))
+# ワーカーの起動（辞書の読み込み・試し描画）を待つ時間（秒）
+WORDCLOUD_WORKER_START_TIMEOUT = float(os.getenv("WORDCLOUD_WORKER_START_TIMEOUT", "60"))
+# ワーカーの起動に失敗した場合の再試行間隔（秒）
+WORDCLOUD_WORKER_RESTART_BACKOFF = float(os.getenv("WORDCLOUD_WORKER_RESTART_BACKOFF", "5"))
+
+# Retry-After の目安に使う1ジョブあたりの秒数
+_ESTIMATED_JOB_SECONDS = 2.0
+
+
+class WordCloudRenderError(Exception):
+    """ワーカー内で生成に失敗した（ワーカー自体は継続して使える）"""
+
+
+class WorkerCrashedError(RuntimeError):
+    """生成中にワーカープロセスが終了した"""
+
+
+def _render_job(generator, job: dict):
+    """ジョブを実行（frequencies があれば集計済みの頻度から描画）"""
+    if "frequencies" in job:
+        return generator.generate_wordcloud_from_frequencies(**job)
+    return generator.generate_wordcloud_image(**job)
+
+
+def _worker_main(conn) -> None:
+    """ワーカープロセスの本体"""
+    # Ctrl+C は親プロセスが受けて終了処理を行う
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # spawn で起動したプロセスはログ設定を引き継がないため、ワーカー用のログファイルに出力する
+    from logging_config import setup_logging
+    setup_logging(log_name="wordcloud_worker.log")
+
+    from wc_model import WordCloudGenerator
+
+    generator = WordCloudGenerator()
+    # フォント・WordCloud の初回読み込みを済ませておく（形態素解析は使う時まで読み込まない）
+    generator.generate_wordcloud_from_frequencies({"準備完了": 1}, width=400, height=200)
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return  # 親プロセスが終了した
+        if job is None:
+            return
+
+        try:
+            img_io = _render_job(generator, job)
+            conn.send(("ok", img_io.getvalue(), dict(generator.timings)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", {}))
+
+
+class WordCloudWorker:
+    """ワーカープロセス1つ（親プロセス側のハンドル）"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn,), daemon=True, name="wordcloud-worker"
+        )
+        self.process.start()
+        child_conn.close()  # 子プロセスが終了したら recv が EOFError になるようにする
+
+    @property
+    def pid(self) -> int | None:
+        return self.process.pid
+
+    def wait_ready(self, timeout: float) -> None:
+        """
+        準備完了の通知を待つ（スレッドで実行）
+
+        Raises:
+            TimeoutError: 時間内に準備できなかった場合
+            EOFError: 準備中にプロセスが終了した場合
+        """
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"ワーカーが{timeout:.0f}秒以内に準備できませんでした")
+        self.conn.recv()
+
+    def run(self, job: dict) -> tuple[bytes, dict[str, float]]:
+        """
+        1ジョブを実行（スレッドで実行）
+
+        Returns:
+            tuple: (PNG画像, 各段階の所要時間)
+
+        Raises:
+            WordCloudRenderError: 生成に失敗した場合
+            WorkerCrashedError: 実行中にプロセスが終了した場合
+        """
+        try:
+            self.conn.send(job)
+            status, payload, timings = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise WorkerCrashedError(f"ワードクラウドワーカーが終了しました (pid={self.pid})") from e
+        if status == "error":
+            raise WordCloudRenderError(payload)
+        return payload, timings
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """終了を依頼し、応答がなければ強制終了"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self) -> None:
+        """強制終了（実行中のジョブは破棄される）"""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(5)
+
+
+class WordCloudPool:
+    """
+    ワードクラウド生成のプロセスプール
+
+    - 空きワーカーは asyncio.Queue で受け渡し、待機中のジョブ数が上限なら QueueFullError
+    - 待ち時間を含めて timeout 秒を超えたら TimeoutError
+    - タイムアウト・キャンセル（クライアント切断）・異常終了したワーカーは強制終了し、
+      バックグラウンドで新しいワーカーを起動する
+    """
+
+    def __init__(
+        self,
+        workers: int = WORDCLOUD_WORKERS,
+        queue_size: int = WORDCLOUD_QUEUE_SIZE,
+        timeout: float = WORDCLOUD_TIMEOUT,
+    ):
+        self.size = max(1, workers)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # 親プロセスの状態（イベントループ・スレッド）を引き継がないよう spawn で起動する
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: asyncio.Queue | None = None
+        self._workers: set[WordCloudWorker] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._waiting = 0
+        self._closed = False
+
+        self.stats = {
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "restarts": 0,
+        }
+
+    # ===== ワーカーの管理 =====
+    def start(self) -> None:
+        """ワーカーの起動をバックグラウンドで開始（イベントループ上で呼ぶ）"""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._background(self._spawn())
+        logger.info(f"🎨 ワードクラウドワーカーを起動中: {self.size}プロセス")
+
+    def _background(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _spawn(self) -> None:
+        """ワーカーを1つ起動し、準備できたら空きワーカーに加える（失敗時は再試行）"""
+        while not self._closed:
+            worker = None
+            try:
+                worker = await asyncio.to_thread(WordCloudWorker, self._context)
+                await asyncio.to_thread(worker.wait_ready, WORDCLOUD_WORKER_START_TIMEOUT)
+            except Exception as e:
+                logger.error(f"❌ ワードクラウドワーカーの起動失敗: {e}")
+                if worker is not None:
+                    await asyncio.to_thread(worker.kill)
+                await asyncio.sleep(WORDCLOUD_WORKER_RESTART_BACKOFF)
+                continue
+
+            if self._closed:
+                await asyncio.to_thread(worker.stop)
+                return
+            self._workers.add(worker)
+            self._idle.put_nowait(worker)
+            logger.info(f"✅ ワードクラウドワーカー準備完了 (pid={worker.pid})")
+            return
+
+    def _recycle(self, worker: WordCloudWorker) -> None:
+        """ワーカーを強制終了して新しいワーカーに入れ替える"""
+        self._workers.discard(worker)
+        self.stats["restarts"] += 1
+
+        async def replace():
+            await asyncio.to_thread(worker.kill)
+            await self._spawn()
+
+        self._background(replace())
+
+    async def close(self) -> None:
+        """全ワーカーを終了"""
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        workers, self._workers = list(self._workers), set()
+        await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in workers), return_exceptions=True)
+
+    # ===== 公開API =====
+    def _retry_after(self) -> int:
+        return max(1, int((self._waiting / self.size + 1) * _ESTIMATED_JOB_SECONDS))
+
+    async def _acquire(self) -> WordCloudWorker:
+        """空きワーカーを取得（キャンセル時に取得済みのワーカーを失わないよう wait_for は使わない）"""
+        getter = asyncio.ensure_future(self._idle.get())
+        try:
+            await asyncio.wait({getter}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            if getter.done() and not getter.cancelled():
+                self._idle.put_nowait(getter.result())
+            else:
+                getter.cancel()
+            raise
+        if not getter.done():
+            getter.cancel()
+            raise TimeoutError("ワードクラウドの空きワーカー待ちがタイムアウトしました")
+        return getter.result()
+
+    async def render(self, **job) -> bytes:
+        """
+        ワードクラウド画像を生成
+
+        Args:
+            **job: WordCloudGenerator.generate_wordcloud_image の引数
+                   （words の代わりに frequencies を渡すと generate_wordcloud_from_frequencies）
+
+        Returns:
+            bytes: PNG画像
+
+        Raises:
+            QueueFullError: 待機中のジョブが上限に達している場合
+            TimeoutError: 待ち時間を含めて timeout 秒を超えた場合
+            WordCloudRenderError: 生成に失敗した場合
+            WorkerCrashedError: 生成中にワーカーが異常終了した場合
+            asyncio.CancelledError: キャンセルされた場合（実行中のワーカーは入れ替える）
+        """
+        if self._idle is None:
+            self.start()
+        if self._waiting >= self.queue_size:
+            self.stats["rejected"] += 1
+            raise QueueFullError("ワードクラウドの待機キューが満杯です", retry_after=self._retry_after())
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        self._waiting += 1
+        try:
+            worker = await self._acquire()
+        except TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        try:
+            png, timings = await asyncio.wait_for(
+                loop.run_in_executor(None, worker.run, job),
+                timeout=max(0.0, deadline - loop.time()),
+            )
+        except TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"⏱️ ワードクラウド生成がタイムアウトしたためワーカーを入れ替えます (pid={worker.pid})")
+            self._recycle(worker)
+            raise TimeoutError("ワードクラウド生成がタイムアウトしました") from None
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            self._recycle(worker)
+            raise
+        except WordCloudRenderError:
+            self.stats["failed"] += 1
+            self._idle.put_nowait(worker)
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            self._recycle(worker)
+            raise
+
+        self._idle.put_nowait(worker)
+        for phase, seconds in timings.items():
+            metrics.WORDCLOUD_PHASE.observe(seconds, phase=phase)
+        self.stats["completed"] += 1
+        return png
+
+    def get_stats(self) -> dict:
+        """
+        プールの統計を取得
+
+        Returns:
+            dict: ワーカー数・空き数・待機数・完了/失敗数など
+        """
+        return dict(
+            self.stats,
+            workers=len(self._workers),
+            idle=self._idle.qsize() if self._idle is not None else 0,
+            waiting=self._waiting,
+            queue_size=self.queue_size,
+        )
+
+
+# =========================
+# プールを使わない場合（スレッドで生成）
+# =========================
+_generator = None
+_generator_lock = Lock()
+
+
+def _render_in_thread(job: dict) -> bytes:
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            from wc_model import WordCloudGenerator
+            _generator = WordCloudGenerator()
+        return _render_job(_generator, job).getvalue()
+
+
+async def render_wordcloud(**job) -> bytes:
+    """
+    ワードクラウド画像を生成（プールが無効な場合はスレッドで実行）
+
+    Args:
+        **job: WordCloudGenerator.generate_wordcloud_image の引数
+
+    Returns:
+        bytes: PNG画像
+    """
+    if wordcloud_pool is not None:
+        return await wordcloud_pool.render(**job)
+    return await asyncio.wait_for(asyncio.to_thread(_render_in_thread, job), timeout=WORDCLOUD_TIMEOUT)
+
+
+# グローバルインスタンス
+wordcloud_pool = WordCloudPool() if WORDCLOUD_POOL_ENABLED else None
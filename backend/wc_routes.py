@@ -3,90 +3,162 @@
 # # 変更点: session.execute() + scalars()を使用
 # # ========================================
 import json
+import logging
+from datetime import datetime, time
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import Response
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+import metrics
+from ai_routes import CLIENT_CLOSED_REQUEST, ClientDisconnected, run_until_disconnected, too_many_requests
 from database import get_db
 from models import Conversation
-from wc_model import WordCloudGenerator
+from scheduler import QueueFullError
+from singleflight import SingleFlight
+from wc_aggregates import query_frequencies, since_day
+from wc_cache import data_version, etag_matches, make_etag, make_render_key, wordcloud_cache
+from wc_pool import render_wordcloud
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-generator = WordCloudGenerator()
 
+# 同じ画像の同時リクエストは1回の描画にまとめる
+_render_flight = SingleFlight("wordcloud")
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    """ETag 付きの検証用ヘッダー（クライアントは毎回 If-None-Match で確認する）"""
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def png_response(png: bytes, etag: str | None = None) -> Response:
+    """ワードクラウド画像のレスポンス"""
+    headers = {"Content-Disposition": "inline; filename=wordcloud_minus_words.png"}
+    headers.update(cache_headers(etag) if etag else {"Cache-Control": "no-cache"})
+    return Response(content=png, media_type="image/png", headers=headers)
+
+
+def fetch_minus_words(db: Session, user_id: int | None, limit: int, days: int | None) -> list[str]:
+    """直近の会話のマイナスワード（limit 指定時。集計テーブルを使わない）"""
+    # クエリ構築
+    stmt = select(Conversation.ai_response_words).filter(
+        Conversation.ai_response_words.isnot(None)
+    )
+
+    # user_idが指定されていれば絞り込み
+    if user_id is not None:
+        stmt = stmt.filter(Conversation.user_id == user_id)
+
+    stmt = stmt.order_by(Conversation.created_at.desc())
+
+    if days is not None:
+        # created_at はUTC（集計テーブルと同じ日の区切り）
+        stmt = stmt.filter(Conversation.created_at >= datetime.combine(since_day(days), time.min))
 
-@router.post("/wordcloud/generate")
+    # 件数制限
+    if limit > 0:
+        stmt = stmt.limit(limit)
+
+    results = db.execute(stmt).scalars().all()
+
+    # JSON配列をパース
+    all_minus_words = []
+    for value in results:
+        if value:
+            try:
+                words_list = json.loads(value)
+                if isinstance(words_list, list):
+                    all_minus_words.extend(words_list)
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠️ マイナスワードのJSONを解析できません: {e}, value: {value}")
+                continue
+
+    logger.debug(f"📝 集計したマイナスワード: {all_minus_words}")
+    return all_minus_words
+
+
+@router.api_route("/wordcloud/generate", methods=["GET", "POST"])
 async def generate_wordcloud(
+    request: Request,
     user_id: int | None = Query(None, description="ユーザーID（指定しない場合は全ユーザー）"),
-    limit: int | None = Query(None, description="取得件数の上限"),
+    limit: int | None = Query(None, description="取得件数の上限（指定時は直近の会話から集計し直す）"),
+    days: int | None = Query(None, ge=1, description="直近何日分か（指定しない場合は全期間）"),
     width: int = Query(800, ge=400, le=2000, description="画像幅"),
     height: int = Query(400, ge=200, le=1000, description="画像高さ"),
     colormap: str = Query('Reds', description="カラーマップ"),
+    if_none_match: str | None = Header(None),
     db: Session = Depends(get_db)
 ):
-    """minus_wordsからワードクラウド画像を生成"""
+    """
+    minus_wordsからワードクラウド画像を生成
+
+    元データ（会話）が変わっていなければ描画せず、If-None-Match が一致すれば 304、
+    それ以外はキャッシュした画像を返す。
+    """
+
+    # 上限なし（0 以下）は未指定と同じく集計テーブルから描画する（キャッシュのキーも揃える）
+    if limit is not None and limit <= 0:
+        limit = None
 
     try:
-        # クエリ構築
-        stmt = select(Conversation.ai_response_words).filter(
-            Conversation.ai_response_words.isnot(None)
-        )
-
-        # user_idが指定されていれば絞り込み
-        if user_id is not None:
-            stmt = stmt.filter(Conversation.user_id == user_id)
-
-        stmt = stmt.order_by(Conversation.created_at.desc())
-
-        # 件数制限
-        if limit is not None and limit > 0:
-            stmt = stmt.limit(limit)
-
-        results = db.execute(stmt).scalars().all()
-
-        # JSON配列をパース
-        all_minus_words = []
-        for value in results:
-            if value:
-                try:
-                    words_list = json.loads(value)
-                    if isinstance(words_list, list):
-                        all_minus_words.extend(words_list)
-                except json.JSONDecodeError as e:
-                    print(f"[WARNING] JSON decode error: {e}, value: {value}")
-                    continue
-
-        print(f"[DEBUG] All minus words: {all_minus_words}")
-
-        if not all_minus_words:
+        # 元データの版から画像のキーを決める（会話が追加されるとキーが変わる）
+        with metrics.WORDCLOUD_PHASE.time(phase="version"):
+            version = data_version(db, user_id, limit, days)
+        params = {"user_id": user_id, "limit": limit, "days": days,
+                  "width": width, "height": height, "colormap": colormap}
+        key = make_render_key(params, version)
+        etag = make_etag(key)
+
+        if etag_matches(if_none_match, etag):
+            if wordcloud_cache is not None:
+                wordcloud_cache.record_not_modified()
+            return Response(status_code=304, headers=cache_headers(etag))
+
+        if wordcloud_cache is not None:
+            cached = await wordcloud_cache.get(key)
+            if cached is not None:
+                return png_response(cached, etag)
+
+        with metrics.WORDCLOUD_PHASE.time(phase="db_fetch"):
+            if limit is None:
+                # 保存時に集計済みの単語の出現数から描画（形態素解析しない）
+                job = {"frequencies": query_frequencies(db, user_id=user_id, days=days)}
+                found = bool(job["frequencies"])
+            else:
+                job = {"words": fetch_minus_words(db, user_id, limit, days)}
+                found = bool(job["words"])
+
+        if not found:
             raise HTTPException(status_code=404, detail="マイナスワードが見つかりません")
 
-        # ワードクラウド画像生成
-        img_io = generator.generate_wordcloud_image(
-            words=all_minus_words,
-            width=width,
-            height=height,
-            colormap=colormap
-        )
-
-        return StreamingResponse(
-            img_io,
-            media_type="image/png",
-            headers={
-                "Content-Disposition": "inline; filename=wordcloud_minus_words.png",
-                "Cache-Control": "no-cache"
-            }
-        )
+        job.update(width=width, height=height, colormap=colormap)
+
+        async def render_and_store():
+            png = await render_wordcloud(**job)
+            if wordcloud_cache is not None:
+                await wordcloud_cache.put(key, png)
+            return png
+
+        # ワードクラウド画像生成（ワーカープロセスで実行し、切断されたら中止）
+        png = await run_until_disconnected(request, _render_flight.do(key, render_and_store))
+
+        return png_response(png, etag)
 
     except HTTPException:
         raise
+    except QueueFullError as e:
+        raise too_many_requests(e.retry_after) from e
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail="ワードクラウド生成がタイムアウトしました") from e
+    except ClientDisconnected:
+        logger.info("🔌 クライアントが切断したためワードクラウド生成を中止しました")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
-        print(f"[ERROR] Wordcloud generation error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ ワードクラウド生成エラー: {e}")
         raise HTTPException(status_code=500, detail=f"ワードクラウド生成エラー: {e}") from e
 
 
@@ -95,11 +167,11 @@ async def test_wordcloud():
     """テスト用エンドポイント"""
     test_words = ["ダメ", "無理", "できない", "辛い", "疲れた", "嫌だ"]
 
-    img_io = generator.generate_wordcloud_image(
+    png = await render_wordcloud(
         words=test_words,
         width=800,
         height=400,
         colormap='Reds'
     )
 
-    return StreamingResponse(img_io, media_type="image/png")
+    return Response(content=png, media_type="image/png")
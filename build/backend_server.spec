@@ -62,6 +62,9 @@ additional_hiddenimports = [
     'PIL.ImageDraw',
     'PIL.ImageFont',
     
+    # 複数ワーカー起動時に uvicorn が "main:app" として読み込む
+    'main',
+    
     # その他
     'starlette',
     'starlette.routing',
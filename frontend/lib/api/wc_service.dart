@@ -2,10 +2,24 @@ import 'dart:typed_data';
 import 'package:http/http.dart' as http;
 import 'api_settings.dart';
 
+/// 条件付きリクエスト用に保持する画像とETag
+class _CachedWordCloud {
+  final String etag;
+  final Uint8List bytes;
+
+  const _CachedWordCloud(this.etag, this.bytes);
+}
+
 class WordCloudService {
   final String baseUrl = ApiSettings.baseUrl;
 
+  // 画面を開き直しても、データが変わっていなければ再描画させない（URLごと）
+  static final Map<String, _CachedWordCloud> _cache = {};
+
   /// ワードクラウド画像を生成して取得（認証必須）
+  ///
+  /// 前回取得した画像があれば If-None-Match で確認し、
+  /// 304（変更なし）の場合は保持している画像を返す。
   Future<Uint8List> generateWordCloud({
     int? limit,
     int width = 800,
@@ -27,13 +41,26 @@ class WordCloudService {
       ApiSettings.wordcloudEndpoint,
     ).replace(queryParameters: queryParams);
 
-    final response = await http.post(
+    final cacheKey = uri.toString();
+    final cached = _cache[cacheKey];
+
+    final response = await http.get(
       uri,
+      headers: {
+        if (cached != null) 'If-None-Match': cached.etag,
+      },
     );
 
-    if (response.statusCode == 200) {
+    if (response.statusCode == 304 && cached != null) {
+      return cached.bytes;
+    } else if (response.statusCode == 200) {
+      final etag = response.headers['etag'];
+      if (etag != null) {
+        _cache[cacheKey] = _CachedWordCloud(etag, response.bodyBytes);
+      }
       return response.bodyBytes;
     } else if (response.statusCode == 404) {
+      _cache.remove(cacheKey);
       throw Exception('会話履歴が見つかりません');
     } else {
       throw Exception('ワードクラウドの生成に失敗しました: ${response.statusCode}');
@@ -18,6 +18,7 @@ class _SplashPageState extends State<SplashPage> {
   bool _hasError = false;
   int _currentRetry = 0;
   static const int _maxRetries = 30; // 30秒
+  double? _modelProgress; // バックエンド接続後のモデル読み込み進捗（0.0〜1.0）
 
   @override
   void initState() {
@@ -26,13 +27,17 @@ class _SplashPageState extends State<SplashPage> {
   }
 
   Future<void> _initializeApp() async {
-    for (int i = 0; i < _maxRetries; i++) {
+    // 接続失敗の回数のみ数える（モデル読み込み中は待ち続ける）
+    int i = 0;
+    while (i < _maxRetries) {
       if (!mounted) return;
       
-      setState(() {
-        _currentRetry = i + 1;
-        _statusMessage = 'バックエンドに接続中... ($_currentRetry/$_maxRetries)';
-      });
+      if (_modelProgress == null) {
+        setState(() {
+          _currentRetry = i + 1;
+          _statusMessage = 'バックエンドに接続中... ($_currentRetry/$_maxRetries)';
+        });
+      }
       
       try {
         final response = await http
@@ -57,13 +62,32 @@ class _SplashPageState extends State<SplashPage> {
               Navigator.pushReplacementNamed(context, '/register');
             }
             return;
+          } else if (data['model_state'] == 'failed') {
+            // モデルの読み込みに失敗（待っても回復しない）
+            if (!mounted) return;
+            
+            setState(() {
+              _hasError = true;
+              _statusMessage = '❌ AIモデルの読み込みに失敗しました';
+            });
+            debugPrint('モデル読み込み失敗: ${data['model_error']}');
+            return;
           } else {
             // サーバーは起動したがモデルはまだ読み込み中
             if (!mounted) return;
             
+            final progress = (data['model_progress'] as num?)?.toDouble() ?? 0.0;
+            final message = data['model_state'] == 'warming'
+                ? 'AIモデルを準備中...'
+                : 'モデルを読み込み中...';
+            
             setState(() {
-              _statusMessage = 'モデルを読み込み中...';
+              _modelProgress = progress;
+              _statusMessage = '$message (${(progress * 100).round()}%)';
             });
+            
+            await Future.delayed(const Duration(seconds: 1));
+            continue;
           }
         }
       } on TimeoutException catch (_) {
@@ -73,6 +97,8 @@ class _SplashPageState extends State<SplashPage> {
         debugPrint('接続試行 ${i + 1}: $e');
       }
       
+      i++;
+      
       // 1秒待機
       await Future.delayed(const Duration(seconds: 1));
     }
@@ -90,6 +116,7 @@ class _SplashPageState extends State<SplashPage> {
     setState(() {
       _hasError = false;
       _currentRetry = 0;
+      _modelProgress = null;
       _statusMessage = '再試行中...';
     });
     _initializeApp();
@@ -150,7 +177,7 @@ class _SplashPageState extends State<SplashPage> {
                 SizedBox(
                   width: 300,
                   child: LinearProgressIndicator(
-                    value: _currentRetry / _maxRetries,
+                    value: _modelProgress ?? _currentRetry / _maxRetries,
                   ),
                 ),
               ],